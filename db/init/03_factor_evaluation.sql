@@ -0,0 +1,26 @@
+-- ============================================================
+-- Factor Evaluation Results
+-- ============================================================
+
+-- One row per factor x forward-return horizon; the horizons of a factor
+-- together form its IC decay curve. Written by etl/factor_eval.py.
+CREATE TABLE IF NOT EXISTS factors.evaluation (
+    factor_name TEXT NOT NULL,
+    horizon INT NOT NULL,
+    start_date DATE,
+    end_date DATE,
+    n_dates INT,
+    ic_mean DOUBLE PRECISION,
+    ic_std DOUBLE PRECISION,
+    icir DOUBLE PRECISION,
+    ic_tstat DOUBLE PRECISION,
+    rank_ic_mean DOUBLE PRECISION,
+    rank_ic_std DOUBLE PRECISION,
+    rank_icir DOUBLE PRECISION,
+    quantile_returns JSONB,
+    long_short DOUBLE PRECISION,
+    turnover DOUBLE PRECISION,
+    rank_autocorr DOUBLE PRECISION,
+    evaluated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (factor_name, horizon)
+);
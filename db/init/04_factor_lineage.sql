@@ -0,0 +1,28 @@
+-- ============================================================
+-- Factor Lineage / Incremental Recompute State
+-- ============================================================
+
+-- Inputs each factor read on its last successful run (recorded by the
+-- factor namespace) plus any DEPENDS_ON declared in the script.
+--   source_kind = 'processed': source_name is a processed table, or
+--                 'feature_series/<target_type>/<transform_method>'
+--   source_kind = 'factor':    source_name is another factor_name
+CREATE TABLE IF NOT EXISTS factors.dependencies (
+    factor_name TEXT NOT NULL,
+    source_kind TEXT NOT NULL CHECK (source_kind IN ('processed', 'factor')),
+    source_name TEXT NOT NULL,
+    recorded_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (factor_name, source_kind, source_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_factors_dependencies_source
+    ON factors.dependencies (source_kind, source_name);
+
+-- Last successful computation of each factor and the input watermarks
+-- ({"<kind>:<name>": {"max_date": ..., "version": ...}}) it saw.
+CREATE TABLE IF NOT EXISTS factors.compute_state (
+    factor_name TEXT PRIMARY KEY,
+    computed_through DATE,
+    input_watermarks JSONB,
+    computed_at TIMESTAMP DEFAULT NOW()
+);
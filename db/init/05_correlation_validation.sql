@@ -0,0 +1,40 @@
+-- ============================================================
+-- Correlation Mapping Validation
+-- ============================================================
+
+-- One row per meta.correlation_mappings entry, written by
+-- etl/correlation_validator.py. correlation / beta / p_value are measured
+-- at the expected lag parsed from expected_relationship (lag > 0: the
+-- indicator leads the asset by that many periods of `freq`);
+-- lag_profile holds {"<lag>": {"corr", "p", "n"}} for every tested lag.
+CREATE TABLE IF NOT EXISTS meta.correlation_validation (
+    mapping_id INT PRIMARY KEY REFERENCES meta.correlation_mappings(id) ON DELETE CASCADE,
+    freq TEXT NOT NULL,                 -- 'M' | 'W' | 'D'
+    window_periods INT NOT NULL,        -- rolling window of meta.correlation_rolling
+    model TEXT NOT NULL,                -- 'pearson' | 'spearman'
+    expected_sign SMALLINT,             -- 1 / -1, NULL when no direction is stated
+    expected_lag INT NOT NULL DEFAULT 0,
+    n_obs INT,
+    correlation DOUBLE PRECISION,
+    beta DOUBLE PRECISION,              -- OLS slope of asset return on indicator
+    p_value DOUBLE PRECISION,
+    best_lag INT,                       -- lag with the largest |correlation|
+    best_correlation DOUBLE PRECISION,
+    best_p_value DOUBLE PRECISION,
+    sign_stability DOUBLE PRECISION,    -- share of rolling windows with the expected sign
+    consistent BOOLEAN,                 -- expected sign and p_value below the test level
+    lag_profile JSONB,
+    computed_through DATE,              -- last period of the rolling series
+    computed_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Rolling statistics at the expected lag, one row per mapping x period end.
+CREATE TABLE IF NOT EXISTS meta.correlation_rolling (
+    mapping_id INT NOT NULL REFERENCES meta.correlation_mappings(id) ON DELETE CASCADE,
+    obs_date DATE NOT NULL,
+    n_obs INT,
+    correlation DOUBLE PRECISION,
+    beta DOUBLE PRECISION,
+    p_value DOUBLE PRECISION,
+    PRIMARY KEY (mapping_id, obs_date)
+);
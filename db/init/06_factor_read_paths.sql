@@ -0,0 +1,15 @@
+-- ============================================================
+-- Factor Read Paths
+-- ============================================================
+
+-- Keyset pagination of one factor's values in (trade_date, asset_code)
+-- order (etl/factor_query.py --limit / --after): the row comparison
+-- (trade_date, asset_code COLLATE "C") > (cursor) becomes an index range
+-- scan, and INCLUDE (value) lets pages be served by index-only scans.
+-- asset_code is ordered by "C" (byte order), the order the Parquet mirror
+-- sorts by, so pages from either source line up whatever the database
+-- collation. Databases created before this replace the old default-collation
+-- index.
+DROP INDEX IF EXISTS factors.idx_factors_asset_values_keyset;
+CREATE INDEX IF NOT EXISTS idx_factors_asset_values_keyset_c
+    ON factors.asset_values (factor_name, trade_date, asset_code COLLATE "C") INCLUDE (value);
@@ -0,0 +1,18 @@
+-- ============================================================
+-- Wind Query Template Runs
+-- ============================================================
+
+-- One row per meta.wind_query_templates entry, written by
+-- etl/template_scheduler.py. last_target_date is the period-end trading day
+-- of the last successful run (a template is due when the latest completed
+-- period of its update_frequency ends after it); last_data_date is the last
+-- date Wind actually returned data for, where the next fetch starts.
+CREATE TABLE IF NOT EXISTS meta.template_runs (
+    template_id INT PRIMARY KEY REFERENCES meta.wind_query_templates(id) ON DELETE CASCADE,
+    last_target_date DATE,
+    last_data_date DATE,
+    rows_written INT,
+    status TEXT,                        -- 'ok' | 'error'
+    error TEXT,
+    last_run_at TIMESTAMP DEFAULT NOW()
+);
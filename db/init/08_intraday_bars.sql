@@ -0,0 +1,61 @@
+-- ============================================================
+-- Intraday Bars
+-- ============================================================
+
+-- Minute-level OHLCV bars per asset. freq is the bar size ('1m', '5m', ...);
+-- rows are written by src/python/quote_service.py --bars (live '1m' bars
+-- built from wsq pushes) and by batch loaders. bar_time is the bar's start
+-- in exchange local time; volume / amount are the bar's own turnover.
+-- Range-partitioned by month on bar_time (raw.intraday_bars_YYYYMM,
+-- created on demand by the writers via base.ensure_month_partitions).
+--
+-- Databases created before the table was partitioned still hold a plain
+-- raw.intraday_bars, which CREATE TABLE IF NOT EXISTS would leave alone. It is
+-- renamed out of the way here, its rows are copied into month partitions of
+-- the new table below, and it is dropped once copied.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+               WHERE n.nspname = 'raw' AND c.relname = 'intraday_bars' AND c.relkind = 'r') THEN
+        ALTER TABLE raw.intraday_bars RENAME TO intraday_bars_unpartitioned;
+        -- the primary key index name is taken by the new table's otherwise
+        IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'intraday_bars_pkey'
+                   AND conrelid = 'raw.intraday_bars_unpartitioned'::regclass) THEN
+            ALTER TABLE raw.intraday_bars_unpartitioned
+                RENAME CONSTRAINT intraday_bars_pkey TO intraday_bars_unpartitioned_pkey;
+        END IF;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS raw.intraday_bars (
+    asset_id INT NOT NULL REFERENCES meta.assets(id),
+    freq TEXT NOT NULL,
+    bar_time TIMESTAMP NOT NULL,
+    open DOUBLE PRECISION,
+    high DOUBLE PRECISION,
+    low DOUBLE PRECISION,
+    close DOUBLE PRECISION,
+    volume DOUBLE PRECISION,
+    amount DOUBLE PRECISION,
+    PRIMARY KEY (asset_id, freq, bar_time)
+) PARTITION BY RANGE (bar_time);
+
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    IF to_regclass('raw.intraday_bars_unpartitioned') IS NOT NULL THEN
+        FOR m IN SELECT DISTINCT date_trunc('month', bar_time)::date
+                 FROM raw.intraday_bars_unpartitioned LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS raw.%I PARTITION OF raw.intraday_bars FOR VALUES FROM (%L) TO (%L)',
+                'intraday_bars_' || to_char(m, 'YYYYMM'), m, (m + INTERVAL '1 month')::date
+            );
+        END LOOP;
+        INSERT INTO raw.intraday_bars (asset_id, freq, bar_time, open, high, low, close, volume, amount)
+        SELECT asset_id, freq, bar_time, open, high, low, close, volume, amount
+        FROM raw.intraday_bars_unpartitioned
+        ON CONFLICT DO NOTHING;
+        DROP TABLE raw.intraday_bars_unpartitioned;
+    END IF;
+END $$;
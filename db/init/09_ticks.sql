@@ -0,0 +1,33 @@
+-- ============================================================
+-- Tick Store
+-- ============================================================
+
+-- Intraday ticks from Wind wst, written by etl/load_ticks.py. The table is
+-- range-partitioned by month on tick_time (raw.ticks_YYYYMM, created by the
+-- loader on demand), so a month of ticks can be detached / dropped or
+-- scanned on its own. volume / amount are as delivered by wst.
+CREATE TABLE IF NOT EXISTS raw.ticks (
+    asset_id INT NOT NULL REFERENCES meta.assets(id),
+    tick_time TIMESTAMP(3) NOT NULL,
+    last DOUBLE PRECISION,
+    volume DOUBLE PRECISION,
+    amount DOUBLE PRECISION,
+    bid1 DOUBLE PRECISION,
+    ask1 DOUBLE PRECISION,
+    bid_size1 DOUBLE PRECISION,
+    ask_size1 DOUBLE PRECISION,
+    PRIMARY KEY (asset_id, tick_time)
+) PARTITION BY RANGE (tick_time);
+
+-- Per-asset loaded range: ticks in [fetched_from, fetched_through] have been
+-- loaded (including empty stretches such as the midday break). The loader
+-- keeps the range contiguous: later runs extend fetched_through forward and
+-- backfills with an earlier --start move fetched_from back.
+CREATE TABLE IF NOT EXISTS raw.tick_watermarks (
+    asset_id INT PRIMARY KEY REFERENCES meta.assets(id),
+    fetched_from TIMESTAMP(3),
+    fetched_through TIMESTAMP(3) NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE raw.tick_watermarks ADD COLUMN IF NOT EXISTS fetched_from TIMESTAMP(3);
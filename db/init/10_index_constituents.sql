@@ -0,0 +1,31 @@
+-- ============================================================
+-- Index Constituents (point-in-time)
+-- ============================================================
+
+-- Index membership as effective-dated intervals, written by
+-- etl/load_constituents.py from Wind wset. A code is a member of index_code
+-- on date d when in_date <= d AND (out_date IS NULL OR d < out_date), i.e.
+-- out_date is the first day it is no longer a member. in_date is the first
+-- known membership day: for names already in the index when loading started
+-- it is the load start date, not the original inclusion date.
+CREATE TABLE IF NOT EXISTS meta.index_constituents (
+    index_code TEXT NOT NULL,
+    asset_code TEXT NOT NULL,
+    in_date DATE NOT NULL,
+    out_date DATE,
+    PRIMARY KEY (index_code, asset_code, in_date),
+    CHECK (out_date IS NULL OR out_date > in_date)
+);
+
+-- As-of lookups scan one index's intervals by start date; covering columns
+-- let many dates be resolved from the index alone.
+CREATE INDEX IF NOT EXISTS idx_index_constituents_asof
+    ON meta.index_constituents (index_code, in_date) INCLUDE (out_date, asset_code);
+
+-- Per-index resume point: membership changes up to loaded_through are stored.
+CREATE TABLE IF NOT EXISTS meta.index_constituent_watermarks (
+    index_code TEXT PRIMARY KEY,
+    start_date DATE NOT NULL,
+    loaded_through DATE NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
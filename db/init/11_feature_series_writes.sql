@@ -0,0 +1,22 @@
+-- ============================================================
+-- Feature Series Write Log
+-- ============================================================
+
+-- One row per write of processed.feature_series by the ETL writers
+-- (etl/transforms.py, etl/run_clean_agent.py), per (target_type,
+-- transform_method) series. version increases by one per write of a series
+-- and is assigned under a per-series advisory lock, so versions become
+-- visible in commit order. Readers that cache a series (etl/panel.py, the
+-- lineage watermarks) compare the latest version with the one they saw;
+-- min_obs_date of the newer writes tells whether only dates after the
+-- cached range changed (append) or older rows were rewritten.
+CREATE TABLE IF NOT EXISTS processed.feature_series_writes (
+    target_type TEXT NOT NULL,
+    transform_method TEXT NOT NULL,
+    version BIGINT NOT NULL,
+    min_obs_date DATE,
+    max_obs_date DATE,
+    row_count BIGINT NOT NULL,
+    written_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (target_type, transform_method, version)
+);
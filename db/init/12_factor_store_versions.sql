@@ -0,0 +1,16 @@
+-- ============================================================
+-- Factor Store Versions
+-- ============================================================
+
+-- Write counter per factor of factors.asset_values. Every writer
+-- (save_factor_values, the factor_batch bulk write, including their
+-- replace_range deletes) bumps it via etl/factor_store.py bump_versions() in
+-- the same transaction as the write, so the version changes exactly when the
+-- factor's rows do. The Parquet mirror records the version it was built from
+-- in the factor's _manifest.json; is_fresh() compares only the version, a
+-- primary-key lookup instead of COUNT / MAX over factors.asset_values.
+CREATE TABLE IF NOT EXISTS factors.asset_value_versions (
+    factor_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,389 @@
+"""
+Vectorized backtest: factor -> weights -> equity curve (roadmap stage five).
+
+Inputs are a factor panel from factors.asset_values and close prices from
+raw.daily_prices on one date x asset grid. Every step is a matrix operation
+over the whole panel; the only Python loops run over a handful of
+weight-capping iterations, never over dates.
+
+Timeline per trading day t:
+  - rebalance days come from raw.trading_calendar (last trading day of each
+    week / month, or every day); the signal is the factor lagged by
+    `signal_lag` rows, so trades at the close of t never see data from t
+  - target weights are set at the close of a rebalance day and drift with
+    asset returns until the next one
+  - turnover = sum |target - drifted holdings| on rebalance days; costs
+    (cost_bps per unit traded) are charged on that day
+  - the portfolio earns sum(holdings(t-1) * return(t)) on day t
+
+Usage:
+    python etl/backtest.py --factor mom_20 --freq M --method quantile --cost-bps 10
+    python etl/backtest.py --factor mom_20 --sweep "freq=W,M;n_quantiles=5,10" --jobs 4
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from base import get_conn, put_conn
+from operators import cs_rank
+from panel import align, load_factor_panel, load_price_panel, load_universe_mask
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+
+
+@dataclass(frozen=True)
+class BacktestConfig:
+    freq: str = "M"                 # rebalance frequency: D / W / M
+    method: str = "quantile"        # quantile: equal weight top (and bottom) quantile; rank: rank-proportional
+    n_quantiles: int = 5
+    long_short: bool = False        # long +1 / short -1 when True, long-only fully invested otherwise
+    max_weight: float | None = None # per-asset cap on |weight| within each side
+    cost_bps: float = 10.0          # cost per unit of turnover, in basis points
+    signal_lag: int = 1             # rows between factor date and trade date
+
+
+class BacktestData(NamedTuple):
+    dates: np.ndarray               # datetime64[D]
+    codes: np.ndarray
+    returns: np.ndarray             # (n_dates, n_assets) simple returns, NaN where not traded
+    signal: np.ndarray              # factor on the same grid
+    rebalance: dict[str, np.ndarray]  # freq -> bool mask over dates
+
+
+# ── data ───────────────────────────────────────────────────
+
+def asset_returns(close: np.ndarray, adj_factor: np.ndarray | None = None) -> np.ndarray:
+    """Close-to-close returns; with adj_factor the price series is close * adj_factor."""
+    px = close if adj_factor is None else close * adj_factor
+    out = np.full(px.shape, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[1:] = px[1:] / px[:-1] - 1.0
+    return out
+
+
+def rebalance_mask(dates: np.ndarray, calendar: np.ndarray, freq: str) -> np.ndarray:
+    """
+    True on grid dates that are the last trading day of their period in the
+    trading calendar (so a missing price row never shifts the schedule).
+    """
+    freq = freq.upper()
+    if freq == "D":
+        return np.ones(len(dates), dtype=bool)
+    if freq not in ("W", "M"):
+        raise ValueError(f"Unknown rebalance frequency {freq!r}; use D, W or M")
+    cal = pd.DatetimeIndex(np.asarray(calendar, dtype="datetime64[ns]"))
+    period = cal.to_period("W-FRI" if freq == "W" else "M").asi8
+    is_end = np.append(period[1:] != period[:-1], True)
+    ends = cal[is_end].to_numpy(dtype="datetime64[D]")
+    return np.isin(dates, ends)
+
+
+def load_data(
+    conn,
+    factor_name: str,
+    start: str | None = None,
+    end: str | None = None,
+    freqs: tuple[str, ...] = ("D", "W", "M"),
+    universe: str | None = None,
+) -> BacktestData:
+    """
+    Prices, returns, the factor and rebalance masks on one grid. With
+    `universe` (an index code in meta.index_constituents) the signal is
+    blanked wherever the asset was not a member on that date, so only
+    point-in-time constituents are ever selected.
+    """
+    # raw.daily_prices is unadjusted; backward-adjusted close ratios are total returns
+    close, dates, codes = load_price_panel(conn, "close", start=start, end=end, adjust="backward")
+    returns = asset_returns(close)
+
+    fmat, fdates, fcodes = load_factor_panel(conn, factor_name, start, end)
+    signal = align(fmat, fdates, fcodes, dates, codes)
+    if universe:
+        member, _, _ = load_universe_mask(conn, universe, dates, codes)
+        signal = np.where(member, signal, np.nan)
+
+    with conn.cursor() as cur:
+        sql = "SELECT trade_date FROM raw.trading_calendar WHERE trade_date >= %s ORDER BY trade_date"
+        cur.execute(sql, (str(dates[0]) if len(dates) else "1900-01-01",))
+        calendar = np.array([r[0] for r in cur.fetchall()], dtype="datetime64[D]")
+    if len(calendar) == 0:
+        calendar = dates
+    rebalance = {f: rebalance_mask(dates, calendar, f) for f in freqs}
+    return BacktestData(dates, codes, returns, signal, rebalance)
+
+
+# ── weights ────────────────────────────────────────────────
+
+def cap_weights(w: np.ndarray, max_weight: float, iterations: int = 50) -> np.ndarray:
+    """
+    Cap non-negative row weights at max_weight, handing the excess to the
+    uncapped names pro rata. Rows that cannot be fully invested under the
+    cap keep the remainder in cash.
+    """
+    w = w.copy()
+    for _ in range(iterations):
+        over = w > max_weight * (1 + 1e-12)
+        if not over.any():
+            break
+        excess = np.where(over, w - max_weight, 0.0).sum(axis=1, keepdims=True)
+        w[over] = max_weight
+        free = (w > 0) & (w < max_weight)
+        free_sum = np.where(free, w, 0.0).sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            w = np.where(free & (free_sum > 0), w + w / free_sum * excess, w)
+    return w
+
+
+def _normalize(w: np.ndarray) -> np.ndarray:
+    total = w.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, w / total, 0.0)
+
+
+def target_weights(signal: np.ndarray, cfg: BacktestConfig) -> np.ndarray:
+    """Target weights for every row of `signal` (rows with no valid signal -> all zero)."""
+    pct = cs_rank(signal)                                   # (0, 1], NaN where missing
+    valid = ~np.isnan(pct)
+    if cfg.method == "quantile":
+        long = valid & (pct > 1.0 - 1.0 / cfg.n_quantiles)
+        short = valid & (pct <= 1.0 / cfg.n_quantiles)
+        long_w, short_w = long.astype(float), short.astype(float)
+    elif cfg.method == "rank":
+        if cfg.long_short:
+            n = valid.sum(axis=1, keepdims=True)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.where(valid, pct, 0.0).sum(axis=1, keepdims=True) / n
+            centred = np.where(valid, pct - mean, 0.0)
+            long_w, short_w = np.maximum(centred, 0.0), np.maximum(-centred, 0.0)
+        else:
+            long_w, short_w = np.where(valid, pct, 0.0), np.zeros_like(pct)
+    else:
+        raise ValueError(f"Unknown weighting method {cfg.method!r}; use quantile or rank")
+
+    long_w = _normalize(long_w)
+    if cfg.max_weight:
+        long_w = cap_weights(long_w, cfg.max_weight)
+    if not cfg.long_short:
+        return long_w
+    short_w = _normalize(short_w)
+    if cfg.max_weight:
+        short_w = cap_weights(short_w, cfg.max_weight)
+    return long_w - short_w
+
+
+# ── simulation ─────────────────────────────────────────────
+
+def simulate(returns: np.ndarray, targets: np.ndarray, rebalance: np.ndarray, cost_bps: float = 0.0) -> dict:
+    """
+    Drift-aware portfolio simulation without a date loop.
+
+    Within the segment that starts at rebalance row s, the value of position
+    i relative to NAV at s is W_s,i * G_t,i with G the asset's cumulative
+    growth since s, so holdings(t) = W_s * G_t / (1 + sum(W_s * (G_t - 1))).
+    Returns gross / net daily returns, turnover, costs and end-of-day holdings.
+    """
+    r = np.nan_to_num(returns, nan=0.0)
+    if not rebalance.any():
+        zeros = np.zeros(len(r))
+        return {"gross": zeros, "net": zeros, "turnover": zeros, "costs": zeros, "holdings": np.zeros_like(r)}
+    log_growth = np.cumsum(np.log1p(np.maximum(r, -0.999999)), axis=0)
+
+    seg = np.cumsum(rebalance) - 1                          # segment index per row, -1 before the first rebalance
+    reb_rows = np.flatnonzero(rebalance)
+    active = seg >= 0
+    start_row = np.where(active, reb_rows[np.maximum(seg, 0)], 0)
+
+    W = targets[reb_rows][np.maximum(seg, 0)]               # target of the current segment per row
+    G = np.exp(log_growth - log_growth[start_row])
+    value = W * G
+    nav_rel = 1.0 + (W * (G - 1.0)).sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        holdings = np.where(active[:, None], value / nav_rel, 0.0)
+
+    prev = np.vstack([np.zeros((1, r.shape[1])), holdings[:-1]])
+    gross = (prev * r).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drifted = prev * (1.0 + r) / (1.0 + gross)[:, None]
+    turnover = np.where(rebalance, np.abs(targets - drifted).sum(axis=1), 0.0)
+    costs = turnover * cost_bps / 1e4
+    return {
+        "gross": gross,
+        "net": gross - costs,
+        "turnover": turnover,
+        "costs": costs,
+        "holdings": holdings,
+    }
+
+
+def risk_stats(net: np.ndarray, turnover: np.ndarray) -> dict:
+    n = len(net)
+    if n == 0:
+        return {}
+    equity = np.cumprod(1.0 + net)
+    years = n / TRADING_DAYS
+    ann_ret = equity[-1] ** (1.0 / years) - 1.0 if equity[-1] > 0 else -1.0
+    ann_vol = float(np.std(net, ddof=1) * np.sqrt(TRADING_DAYS)) if n > 1 else float("nan")
+    drawdown = equity / np.maximum.accumulate(np.maximum(equity, 1.0)) - 1.0
+    max_dd = float(drawdown.min())
+    return {
+        "total_return":      float(equity[-1] - 1.0),
+        "annual_return":     float(ann_ret),
+        "annual_vol":        ann_vol,
+        "sharpe":            float(ann_ret / ann_vol) if ann_vol > 0 else float("nan"),
+        "max_drawdown":      max_dd,
+        "calmar":            float(ann_ret / -max_dd) if max_dd < 0 else float("nan"),
+        "annual_turnover":   float(turnover.sum() / years),
+        "hit_rate":          float((net > 0).mean()),
+        "n_days":            n,
+    }
+
+
+def run_backtest(data: BacktestData, cfg: BacktestConfig, targets: np.ndarray | None = None) -> dict:
+    """
+    Backtest one configuration on preloaded data -> {config, stats, equity}.
+    Precomputed targets (e.g. from optimizer.py) replace the config's
+    weighting method; only their rebalance rows are used.
+    """
+    if cfg.freq.upper() not in data.rebalance:
+        raise ValueError(f"rebalance mask for {cfg.freq} not loaded")
+    rebalance = data.rebalance[cfg.freq.upper()]
+    rows = np.flatnonzero(rebalance)
+    if targets is None:
+        signal = data.signal
+        if cfg.signal_lag > 0:
+            signal = np.vstack([np.full((cfg.signal_lag, signal.shape[1]), np.nan), signal[:-cfg.signal_lag]])
+        # only rows we trade on need weights; everything else is derived by drift
+        targets = np.zeros_like(signal)
+        targets[rows] = target_weights(signal[rows], cfg)
+    # a rebalance row with no valid signal is not a trade: carry the drifted book
+    has_signal = np.abs(targets[rows]).sum(axis=1) > 0
+    rebalance = rebalance.copy()
+    rebalance[rows[~has_signal]] = False
+
+    sim = simulate(data.returns, targets, rebalance, cfg.cost_bps)
+    first = rows[has_signal][0] + 1 if has_signal.any() else len(data.dates)
+    net, turnover = sim["net"][first:], sim["turnover"][first:]
+    return {
+        "config": asdict(cfg),
+        "stats": risk_stats(net, turnover),
+        "dates": data.dates[first:],
+        "equity": np.cumprod(1.0 + net),
+    }
+
+
+# ── parameter sweeps ───────────────────────────────────────
+
+_SWEEP_DATA: BacktestData | None = None
+
+
+def _init_sweep(data: BacktestData) -> None:
+    global _SWEEP_DATA
+    _SWEEP_DATA = data
+
+
+def _sweep_one(cfg: BacktestConfig) -> dict:
+    result = run_backtest(_SWEEP_DATA, cfg)
+    return {"config": result["config"], "stats": result["stats"]}
+
+
+def sweep(data: BacktestData, base: BacktestConfig, grid: dict[str, list], jobs: int = 4) -> list[dict]:
+    """
+    Run every combination of `grid` values over `base` in parallel processes.
+    With fork the panels are inherited copy-on-write, not pickled per task.
+    """
+    keys = list(grid)
+    configs = [replace(base, **dict(zip(keys, combo))) for combo in itertools.product(*(grid[k] for k in keys))]
+    if jobs <= 1 or len(configs) == 1:
+        _init_sweep(data)
+        return [_sweep_one(c) for c in configs]
+    ctx = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx, initializer=_init_sweep, initargs=(data,)) as pool:
+        return list(pool.map(_sweep_one, configs))
+
+
+def _parse_grid(text: str) -> dict[str, list]:
+    """'freq=W,M;n_quantiles=5,10' -> {'freq': ['W', 'M'], 'n_quantiles': [5, 10]} typed like BacktestConfig."""
+    defaults = asdict(BacktestConfig())
+    grid = {}
+    for part in filter(None, (p.strip() for p in text.split(";"))):
+        key, _, values = part.partition("=")
+        key = key.strip()
+        if key not in defaults:
+            raise ValueError(f"Unknown sweep parameter {key!r}; choose from {list(defaults)}")
+        kind = type(defaults[key]) if defaults[key] is not None else float
+        if kind is bool:
+            conv = lambda v: v.lower() in ("1", "true", "yes")     # noqa: E731
+        else:
+            conv = kind
+        grid[key] = [conv(v.strip()) for v in values.split(",") if v.strip()]
+    return grid
+
+
+def _clean(v):
+    if isinstance(v, float) and not np.isfinite(v):
+        return None
+    return v
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized factor backtest")
+    parser.add_argument("--factor", required=True)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--freq", default="M", choices=["D", "W", "M"])
+    parser.add_argument("--method", default="quantile", choices=["quantile", "rank"])
+    parser.add_argument("--quantiles", type=int, default=5)
+    parser.add_argument("--long-short", action="store_true")
+    parser.add_argument("--max-weight", type=float, default=None)
+    parser.add_argument("--cost-bps", type=float, default=10.0)
+    parser.add_argument("--signal-lag", type=int, default=1)
+    parser.add_argument("--universe", default=None, help="restrict to point-in-time members of this index, e.g. 000300.SH")
+    parser.add_argument("--sweep", default="", help='parameter grid, e.g. "freq=W,M;n_quantiles=5,10"')
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--equity-csv", default=None, help="write the equity curve of a single run to this file")
+    args = parser.parse_args()
+
+    base = BacktestConfig(
+        freq=args.freq, method=args.method, n_quantiles=args.quantiles, long_short=args.long_short,
+        max_weight=args.max_weight, cost_bps=args.cost_bps, signal_lag=args.signal_lag,
+    )
+    try:
+        conn = get_conn()
+        try:
+            data = load_data(conn, args.factor, args.start, args.end, universe=args.universe)
+        finally:
+            put_conn(conn)
+        logger.info(f"Loaded {len(data.dates)} dates x {len(data.codes)} assets for {args.factor}")
+
+        if args.sweep:
+            results = sweep(data, base, _parse_grid(args.sweep), args.jobs)
+        else:
+            result = run_backtest(data, base)
+            if args.equity_csv:
+                pd.DataFrame({"trade_date": result["dates"], "equity": result["equity"]}).to_csv(
+                    args.equity_csv, index=False)
+            results = [{"config": result["config"], "stats": result["stats"]}]
+        cleaned = [{"config": r["config"], "stats": {k: _clean(v) for k, v in r["stats"].items()}} for r in results]
+        print(json.dumps(cleaned, ensure_ascii=False, indent=2))
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
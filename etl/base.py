@@ -5,6 +5,8 @@ import sys
 import json
 import logging
 import subprocess
+import threading
+import time
 from typing import Any
 
 import psycopg2
@@ -17,12 +19,13 @@ logger = logging.getLogger(__name__)
 
 # ── 连接池（全局单例）──────────────────────────────────────
 _pool: ThreadedConnectionPool | None = None
+POOL_MAXCONN = 5
 
 
 def get_pool() -> ThreadedConnectionPool:
     global _pool
     if _pool is None:
-        _pool = ThreadedConnectionPool(minconn=1, maxconn=5, dsn=DB_DSN)
+        _pool = ThreadedConnectionPool(minconn=1, maxconn=POOL_MAXCONN, dsn=DB_DSN)
     return _pool
 
 
@@ -30,8 +33,9 @@ def get_conn():
     return get_pool().getconn()
 
 
-def put_conn(conn):
-    get_pool().putconn(conn)
+def put_conn(conn, close: bool = False):
+    """close=True 丢弃连接（如连接已断开），池会按需重建。"""
+    get_pool().putconn(conn, close=close)
 
 
 # ── upsert 辅助 ────────────────────────────────────────────
@@ -72,7 +76,168 @@ def upsert(
     return len(rows)
 
 
+# ── COPY 批量写入 ──────────────────────────────────────────
+class _CsvChunkStream:
+    """
+    把 DataFrame 按块序列化为 CSV 的只读文件对象，供 copy_expert 流式消费。
+    每次只物化 chunk_rows 行的文本，常量列在块内追加，不修改也不整体复制原 DataFrame。
+    """
+
+    def __init__(self, df, columns: list[str], constants: dict, chunk_rows: int):
+        self._df = df
+        self._columns = columns
+        self._constants = constants
+        self._chunk_rows = chunk_rows
+        self._pos = 0
+        self._buf = b""
+        self._off = 0      # 已读出的字节数；整块读完才换下一块，避免每次 read 复制剩余缓冲
+
+    def _next_chunk(self) -> bytes:
+        if self._pos >= len(self._df):
+            return b""
+        chunk = self._df.iloc[self._pos:self._pos + self._chunk_rows]
+        self._pos += self._chunk_rows
+        if self._constants:
+            chunk = chunk.assign(**self._constants)
+        return chunk[self._columns].to_csv(
+            header=False, index=False, na_rep="\\N", date_format="%Y-%m-%d",
+        ).encode()
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while size < 0 or size > 0:
+            if self._off >= len(self._buf):
+                self._buf, self._off = self._next_chunk(), 0
+                if not self._buf:
+                    break
+            end = len(self._buf) if size < 0 else min(len(self._buf), self._off + size)
+            parts.append(self._buf[self._off:end])
+            if size > 0:
+                size -= end - self._off
+            self._off = end
+        return b"".join(parts)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+
+def copy_upsert(
+    conn,
+    table: str,
+    df,
+    columns: list[str],
+    conflict_cols: list[str] | None = None,
+    update_cols: list[str] | None = None,
+    constants: dict | None = None,
+    delete_where: str | None = None,
+    delete_params: tuple | list | None = None,
+    chunk_rows: int = 200_000,
+) -> int:
+    """
+    COPY 流式批量写入，适合百万行以上的 DataFrame。
+    table          — 完整表名
+    df             — 数据来源，不会被修改
+    columns        — 目标列（按此顺序写入），可包含 constants 中的常量列
+    conflict_cols  — 给出时先 COPY 到临时表再 INSERT ... ON CONFLICT（同 upsert 语义）；
+                     None 表示直接 COPY 进目标表
+    update_cols    — 冲突时更新的列；None 表示 DO NOTHING
+    constants      — 每行相同的常量列，如 {"factor_name": "mom_20"}
+    delete_where   — 写入前在同一事务内执行 DELETE FROM table WHERE ...，用于区间替换
+    返回写入行数（临时表模式下为 COPY 行数）。
+    """
+    constants = constants or {}
+    col_str = ", ".join(columns)
+    stream = _CsvChunkStream(df, columns, constants, chunk_rows)
+    copy_opts = "WITH (FORMAT csv, NULL '\\N')"
+
+    try:
+        with conn.cursor() as cur:
+            if delete_where:
+                cur.execute(f"DELETE FROM {table} WHERE {delete_where}", delete_params)
+
+            if conflict_cols is None:
+                cur.copy_expert(f"COPY {table} ({col_str}) FROM STDIN {copy_opts}", stream)
+                n = cur.rowcount
+            else:
+                tmp = "_copy_upsert_tmp"
+                cur.execute(
+                    f"CREATE TEMP TABLE {tmp} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                cur.copy_expert(f"COPY {tmp} ({col_str}) FROM STDIN {copy_opts}", stream)
+                n = cur.rowcount
+
+                conflict_str = ", ".join(conflict_cols)
+                if update_cols:
+                    update_str = ", ".join(f"{c} = EXCLUDED.{c}" for c in update_cols)
+                    on_conflict = f"ON CONFLICT ({conflict_str}) DO UPDATE SET {update_str}"
+                else:
+                    on_conflict = f"ON CONFLICT ({conflict_str}) DO NOTHING"
+                # DISTINCT ON 去重，避免同一批次内重复键触发 "cannot affect row a second time"
+                cur.execute(
+                    f"INSERT INTO {table} ({col_str})"
+                    f" SELECT DISTINCT ON ({conflict_str}) {col_str} FROM {tmp}"
+                    f" {on_conflict}"
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return n
+
+
+def ensure_month_partitions(conn, table: str, days) -> None:
+    """
+    为按月 RANGE 分区的表（raw.ticks / raw.intraday_bars）创建 days 涉及月份的分区
+    {table}_YYYYMM。应在并发写入前由单个线程调用，避免同时建表冲突。
+    """
+    from datetime import timedelta
+
+    months = sorted({d.replace(day=1) for d in days})
+    with conn.cursor() as cur:
+        for m in months:
+            nxt = (m + timedelta(days=32)).replace(day=1)
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {table}_{m:%Y%m} PARTITION OF {table}"
+                f" FOR VALUES FROM ('{m}') TO ('{nxt}')"
+            )
+    conn.commit()
+
+
+# ── 批量读取 ──────────────────────────────────────────────
+def copy_query(conn, sql: str, params: tuple | list | None = None, dtype: dict | None = None):
+    """
+    通过 COPY (query) TO STDOUT 以 CSV 流读取查询结果，返回 pandas DataFrame。
+    大结果集比 cursor.fetchall() 逐行构造 Python 对象快得多。
+    """
+    import io
+    import pandas as pd
+
+    with conn.cursor() as cur:
+        query = cur.mogrify(sql, params).decode() if params else sql
+        buf = io.BytesIO()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf)
+    buf.seek(0)
+    return pd.read_csv(buf, dtype=dtype)
+
+
 # ── Wind bridge 调用 ───────────────────────────────────────
+class RateLimiter:
+    """相邻两次调用启动的最小间隔（线程安全），用于多线程并发调用 Wind 时限流。"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
 def call_wind(function: str, params: dict) -> dict:
     """
     调用 wind_bridge.py，返回解析后的 JSON 结果。
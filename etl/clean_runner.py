@@ -1,13 +1,13 @@
 """
 执行 LLM 生成的数据清洗脚本。
-用法: python etl/clean_runner.py --script <path>
+用法: python etl/clean_runner.py --script <path> [--timeout 600] [--max-memory-mb 4096]
 
 预置命名空间包含 get_conn / put_conn / upsert / psycopg2，
 以及可选的 numpy / pandas / scipy.stats。
+脚本在 sandbox.py 的 worker 子进程中运行，受 CPU / 内存 / 墙钟时间限制。
 """
 import argparse
 import sys
-import traceback
 
 # 确保 etl/ 目录在 sys.path 中，以便 import base / config
 import os
@@ -15,6 +15,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import psycopg2
 from base import get_conn, put_conn, upsert
+from sandbox import add_limit_args, limits_from_args, run_script
 
 
 def build_namespace() -> dict:
@@ -41,6 +42,7 @@ def build_namespace() -> dict:
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--script", required=True, help="要执行的 Python 脚本路径")
+    add_limit_args(parser)
     args = parser.parse_args()
 
     script_path = args.script
@@ -48,15 +50,12 @@ def main():
         print(f"[错误] 脚本文件不存在: {script_path}", file=sys.stderr)
         sys.exit(1)
 
-    with open(script_path, "r", encoding="utf-8") as f:
-        script_content = f.read()
-
-    ns = build_namespace()
-    try:
-        exec(compile(script_content, script_path, "exec"), ns)
-    except Exception:
-        traceback.print_exc()
-        sys.exit(1)
+    result = run_script(script_path, namespace="clean", limits=limits_from_args(args))
+    print(result.summary(), file=sys.stderr)
+    if not result.ok:
+        if result.error:
+            print(f"[错误] {result.error}", file=sys.stderr)
+        sys.exit(result.returncode if result.returncode > 0 else 1)
 
 
 if __name__ == "__main__":
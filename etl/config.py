@@ -57,6 +57,22 @@ LLM_MODEL    = os.getenv("LLM_MODEL",    "claude-sonnet-4-6")
 import pathlib
 BRIDGE_DIR = pathlib.Path(__file__).parent.parent / "src" / "python"
 
+# ── 本地缓存目录（schema 快照等）────────────────────────────
+CACHE_DIR = pathlib.Path(os.getenv("ETL_CACHE_DIR", "") or pathlib.Path(__file__).parent / ".cache")
+
+# ── 因子值 Parquet 镜像目录（factor_store.py）─────────────────
+FACTOR_STORE_DIR = pathlib.Path(os.getenv("FACTOR_STORE_DIR", "") or CACHE_DIR / "factor_store")
+
+# ── 常驻查询服务（query_service.py，供 server.ts 调用）────────
+QUERY_SERVICE_HOST = os.getenv("QUERY_SERVICE_HOST", "127.0.0.1")
+QUERY_SERVICE_PORT = int(os.getenv("QUERY_SERVICE_PORT", "3002"))
+QUERY_CACHE_MB     = float(os.getenv("QUERY_CACHE_MB", "256"))     # 因子查询结果缓存上限，<= 0 关闭
+
+# ── 生成代码沙盒限制（<= 0 表示不限制）───────────────────────
+SANDBOX_TIMEOUT_S     = float(os.getenv("SANDBOX_TIMEOUT_S",     "600"))
+SANDBOX_MAX_MEMORY_MB = float(os.getenv("SANDBOX_MAX_MEMORY_MB", "4096"))
+SANDBOX_MAX_CPU_S     = float(os.getenv("SANDBOX_MAX_CPU_S",     "0"))
+
 # ── 日志 ────────────────────────────────────────────────────
 import logging
 logging.basicConfig(
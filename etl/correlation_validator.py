@@ -0,0 +1,475 @@
+"""
+Validate meta.correlation_mappings against the data.
+
+Every mapping pairs an indicator with an asset (within a macro scenario) and
+states an expected_relationship ("正相关", "负相关, 领先3个月", ...) and a
+validation_model ("Spearman", "Pearson"). This module measures what the
+data actually says, for all mappings at once:
+
+  - alignment: both sides come from processed.feature_series via the panel
+    cache. Asset daily_return is compounded into periods (month / week /
+    day); the indicator (its calc_method, else YoY) is taken as of each
+    period end, and ignored once older than a staleness limit.
+  - lag profile: full-sample correlation, OLS beta (asset on indicator)
+    and p-value for every lag in [-max_lag, max_lag]; lag l > 0 means the
+    indicator leads the asset by l periods.
+  - rolling: correlation, beta and p-value over a trailing window at the
+    expected lag, as one date x mapping array operation per statistic.
+
+Spearman mappings are correlated on ranks (within each window for the
+rolling series); betas are always OLS on the raw values. p-values use the
+Fisher z transform with a normal tail.
+
+Results go to meta.correlation_validation (one summary row per mapping,
+incl. the lag profile and whether the data agrees with the expected sign)
+and meta.correlation_rolling (mapping x period). Reruns only write rolling
+rows from each mapping's computed_through on; a mapping is rewritten in
+full when its frequency, window, model or expected lag changed, or with
+--full (needed after revisions of older data).
+
+Usage:
+    python etl/correlation_validator.py                       # all mappings, monthly
+    python etl/correlation_validator.py --scenario 宽货币紧信用 --freq W
+    python etl/correlation_validator.py --full --window 60 --max-lag 6
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import traceback
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from base import copy_upsert, get_conn, put_conn, upsert
+from factor_eval import rank_rows, row_corr
+from operators import ts_corr, ts_std, ts_sum
+from panel import load_panel
+
+logger = logging.getLogger(__name__)
+
+ASSET_METHOD = "daily_return"
+DEFAULT_INDICATOR_METHOD = "YoY"
+
+# per frequency: rolling window, max lag (periods), staleness limit for as-of values (days)
+FREQ_DEFAULTS = {
+    "M": {"window": 36, "max_lag": 12, "stale_days": 62},
+    "W": {"window": 104, "max_lag": 26, "stale_days": 45},
+    "D": {"window": 252, "max_lag": 20, "stale_days": 45},
+}
+# periods per unit of an expected lead ("领先3个月" at weekly frequency = 13 periods)
+_PERIODS_PER_UNIT = {
+    "M": {"month": 1, "week": 12 / 52, "day": 1 / 21},
+    "W": {"month": 52 / 12, "week": 1, "day": 1 / 5},
+    "D": {"month": 21, "week": 5, "day": 1},
+}
+_UNITS = {
+    "个月": "month", "月": "month", "month": "month", "months": "month", "m": "month",
+    "周": "week", "星期": "week", "week": "week", "weeks": "week", "w": "week",
+    "天": "day", "日": "day", "交易日": "day", "day": "day", "days": "day", "d": "day",
+}
+_LEAD_RE = re.compile(r"(领先|超前|滞后|落后|leads?|lags?)\s*(\d+)\s*(个月|交易日|星期|月|周|天|日|months?|weeks?|days?|[mwd])?", re.I)
+
+
+# ── expectations ───────────────────────────────────────────
+
+def parse_expectation(text: str | None, freq: str) -> tuple[int, int]:
+    """
+    expected_relationship -> (sign, lag in periods of `freq`). sign is +1 / -1,
+    0 when the text states no direction; lag > 0 means the indicator leads.
+    """
+    t = (text or "").strip().lower()
+    sign = 0
+    if any(k in t for k in ("负相关", "反向", "negative", "inverse")):
+        sign = -1
+    elif any(k in t for k in ("正相关", "同向", "positive")):
+        sign = 1
+
+    lag = 0
+    m = _LEAD_RE.search(t)
+    if m:
+        unit = _UNITS.get((m.group(3) or "").lower(), "month" if freq == "M" else "day")
+        n = int(m.group(2)) * _PERIODS_PER_UNIT[freq][unit]
+        lag = int(round(n)) * (-1 if m.group(1).lower() in ("滞后", "落后", "lag", "lags") else 1)
+    return sign, lag
+
+
+def parse_model(text: str | None) -> str:
+    return "spearman" if text and "spearman" in text.lower() else "pearson"
+
+
+# ── alignment ──────────────────────────────────────────────
+
+def period_index(dates: np.ndarray, freq: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Group sorted daily dates into periods -> (period end labels, period number
+    of each date). For D every date is its own period.
+    """
+    if freq == "D":
+        return dates, np.arange(len(dates))
+    idx = pd.DatetimeIndex(np.asarray(dates, dtype="datetime64[ns]"))
+    periods = idx.to_period("M" if freq == "M" else "W-FRI")
+    codes, uniques = pd.factorize(periods, sort=True)
+    labels = uniques.end_time.normalize().to_numpy(dtype="datetime64[D]")
+    return labels, codes
+
+
+def compound(returns: np.ndarray, group: np.ndarray, n_groups: int) -> np.ndarray:
+    """Compound simple returns (rows) within consecutive groups; NaN where a group has no data."""
+    valid = ~np.isnan(returns)
+    logs = np.where(valid, np.log1p(np.maximum(np.where(valid, returns, 0.0), -0.999999)), 0.0)
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    total = np.add.reduceat(logs, starts, axis=0)
+    count = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+    out = np.full((n_groups, returns.shape[1]), np.nan)
+    out[group[starts]] = np.where(count > 0, np.expm1(total), np.nan)
+    return out
+
+
+def as_of(values: np.ndarray, dates: np.ndarray, labels: np.ndarray, stale_days: int) -> np.ndarray:
+    """
+    Latest valid value of each column observed on or before each label,
+    NaN when none exists or it is older than stale_days.
+    """
+    n, k = values.shape
+    valid = ~np.isnan(values)
+    last = np.maximum.accumulate(np.where(valid, np.arange(n)[:, None], -1), axis=0)
+    pos = np.searchsorted(dates, labels, side="right") - 1
+    out = np.full((len(labels), k), np.nan)
+    ok_row = pos >= 0
+    src = np.full((len(labels), k), -1)
+    src[ok_row] = last[pos[ok_row]]
+    hit = src >= 0
+    age = (labels[:, None] - dates[np.maximum(src, 0)]).astype("timedelta64[D]").astype(np.int64)
+    hit &= age <= stale_days
+    rows, cols = np.nonzero(hit)
+    out[rows, cols] = values[src[rows, cols], cols]
+    return out
+
+
+def shift_columns(x: np.ndarray, lags: np.ndarray) -> np.ndarray:
+    """Shift each column down by its own lag (negative lags shift up)."""
+    out = np.full_like(x, np.nan)
+    n = len(x)
+    for lag in np.unique(lags):
+        cols = np.flatnonzero(lags == lag)
+        if lag == 0:
+            out[:, cols] = x[:, cols]
+        elif 0 < lag < n:
+            out[lag:, cols] = x[:-lag, cols]
+        elif -n < lag < 0:
+            out[:lag, cols] = x[-lag:, cols]
+    return out
+
+
+# ── statistics ─────────────────────────────────────────────
+
+def fisher_pvalue(r: np.ndarray, n: np.ndarray, spearman: np.ndarray | bool = False) -> np.ndarray:
+    """Two-sided p-value of a correlation via Fisher z (Spearman variance inflated by 1.06)."""
+    r = np.asarray(r, dtype="float64")
+    n = np.asarray(n, dtype="float64")
+    scale = np.where(spearman, 1.06, 1.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.arctanh(np.clip(r, -0.999999, 0.999999)) * np.sqrt((n - 3.0) / scale)
+    p = np.full(z.shape, np.nan)
+    ok = np.isfinite(z) & (n > 3)
+    p[ok] = np.vectorize(math.erfc, otypes=[float])(np.abs(z[ok]) / math.sqrt(2.0))
+    return p
+
+
+def column_stats(x: np.ndarray, y: np.ndarray, spearman: np.ndarray, min_obs: int) -> dict[str, np.ndarray]:
+    """Full-sample correlation, OLS beta of y on x, p-value and n per column (jointly valid rows)."""
+    joint = ~(np.isnan(x) | np.isnan(y))
+    xj, yj = np.where(joint, x, np.nan).T, np.where(joint, y, np.nan).T
+    n = joint.sum(axis=0)
+    pearson = row_corr(xj, yj, min_obs)
+    corr = pearson.copy()
+    if spearman.any():
+        corr[spearman] = row_corr(rank_rows(xj[spearman]), rank_rows(yj[spearman]), min_obs)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        beta = pearson * np.nanstd(yj, axis=1) / np.nanstd(xj, axis=1)
+    return {"corr": corr, "beta": beta, "p_value": fisher_pvalue(corr, n, spearman), "n_obs": n}
+
+
+def rolling_spearman(x: np.ndarray, y: np.ndarray, window: int, min_periods: int, chunk_cells: int = 4_000_000) -> np.ndarray:
+    """Trailing Spearman correlation per column, ranking jointly valid values within each window."""
+    n, k = x.shape
+    out = np.full((n, k), np.nan)
+    if n == 0 or k == 0:
+        return out
+    pad = np.full((window - 1, k), np.nan)
+    xp, yp = np.vstack([pad, x]), np.vstack([pad, y])
+    step = max(1, chunk_cells // max(n * window, 1))
+    for c0 in range(0, k, step):
+        cols = slice(c0, c0 + step)
+        xs = np.lib.stride_tricks.sliding_window_view(xp[:, cols], window, axis=0)   # (n, kc, window)
+        ys = np.lib.stride_tricks.sliding_window_view(yp[:, cols], window, axis=0)
+        miss = np.isnan(xs) | np.isnan(ys)
+        xr = rank_rows(np.where(miss, np.nan, xs).reshape(-1, window))
+        yr = rank_rows(np.where(miss, np.nan, ys).reshape(-1, window))
+        out[:, cols] = row_corr(xr, yr, min_periods).reshape(n, -1)
+    return out
+
+
+def rolling_stats(x: np.ndarray, y: np.ndarray, spearman: np.ndarray, window: int, min_periods: int) -> dict[str, np.ndarray]:
+    """Trailing correlation, beta, p-value and n for every column at once."""
+    joint = ~(np.isnan(x) | np.isnan(y))
+    xj, yj = np.where(joint, x, np.nan), np.where(joint, y, np.nan)
+    n = ts_sum(joint.astype("float64"), window, 1)
+    pearson = ts_corr(xj, yj, window, min_periods)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        beta = pearson * ts_std(yj, window, min_periods) / ts_std(xj, window, min_periods)
+    corr = pearson.copy()
+    if spearman.any():
+        corr[:, spearman] = rolling_spearman(xj[:, spearman], yj[:, spearman], window, min_periods)
+    return {"corr": corr, "beta": beta, "p_value": fisher_pvalue(corr, n, spearman[None, :]), "n_obs": n}
+
+
+# ── data ───────────────────────────────────────────────────
+
+def load_mappings(conn, scenario: str | None = None) -> pd.DataFrame:
+    sql = (
+        "SELECT m.id AS mapping_id, m.indicator_id, m.asset_id, m.expected_relationship,"
+        " m.validation_model, i.calc_method"
+        " FROM meta.correlation_mappings m"
+        " JOIN meta.indicators i ON i.id = m.indicator_id"
+        " LEFT JOIN meta.macro_scenarios s ON s.id = m.scenario_id"
+        " WHERE m.asset_id IS NOT NULL"
+    )
+    params: list = []
+    if scenario:
+        sql += " AND (s.scenario_name = %s OR s.id::text = %s)"
+        params += [scenario, scenario]
+    sql += " ORDER BY m.id"
+    with conn.cursor() as cur:
+        cur.execute(sql, params or None)
+        rows = cur.fetchall()
+    return pd.DataFrame(rows, columns=["mapping_id", "indicator_id", "asset_id",
+                                       "expected_relationship", "validation_model", "calc_method"])
+
+
+def _take_columns(matrix: np.ndarray, ids: np.ndarray, wanted: np.ndarray) -> np.ndarray:
+    """Columns of matrix for the wanted target ids (sorted ids); unknown ids -> NaN columns."""
+    out = np.full((len(matrix), len(wanted)), np.nan)
+    if len(ids) == 0:
+        return out
+    pos = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+    hit = ids[pos] == wanted
+    out[:, hit] = matrix[:, pos[hit]]
+    return out
+
+
+def aligned_series(conn, mappings: pd.DataFrame, freq: str, stale_days: int, indicator_method: str | None = None):
+    """
+    Indicator (X) and asset (Y) period matrices with one column per mapping
+    -> (labels, X, Y).
+    """
+    assets = load_panel(ASSET_METHOD, "transformed_value", target_type="asset", conn=conn)
+    if len(assets.dates) == 0:
+        raise RuntimeError(f"processed.feature_series has no asset {ASSET_METHOD} rows")
+    labels, group = period_index(assets.dates, freq)
+    y_all = compound(np.asarray(assets["transformed_value"]), group, len(labels))
+    y = _take_columns(y_all, assets.ids, mappings["asset_id"].to_numpy(dtype=np.int64))
+
+    methods = (
+        pd.Series(indicator_method, index=mappings.index) if indicator_method
+        else mappings["calc_method"].fillna(DEFAULT_INDICATOR_METHOD)
+    )
+    x = np.full(y.shape, np.nan)
+    for method, idx in methods.groupby(methods).groups.items():
+        panel = load_panel(method, "transformed_value", target_type="indicator", conn=conn)
+        if len(panel.dates) == 0:
+            logger.warning(f"No indicator rows for transform_method={method}; {len(idx)} mappings left empty")
+            continue
+        cols = mappings.index.get_indexer(idx)
+        wanted = mappings["indicator_id"].to_numpy(dtype=np.int64)[cols]
+        vals = as_of(np.asarray(panel["transformed_value"]), panel.dates, labels, stale_days)
+        x[:, cols] = _take_columns(vals, panel.ids, wanted)
+    return labels, x, y
+
+
+# ── validation ─────────────────────────────────────────────
+
+def validate(
+    labels: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    mappings: pd.DataFrame,
+    freq: str,
+    window: int,
+    max_lag: int,
+    min_obs: int | None = None,
+    alpha: float = 0.05,
+) -> tuple[list[dict], dict[str, np.ndarray]]:
+    """
+    Lag profiles, summaries and rolling statistics for aligned X / Y.
+    Returns (summary rows, rolling arrays at each mapping's expected lag).
+    """
+    min_obs = min_obs or max(window * 2 // 3, 4)
+    expectations = [parse_expectation(t, freq) for t in mappings["expected_relationship"]]
+    exp_sign = np.array([s for s, _ in expectations])
+    exp_lag = np.array([l for _, l in expectations])
+    models = [parse_model(m) for m in mappings["validation_model"]]
+    spearman = np.array([m == "spearman" for m in models], dtype=bool)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        lags = np.arange(-max_lag, max_lag + 1)
+        profile = {}
+        for lag in lags:
+            profile[int(lag)] = column_stats(shift_columns(x, np.full(x.shape[1], lag)), y, spearman, 4)
+        at_exp = column_stats(shift_columns(x, exp_lag), y, spearman, 4)
+        rolling = rolling_stats(shift_columns(x, exp_lag), y, spearman, window, min_obs)
+
+    corr_by_lag = np.vstack([profile[int(l)]["corr"] for l in lags])     # (n_lags, n_mappings)
+    has_any = ~np.isnan(corr_by_lag).all(axis=0)
+    best = np.argmax(np.where(np.isnan(corr_by_lag), -1.0, np.abs(corr_by_lag)), axis=0)
+
+    rows = []
+    for j, mid in enumerate(mappings["mapping_id"].tolist()):
+        rc = rolling["corr"][:, j]
+        seen = ~np.isnan(rc)
+        stability = float((np.sign(rc[seen]) == exp_sign[j]).mean()) if exp_sign[j] and seen.any() else None
+        corr, p = at_exp["corr"][j], at_exp["p_value"][j]
+        consistent = None
+        if exp_sign[j] and np.isfinite(corr):
+            consistent = bool(np.sign(corr) == exp_sign[j] and np.isfinite(p) and p < alpha)
+        b = int(best[j])
+        rows.append({
+            "mapping_id":       int(mid),
+            "freq":             freq,
+            "window_periods":   window,
+            "model":            models[j],
+            "expected_sign":    int(exp_sign[j]) or None,
+            "expected_lag":     int(exp_lag[j]),
+            "n_obs":            int(at_exp["n_obs"][j]),
+            "correlation":      _clean(corr),
+            "beta":             _clean(at_exp["beta"][j]),
+            "p_value":          _clean(p),
+            "best_lag":         int(lags[b]) if has_any[j] else None,
+            "best_correlation": _clean(corr_by_lag[b, j]) if has_any[j] else None,
+            "best_p_value":     _clean(profile[int(lags[b])]["p_value"][j]) if has_any[j] else None,
+            "sign_stability":   stability,
+            "consistent":       consistent,
+            "lag_profile":      json.dumps({
+                str(int(l)): {"corr": _clean(profile[int(l)]["corr"][j]),
+                              "p": _clean(profile[int(l)]["p_value"][j]),
+                              "n": int(profile[int(l)]["n_obs"][j])}
+                for l in lags
+            }),
+            "computed_through": str(labels[np.flatnonzero(seen)[-1]]) if seen.any() else None,
+        })
+    return rows, rolling
+
+
+def _clean(v):
+    v = float(v)
+    return v if np.isfinite(v) else None
+
+
+def _previous_runs(conn) -> dict[int, dict]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT mapping_id, freq, window_periods, model, expected_lag, computed_through"
+            " FROM meta.correlation_validation"
+        )
+        return {
+            r[0]: {"freq": r[1], "window_periods": r[2], "model": r[3], "expected_lag": r[4],
+                   "computed_through": r[5]}
+            for r in cur.fetchall()
+        }
+
+
+def save(conn, labels: np.ndarray, rows: list[dict], rolling: dict[str, np.ndarray], full: bool = False) -> int:
+    """
+    Write summaries and the new part of each mapping's rolling series.
+    Returns the number of rolling rows written.
+    """
+    previous = {} if full else _previous_runs(conn)
+    label_dates = labels.astype("datetime64[D]")
+    frames, rewrite = [], []
+    for j, row in enumerate(rows):
+        mid = row["mapping_id"]
+        prev = previous.get(mid)
+        same = prev is not None and all(prev[k] == row[k] for k in ("freq", "window_periods", "model", "expected_lag"))
+        keep = ~np.isnan(rolling["corr"][:, j])
+        if same and prev["computed_through"] is not None:
+            keep &= label_dates >= np.datetime64(prev["computed_through"], "D")
+        else:
+            rewrite.append(mid)
+        if not keep.any():
+            continue
+        frames.append(pd.DataFrame({
+            "mapping_id":  mid,
+            "obs_date":    label_dates[keep],
+            "n_obs":       rolling["n_obs"][keep, j].astype(np.int64),
+            "correlation": rolling["corr"][keep, j],
+            "beta":        rolling["beta"][keep, j],
+            "p_value":     rolling["p_value"][keep, j],
+        }))
+
+    cols = ["mapping_id", "obs_date", "n_obs", "correlation", "beta", "p_value"]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=cols)
+    df[["beta", "p_value"]] = df[["beta", "p_value"]].astype("float64")
+    n = 0
+    if len(df) or rewrite:
+        n = copy_upsert(
+            conn, "meta.correlation_rolling", df, cols,
+            conflict_cols=["mapping_id", "obs_date"],
+            update_cols=["n_obs", "correlation", "beta", "p_value"],
+            delete_where="mapping_id = ANY(%s)" if rewrite else None,
+            delete_params=(rewrite,) if rewrite else None,
+        )
+    computed_at = datetime.now()
+    upsert(conn, "meta.correlation_validation",
+           [{**r, "computed_at": computed_at} for r in rows],
+           ["mapping_id"], [c for c in rows[0] if c != "mapping_id"] + ["computed_at"])
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate meta.correlation_mappings with rolling / lagged correlations")
+    parser.add_argument("--scenario", default=None, help="only mappings of this scenario (name or id)")
+    parser.add_argument("--freq", default="M", choices=list(FREQ_DEFAULTS))
+    parser.add_argument("--window", type=int, default=None, help="rolling window in periods")
+    parser.add_argument("--max-lag", type=int, default=None, help="lags -max..max periods in the lag profile")
+    parser.add_argument("--indicator-method", default=None,
+                        help=f"indicator transform_method (default: meta.indicators.calc_method, else {DEFAULT_INDICATOR_METHOD})")
+    parser.add_argument("--alpha", type=float, default=0.05, help="significance level for `consistent`")
+    parser.add_argument("--full", action="store_true", help="rewrite every rolling series")
+    args = parser.parse_args()
+
+    defaults = FREQ_DEFAULTS[args.freq]
+    window = args.window or defaults["window"]
+    max_lag = defaults["max_lag"] if args.max_lag is None else args.max_lag
+    conn = get_conn()
+    try:
+        mappings = load_mappings(conn, args.scenario)
+        if mappings.empty:
+            print("No correlation mappings to validate")
+            return
+        labels, x, y = aligned_series(conn, mappings, args.freq, defaults["stale_days"], args.indicator_method)
+        rows, rolling = validate(labels, x, y, mappings, args.freq, window, max_lag, alpha=args.alpha)
+        n = save(conn, labels, rows, rolling, full=args.full)
+        for r in rows:
+            verdict = {True: "✓", False: "✗", None: "?"}[r["consistent"]]
+            corr = "nan" if r["correlation"] is None else f"{r['correlation']:+.3f}"
+            print(f"{verdict} mapping {r['mapping_id']}: corr={corr} lag={r['expected_lag']}"
+                  f" best_lag={r['best_lag']} n={r['n_obs']}")
+        print(f"{len(rows)} mappings validated, {n} rolling rows written")
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        put_conn(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Run many factor scripts against one shared set of loaded inputs.
+
+  1. The processed inputs the factors read last time (factors.dependencies)
+     plus --preload tables are read from Postgres once in the parent, from
+     --start minus the lookback on; for feature_series only the series the
+     factors read, whose panels are also refreshed once into the mmap cache
+     (panel.py).
+  2. Each script runs in its own forked worker, which inherits the loaded
+     tables copy-on-write, so load_processed_data() calls they cover are
+     served from memory (a whole-table feature_series read needs
+     --preload feature_series; anything else falls back to the DB).
+     Where fork is unavailable (Windows) the tables are handed over as
+     memory-mapped Arrow files instead.
+  3. save_factor_values() in the workers only captures the rows; the
+     parent writes all factors with one COPY upsert per table, mirrors them
+     to the Parquet store and records lineage.
+  4. A per-factor report lists status, runtime, peak RSS and the RSS the
+     worker added on top of the shared inputs.
+
+Each worker gets the sandbox CPU / wall-clock limits; the memory limit
+applies on top of the inherited address space.
+
+Usage:
+    python etl/factor_batch.py --jobs 4                       # every factor in factors.metadata
+    python etl/factor_batch.py --factors mom_20,value_ep --preload feature_series
+    python etl/factor_batch.py --scripts a.py,b.py --start 2024-06-01
+"""
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from multiprocessing.connection import wait as wait_ready
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from base import copy_upsert, get_conn, put_conn
+from lineage import LineageRecorder, watermark
+from sandbox import add_limit_args, apply_limits, limits_from_args, peak_rss_mb, read_arrow, write_arrow
+
+logger = logging.getLogger(__name__)
+
+
+# ── inputs ─────────────────────────────────────────────────
+
+def _inputs_for(conn, factor_names: list[str]) -> tuple[set[str], set[tuple[str, str]]]:
+    """Processed tables and (target_type, method) panels the given factors read last time."""
+    tables: set[str] = set()
+    panels: set[tuple[str, str]] = set()
+    if not factor_names:
+        return tables, panels
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT DISTINCT source_name FROM factors.dependencies"
+            " WHERE source_kind = 'processed' AND factor_name = ANY(%s)",
+            (factor_names,),
+        )
+        for (name,) in cur.fetchall():
+            if name.startswith("feature_series/"):
+                _, target_type, method = name.split("/", 2)
+                panels.add((target_type, method))
+            else:
+                tables.add(name)
+    return tables, panels
+
+
+def preload(
+    conn,
+    tables: set[str],
+    panels: set[tuple[str, str]],
+    since: str | None = None,
+) -> dict[str, tuple[pd.DataFrame, dict, str | None]]:
+    """
+    Read the processed inputs once and bring every panel cache up to date.
+    Returns {table: (rows, {lineage name: watermark}, since)} where rows
+    start at `since` (None = full history). feature_series is loaded whole
+    only when asked for explicitly; otherwise just the (target_type,
+    transform_method) series the factors read last time, which serve
+    load_processed_data(conn, "feature_series", target_type=..., transform_method=...).
+    """
+    from factor_namespace import _date_column
+    from panel import refresh_panel
+
+    loaded = {}
+    if panels and "feature_series" not in tables:
+        t0 = time.perf_counter()
+        pairs = sorted(panels)
+        sql = "SELECT * FROM processed.feature_series WHERE (target_type, transform_method) IN %s"
+        params: list = [tuple(pairs)]
+        if since:
+            sql += " AND obs_date >= %s"
+            params.append(since)
+        df = pd.read_sql(sql, conn, params=params)
+        names = [f"feature_series/{t}/{m}" for t, m in pairs]
+        loaded["feature_series"] = (df, {n: watermark(conn, "processed", n) for n in names}, since)
+        logger.info(f"preloaded {len(pairs)} feature_series series: {len(df)} rows in {time.perf_counter() - t0:.2f}s")
+    for table in sorted(tables):
+        t0 = time.perf_counter()
+        date_col = _date_column(conn, table) if since else None
+        if date_col:
+            df = pd.read_sql(f"SELECT * FROM processed.{table} WHERE {date_col} >= %s", conn, params=[since])
+        else:
+            df = pd.read_sql(f"SELECT * FROM processed.{table}", conn)
+        names = [table]
+        if table == "feature_series":
+            pairs = df[["target_type", "transform_method"]].drop_duplicates().itertuples(index=False)
+            names += [f"feature_series/{t}/{m}" for t, m in pairs]
+        loaded[table] = (df, {n: watermark(conn, "processed", n) for n in names}, since if date_col else None)
+        logger.info(f"preloaded processed.{table}: {len(df)} rows in {time.perf_counter() - t0:.2f}s")
+    for target_type, method in sorted(panels):
+        refresh_panel(conn, method, target_type)
+        logger.info(f"panel cache ready: {target_type}/{method}")
+    return loaded
+
+
+def _resident_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _address_space_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[0])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+# ── worker ─────────────────────────────────────────────────
+
+def _worker(task: dict, inputs, limits: dict, workdir: str, conn_out) -> None:
+    """Runs in the child: execute one script with captured output, report back over the pipe."""
+    import base
+    import factor_namespace as fns
+
+    base._pool = None                     # never reuse the parent's connections
+    if "__paths__" in inputs:
+        inputs = {t: (read_arrow(p), wms, since) for t, (p, wms, since) in json.loads(inputs["__paths__"]).items()}
+    fns._preloaded = inputs or {}
+    fns._captured = []
+    fns._lineage = LineageRecorder()
+    fns.COMPUTE_START = task.get("start") or fns.COMPUTE_START
+
+    rss_start = _resident_mb()
+    max_mem = limits.get("max_memory_mb") or 0
+    apply_limits(_address_space_mb() + max_mem if max_mem > 0 else 0, limits.get("max_cpu_s") or 0)
+
+    result = {"name": task["name"], "ok": True, "error": None, "outputs": []}
+    t0 = time.perf_counter()
+    try:
+        ns = fns.build_namespace()
+        exec(compile(task["code"], task.get("path", task["name"]), "exec"), ns)   # noqa: S102
+        for i, (factor_name, df, asset_level, replace_range) in enumerate(fns._captured):
+            path = os.path.join(workdir, f"{task['index']}_{i}.arrow")
+            write_arrow(df.reset_index(drop=True), path)
+            result["outputs"].append({
+                "factor_name": factor_name, "path": path, "rows": len(df),
+                "asset_level": asset_level, "replace_range": replace_range,
+            })
+        result["lineage"] = (fns._lineage.inputs, fns._lineage.outputs, list(ns.get("DEPENDS_ON", ())))
+    except MemoryError:
+        result.update(ok=False, error=f"memory limit exceeded (>{max_mem} MB over shared inputs)")
+    except Exception as e:
+        traceback.print_exc()
+        result.update(ok=False, error=f"{type(e).__name__}: {e}")
+    result["runtime_s"] = time.perf_counter() - t0
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["rss_start_mb"] = rss_start
+    conn_out.send(result)
+    conn_out.close()
+
+
+def _run_workers(tasks: list[dict], inputs, limits: dict, jobs: int, workdir: str) -> list[dict]:
+    """Fork one worker per script, at most `jobs` at a time, enforcing the wall-clock timeout."""
+    ctx = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+    if ctx.get_start_method() != "fork" and inputs:
+        # no copy-on-write: hand the tables over as memory-mapped Arrow files
+        paths = {}
+        for table, (df, watermarks, since) in inputs.items():
+            path = os.path.join(workdir, f"input_{table}.arrow")
+            write_arrow(df, path)
+            paths[table] = (path, watermarks, since)
+        inputs = {"__paths__": json.dumps(paths)}
+
+    timeout = limits.get("timeout_s") or 0
+    pending = list(tasks)
+    running: dict = {}          # result pipe -> (process, task, started)
+    results: list[dict] = []
+    while pending or running:
+        while pending and len(running) < max(1, jobs):
+            task = pending.pop(0)
+            recv, send = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_worker, args=(task, inputs, limits, workdir, send))
+            proc.start()
+            send.close()
+            running[recv] = (proc, task, time.perf_counter())
+
+        # a pipe becomes ready when the worker reports or dies (EOF)
+        ready = wait_ready(list(running), timeout=1.0)
+        now = time.perf_counter()
+        for recv in list(running):
+            proc, task, started = running[recv]
+            if recv in ready:
+                try:
+                    result = recv.recv()
+                except EOFError:
+                    proc.join()
+                    result = {"name": task["name"], "ok": False, "outputs": [],
+                              "error": f"worker exited with code {proc.exitcode} (CPU or memory limit?)",
+                              "runtime_s": now - started}
+                proc.join()
+            elif timeout > 0 and now - started > timeout:
+                proc.kill()
+                proc.join()
+                result = {"name": task["name"], "ok": False, "outputs": [],
+                          "error": f"timed out after {timeout}s", "runtime_s": now - started}
+            else:
+                continue
+            recv.close()
+            results.append(result)
+            del running[recv]
+    return results
+
+
+# ── bulk write ─────────────────────────────────────────────
+
+def _bulk_write(conn, results: list[dict]) -> dict[str, int]:
+    """One COPY upsert per target table for every captured output, then mirror + lineage + cache invalidation."""
+    import factor_store
+    from factor_cache import notify_factor_changed
+
+    frames = {True: [], False: []}
+    deletes = {True: [], False: []}
+    by_factor: dict[str, list[pd.DataFrame]] = {}
+    changed = set()
+    for r in results:
+        if not r["ok"]:
+            continue
+        for out in r["outputs"]:
+            df = read_arrow(out["path"])
+            df["factor_name"] = out["factor_name"]
+            frames[out["asset_level"]].append(df)
+            changed.add(out["factor_name"])
+            if out["replace_range"]:
+                deletes[out["asset_level"]].append((out["factor_name"], *out["replace_range"]))
+            if out["asset_level"]:
+                by_factor.setdefault(out["factor_name"], []).append(df)
+
+    written = {}
+    for asset_level, parts in frames.items():
+        if not parts:
+            continue
+        if asset_level:
+            table, columns = "factors.asset_values", ["factor_name", "asset_code", "trade_date", "value"]
+        else:
+            table, columns = "factors.values", ["factor_name", "trade_date", "value"]
+        delete_where = delete_params = None
+        if deletes[asset_level]:
+            delete_where = " OR ".join(["(factor_name = %s AND trade_date BETWEEN %s AND %s)"] * len(deletes[asset_level]))
+            delete_params = tuple(v for d in deletes[asset_level] for v in d)
+        t0 = time.perf_counter()
+        if asset_level:
+            # committed (or rolled back) together with the write below
+            versions = factor_store.bump_versions(conn, by_factor)
+        n = copy_upsert(
+            conn, table, pd.concat(parts, ignore_index=True), columns,
+            conflict_cols=columns[:-1], update_cols=["value"],
+            delete_where=delete_where, delete_params=delete_params,
+        )
+        written[table] = n
+        logger.info(f"bulk write: {n} rows to {table} in {time.perf_counter() - t0:.2f}s")
+
+    ranges = {d[0]: (d[1], d[2]) for d in deletes[True]}
+    for factor_name, parts in by_factor.items():
+        factor_store.write_factor(conn, factor_name, pd.concat(parts, ignore_index=True),
+                                 versions[factor_name], ranges.get(factor_name))
+    notify_factor_changed(conn, changed)
+
+    for r in results:
+        if r["ok"] and r.get("lineage"):
+            inputs, outputs, declared = r["lineage"]
+            LineageRecorder(inputs=inputs, outputs=outputs).persist(conn, declared)
+    return written
+
+
+# ── driver ─────────────────────────────────────────────────
+
+def _load_tasks(conn, factor_names: list[str] | None, scripts: list[str] | None) -> list[dict]:
+    tasks = []
+    if scripts:
+        for path in scripts:
+            with open(path, encoding="utf-8") as f:
+                tasks.append({"name": os.path.splitext(os.path.basename(path))[0], "code": f.read(),
+                              "path": os.path.abspath(path)})
+    else:
+        with conn.cursor() as cur:
+            if factor_names:
+                cur.execute("SELECT factor_name, python_code FROM factors.metadata WHERE factor_name = ANY(%s)",
+                            (factor_names,))
+            else:
+                cur.execute("SELECT factor_name, python_code FROM factors.metadata ORDER BY factor_name")
+            rows = cur.fetchall()
+        missing = set(factor_names or ()) - {r[0] for r in rows}
+        if missing:
+            raise ValueError(f"Unknown factors (not in factors.metadata): {sorted(missing)}")
+        tasks = [{"name": name, "code": code} for name, code in rows]
+    for i, t in enumerate(tasks):
+        t["index"] = i
+    return tasks
+
+
+def run_batch(
+    factor_names: list[str] | None = None,
+    scripts: list[str] | None = None,
+    preload_tables: list[str] | None = None,
+    jobs: int = 4,
+    start: str | None = None,
+    limits: dict | None = None,
+) -> list[dict]:
+    """
+    Run factor scripts (from factors.metadata, or files via `scripts`) over
+    shared inputs and write all outputs in bulk. Returns the per-factor report.
+    """
+    from sandbox import default_limits
+
+    limits = {**default_limits(), **(limits or {})}
+    workdir = tempfile.mkdtemp(prefix="factor_batch_")
+    conn = get_conn()
+    try:
+        tasks = _load_tasks(conn, factor_names, scripts)
+        for t in tasks:
+            t["start"] = start
+        tables, panels = _inputs_for(conn, [t["name"] for t in tasks])
+        tables |= set(preload_tables or ())
+
+        t0 = time.perf_counter()
+        # incremental scripts read from start minus the lookback (factor_namespace._default_start)
+        since = None
+        if start:
+            lookback = int(os.getenv("FACTOR_LOOKBACK_DAYS", "365"))
+            since = (pd.Timestamp(start) - pd.Timedelta(days=lookback)).strftime("%Y-%m-%d")
+        inputs = preload(conn, tables, panels, since)
+        load_s = time.perf_counter() - t0
+        conn.rollback()                     # no open transaction across fork
+
+        t0 = time.perf_counter()
+        results = _run_workers(tasks, inputs, limits, jobs, workdir)
+        run_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        written = _bulk_write(conn, results)
+        write_s = time.perf_counter() - t0
+    finally:
+        put_conn(conn)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = []
+    for r in sorted(results, key=lambda r: r["name"]):
+        peak, base_rss = r.get("peak_rss_mb"), r.get("rss_start_mb")
+        report.append({
+            "factor":       r["name"],
+            "status":       "ok" if r["ok"] else "failed",
+            "runtime_s":    round(r.get("runtime_s", 0.0), 3),
+            "peak_rss_mb":  round(peak, 1) if peak is not None else None,
+            "own_rss_mb":   round(peak - base_rss, 1) if peak is not None and base_rss is not None else None,
+            "rows":         sum(o["rows"] for o in r["outputs"]),
+            "error":        r.get("error"),
+        })
+    logger.info(
+        f"batch: {len(tasks)} scripts, inputs loaded once in {load_s:.2f}s, "
+        f"run {run_s:.2f}s, bulk write {write_s:.2f}s, {written}"
+    )
+    return report
+
+
+def _print_report(report: list[dict]) -> None:
+    print(f"{'factor':<32}{'status':<8}{'runtime_s':>10}{'peak_rss_mb':>13}{'own_rss_mb':>12}{'rows':>10}")
+    for r in report:
+        fmt = lambda v: "-" if v is None else v     # noqa: E731
+        print(f"{r['factor']:<32}{r['status']:<8}{r['runtime_s']:>10}{fmt(r['peak_rss_mb']):>13}"
+              f"{fmt(r['own_rss_mb']):>12}{r['rows']:>10}")
+        if r["error"]:
+            print(f"    {r['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many factor scripts over shared inputs")
+    parser.add_argument("--factors", default="", help="comma-separated factors from factors.metadata (default: all)")
+    parser.add_argument("--scripts", default="", help="comma-separated script files instead of stored factors")
+    parser.add_argument("--preload", default="", help="extra processed tables to load once, comma-separated")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--start", default=None, help="incremental run: write rows from this date on")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    add_limit_args(parser)
+    args = parser.parse_args()
+
+    split = lambda v: [x.strip() for x in v.split(",") if x.strip()] or None     # noqa: E731
+    try:
+        report = run_batch(split(args.factors), split(args.scripts), split(args.preload),
+                           args.jobs, args.start, limits_from_args(args))
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    if any(r["status"] != "ok" for r in report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
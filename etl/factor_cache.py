@@ -0,0 +1,187 @@
+"""
+In-memory result cache for the factor read routes of query_service.py.
+
+Researchers flip between the same factor / date range / asset combinations
+over and over; each of those used to be a full database (or Parquet) round
+trip plus JSON encoding. ResultCache keeps the encoded JSON responses in an
+LRU bounded by QUERY_CACHE_MB, keyed by the normalized query, and tags every
+entry with the factor it was read from ("*" for responses that span all
+factors, e.g. /factors/list).
+
+Invalidation is per factor and driven by the writers: save_factor_values,
+save_factor_metadata and factor_batch's bulk write call
+notify_factor_changed(), which issues
+
+    NOTIFY factor_changed, '<factor_name>'
+
+once the write is committed. FactorChangeListener holds a dedicated
+LISTEN connection in the query service and drops every entry tagged with
+that factor (and every "*" entry). A read that was already running when the
+notification arrived is not stored, so a result computed from pre-write data
+can never be cached after the invalidation that should have removed it.
+
+The cache is only consulted while the listener is connected; on (re)connect
+it starts empty, since notifications sent while disconnected are lost.
+Writes that bypass these functions (manual SQL) can flush the cache with
+SELECT pg_notify('factor_changed', '<factor_name>') or '*' for everything.
+"""
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+
+from config import DB_DSN
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "factor_changed"
+ALL = "*"
+
+
+def notify_factor_changed(conn, factor_names) -> None:
+    """Tell running query services that these factors were rewritten (delivered on commit)."""
+    names = sorted({n for n in factor_names if n})
+    if not names:
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_notify(%s, name) FROM unnest(%s::text[]) AS name", (CHANNEL, names))
+    conn.commit()
+
+
+class ResultCache:
+    """Byte-bounded LRU of encoded responses with per-tag invalidation."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.enabled = False
+        self._entries: OrderedDict = OrderedDict()     # key -> (tag, payload)
+        self._by_tag: dict[str, set] = {}
+        self._generation: dict[str, int] = {}
+        self._epoch = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def token(self, tag: str) -> tuple:
+        """Snapshot taken before running a query; put() refuses the result if it went stale meanwhile."""
+        with self._lock:
+            return self._epoch, self._generation.get(tag, 0), self._generation.get(ALL, 0)
+
+    def get(self, key) -> bytes | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, tag: str, payload: bytes, token: tuple) -> bool:
+        if not self.enabled or len(payload) > self.max_bytes:
+            return False
+        with self._lock:
+            if token != (self._epoch, self._generation.get(tag, 0), self._generation.get(ALL, 0)):
+                return False
+            self._drop(key)
+            self._entries[key] = (tag, payload)
+            self._by_tag.setdefault(tag, set()).add(key)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, factor_name: str) -> int:
+        """Drop entries read from factor_name and all cross-factor entries; '*' or '' clears everything."""
+        if not factor_name or factor_name == ALL:
+            return self.clear()
+        with self._lock:
+            self._generation[factor_name] = self._generation.get(factor_name, 0) + 1
+            self._generation[ALL] = self._generation.get(ALL, 0) + 1
+            keys = self._by_tag.pop(factor_name, set()) | self._by_tag.pop(ALL, set())
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._entries)
+            self._epoch += 1
+            self._entries.clear()
+            self._by_tag.clear()
+            self._bytes = 0
+            return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled, "entries": len(self._entries), "bytes": self._bytes,
+                "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            }
+
+    def _drop(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        tag, payload = entry
+        self._bytes -= len(payload)
+        keys = self._by_tag.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_tag[tag]
+
+
+class FactorChangeListener(threading.Thread):
+    """LISTEN factor_changed on a dedicated connection and invalidate the cache per notification."""
+
+    RECONNECT_S = 5
+    KEEPALIVE_S = 30
+
+    def __init__(self, cache: ResultCache, dsn: str = DB_DSN):
+        super().__init__(name="factor-change-listener", daemon=True)
+        self.cache = cache
+        self.dsn = dsn
+        self.connected = threading.Event()
+
+    def run(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                self.cache.clear()          # anything cached before this point may have missed a notification
+                self.cache.enabled = True
+                self.connected.set()
+                logger.info(f"factor cache: listening on '{CHANNEL}'")
+                self._listen(conn)
+            except Exception as e:
+                logger.warning(f"factor cache: listener disconnected ({type(e).__name__}: {e}), "
+                               f"cache disabled, retrying in {self.RECONNECT_S}s")
+            finally:
+                self.cache.enabled = False
+                self.connected.clear()
+                self.cache.clear()
+                if conn is not None:
+                    conn.close()
+            time.sleep(self.RECONNECT_S)
+
+    def _listen(self, conn):
+        while True:
+            ready, _, _ = select.select([conn], [], [], self.KEEPALIVE_S)
+            if not ready:
+                with conn.cursor() as cur:      # detect a silently dropped connection
+                    cur.execute("SELECT 1")
+            conn.poll()
+            while conn.notifies:
+                name = conn.notifies.pop(0).payload
+                n = self.cache.invalidate(name)
+                logger.info(f"factor cache: '{name or ALL}' changed, dropped {n} entries")
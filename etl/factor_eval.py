@@ -0,0 +1,273 @@
+"""
+Vectorized factor evaluation: IC, rank IC, IC decay, quantile returns, turnover.
+
+Factor panels from factors.asset_values are aligned with forward returns
+derived from backward-adjusted raw.daily_prices closes; every statistic is
+computed as NumPy operations over the whole (date x asset) panel, never
+per-date loops.
+Prices and forward returns are loaded once per sweep and shared by all
+factors, so scoring hundreds of factors costs one price read plus one
+factor read each. Results go to factors.evaluation (one row per
+factor x horizon; the horizons together form the IC decay curve).
+
+Usage:
+    python etl/factor_eval.py --factors mom_20,value_ep --horizons 1,5,10,20
+    python etl/factor_eval.py                      # every factor in factors.metadata
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import traceback
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from base import get_conn, put_conn, upsert
+from panel import align, load_factor_panel, load_price_panel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZONS = (1, 5, 10, 20)
+
+
+# ── panel statistics ───────────────────────────────────────
+
+def forward_returns(prices: np.ndarray, horizon: int) -> np.ndarray:
+    """Simple return from t to t+horizon rows; the last `horizon` rows are NaN."""
+    out = np.full(prices.shape, np.nan)
+    if horizon < len(prices):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[:-horizon] = prices[horizon:] / prices[:-horizon] - 1.0
+    return out
+
+
+def rank_rows(x: np.ndarray) -> np.ndarray:
+    """Average ranks (1..n) within each row, ignoring NaN."""
+    return pd.DataFrame(x).rank(axis=1, method="average").to_numpy()
+
+
+def row_corr(x: np.ndarray, y: np.ndarray, min_obs: int = 3) -> np.ndarray:
+    """Pearson correlation of x and y within each row over jointly valid cells."""
+    m = ~(np.isnan(x) | np.isnan(y))
+    n = m.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mx = np.where(m, x, 0.0).sum(axis=1) / n
+        my = np.where(m, y, 0.0).sum(axis=1) / n
+        dx = np.where(m, x - mx[:, None], 0.0)
+        dy = np.where(m, y - my[:, None], 0.0)
+        r = (dx * dy).sum(axis=1) / np.sqrt((dx * dx).sum(axis=1) * (dy * dy).sum(axis=1))
+    r[n < min_obs] = np.nan
+    return r
+
+
+def quantile_labels(x: np.ndarray, n_quantiles: int, ranks: np.ndarray | None = None) -> np.ndarray:
+    """
+    Per-row quantile bucket 0..n_quantiles-1 (low to high); -1 where x is NaN
+    or the row is too thin. Pass `ranks` (rank_rows(x)) to reuse a ranking.
+    """
+    if ranks is None:
+        ranks = rank_rows(x)
+    count = (~np.isnan(x)).sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        q = np.floor((ranks - 1) * n_quantiles / count)
+    labels = np.where(np.isnan(q), -1, q).astype(np.int64)
+    labels[(count < n_quantiles).ravel()] = -1
+    return labels
+
+
+def quantile_returns(labels: np.ndarray, returns: np.ndarray, n_quantiles: int) -> np.ndarray:
+    """Equal-weight mean return of each quantile per row -> (n_dates, n_quantiles)."""
+    valid = ~np.isnan(returns)
+    r0 = np.where(valid, returns, 0.0)
+    out = np.full((len(labels), n_quantiles), np.nan)
+    for k in range(n_quantiles):
+        sel = (labels == k) & valid
+        cnt = sel.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[:, k] = np.where(cnt > 0, (r0 * sel).sum(axis=1) / cnt, np.nan)
+    return out
+
+
+def top_quantile_turnover(labels: np.ndarray, n_quantiles: int) -> np.ndarray:
+    """Share of the top quantile replaced from one date to the next."""
+    top = labels == n_quantiles - 1
+    kept = (top[1:] & top[:-1]).sum(axis=1)
+    size = top[1:].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        turnover = np.where(size > 0, 1.0 - kept / size, np.nan)
+    return np.concatenate([[np.nan], turnover])
+
+
+def _summary(series: np.ndarray) -> tuple[float, float, float, float, int]:
+    s = series[~np.isnan(series)]
+    n = len(s)
+    if n < 2:
+        return (float(s.mean()) if n else np.nan), np.nan, np.nan, np.nan, n
+    mean, std = float(s.mean()), float(s.std(ddof=1))
+    ir = mean / std if std > 0 else np.nan
+    return mean, std, ir, ir * np.sqrt(n), n
+
+
+def evaluate_factor(
+    factor: np.ndarray,
+    fwd: dict[int, np.ndarray],
+    n_quantiles: int = 5,
+) -> list[dict]:
+    """
+    Score one factor matrix against precomputed forward-return matrices
+    (same date x asset grid). Returns one metrics dict per horizon.
+    """
+    # all-NaN rows (holidays, thin history) are expected; nan-reductions over
+    # them warn but correctly yield NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return _evaluate(factor, fwd, n_quantiles)
+
+
+def _evaluate(factor: np.ndarray, fwd: dict[int, np.ndarray], n_quantiles: int) -> list[dict]:
+    f_rank = rank_rows(factor)
+    labels_all = quantile_labels(factor, n_quantiles, f_rank)
+    turnover = np.nanmean(top_quantile_turnover(labels_all, n_quantiles))
+    rank_autocorr = np.nanmean(row_corr(f_rank[1:], f_rank[:-1])) if len(factor) > 1 else np.nan
+
+    results = []
+    for h, ret in fwd.items():
+        joint = ~(np.isnan(factor) | np.isnan(ret))
+        f_j = np.where(joint, factor, np.nan)
+        r_j = np.where(joint, ret, np.nan)
+
+        ic = row_corr(f_j, r_j)
+        f_j_rank = rank_rows(f_j)
+        rank_ic = row_corr(f_j_rank, rank_rows(r_j))
+        labels = quantile_labels(f_j, n_quantiles, f_j_rank)
+        q_ret = np.nanmean(quantile_returns(labels, r_j, n_quantiles), axis=0)
+
+        ic_mean, ic_std, icir, ic_t, n_dates = _summary(ic)
+        ric_mean, ric_std, ric_ir, _, _ = _summary(rank_ic)
+        results.append({
+            "horizon":          h,
+            "n_dates":          n_dates,
+            "ic_mean":          ic_mean,
+            "ic_std":           ic_std,
+            "icir":             icir,
+            "ic_tstat":         ic_t,
+            "rank_ic_mean":     ric_mean,
+            "rank_ic_std":      ric_std,
+            "rank_icir":        ric_ir,
+            "quantile_returns": [None if np.isnan(v) else float(v) for v in q_ret],
+            "long_short":       float(q_ret[-1] - q_ret[0]),
+            "turnover":         float(turnover),
+            "rank_autocorr":    float(rank_autocorr),
+        })
+    return results
+
+
+# ── sweep ──────────────────────────────────────────────────
+
+def _list_factors(conn) -> list[str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT factor_name FROM factors.metadata ORDER BY factor_name")
+        return [r[0] for r in cur.fetchall()]
+
+
+def _clean(v):
+    if isinstance(v, float) and not np.isfinite(v):
+        return None
+    return v
+
+
+def _save(conn, factor_name: str, start: str | None, end: str | None, metrics: list[dict]) -> int:
+    evaluated_at = datetime.now()
+    rows = [
+        {
+            "factor_name": factor_name,
+            "start_date":  start,
+            "end_date":    end,
+            **{k: _clean(v) for k, v in m.items() if k != "quantile_returns"},
+            "quantile_returns": json.dumps(m["quantile_returns"]),
+            "evaluated_at":     evaluated_at,
+        }
+        for m in metrics
+    ]
+    cols = [c for c in rows[0] if c not in ("factor_name", "horizon")]
+    return upsert(conn, "factors.evaluation", rows, ["factor_name", "horizon"], cols)
+
+
+def evaluate_factors(
+    factor_names: list[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    horizons: tuple[int, ...] = DEFAULT_HORIZONS,
+    n_quantiles: int = 5,
+    save: bool = True,
+) -> dict[str, list[dict]]:
+    """
+    Evaluate many factors in one sweep. Prices and forward returns are loaded
+    and computed once; each factor is then one read plus matrix operations.
+    Returns {factor_name: [metrics per horizon]}.
+    """
+    results: dict[str, list[dict]] = {}
+    conn = get_conn()
+    try:
+        names = factor_names or _list_factors(conn)
+        # forward returns near `end` need prices past it, so no upper bound here
+        prices, dates, codes = load_price_panel(conn, "close", start=start, adjust="backward")
+        fwd = {h: forward_returns(prices, h) for h in horizons}
+        if end:
+            keep = dates <= np.datetime64(end, "D")
+            dates = dates[keep]
+            fwd = {h: r[keep] for h, r in fwd.items()}
+        logger.info(f"Price panel {len(dates)} dates x {len(codes)} assets; evaluating {len(names)} factors")
+
+        for name in names:
+            try:
+                fmat, fdates, fcodes = load_factor_panel(conn, name, start, end)
+                if fmat.size == 0:
+                    logger.warning(f"{name}: no values in factors.asset_values, skipped")
+                    continue
+                factor = align(fmat, fdates, fcodes, dates, codes)
+                metrics = evaluate_factor(factor, fwd, n_quantiles)
+                results[name] = metrics
+                if save:
+                    _save(conn, name, start, end, metrics)
+                head = metrics[0]
+                logger.info(
+                    f"{name}: IC={head['ic_mean']:.4f} rankIC={head['rank_ic_mean']:.4f} "
+                    f"(h={head['horizon']}) turnover={head['turnover']:.2%}"
+                )
+            except Exception as e:
+                logger.error(f"{name}: evaluation failed: {e}")
+    finally:
+        put_conn(conn)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized factor evaluation")
+    parser.add_argument("--factors", default="", help="comma-separated factor names (default: all)")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--horizons", default=",".join(map(str, DEFAULT_HORIZONS)))
+    parser.add_argument("--quantiles", type=int, default=5)
+    parser.add_argument("--no-save", action="store_true", help="print results without writing factors.evaluation")
+    args = parser.parse_args()
+
+    names = [f.strip() for f in args.factors.split(",") if f.strip()] or None
+    horizons = tuple(int(h) for h in args.horizons.split(",") if h.strip())
+    try:
+        results = evaluate_factors(names, args.start, args.end, horizons, args.quantiles, save=not args.no_save)
+        cleaned = {n: [{k: _clean(v) for k, v in m.items()} for m in ms] for n, ms in results.items()}
+        print(json.dumps(cleaned, ensure_ascii=False, indent=2))
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
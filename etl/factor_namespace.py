@@ -1,51 +1,252 @@
 """
 Pre-built namespace for factor generation scripts.
 Provides database helpers and common libraries.
+
+Every load_* helper records the source it reads and save_factor_values
+records what it writes (see lineage.py); the sandbox worker persists that
+lineage after a successful run. Scripts may also declare extra inputs with
+DEPENDS_ON = ["processed:<table>", "factor:<name>"].
+
+When factor_scheduler.py runs a script incrementally it sets
+FACTOR_COMPUTE_START: loads without an explicit start then begin
+FACTOR_LOOKBACK_DAYS earlier, and save_factor_values only writes rows on or
+after COMPUTE_START.
 """
-from base import get_conn, put_conn, upsert
+import os
+import time
+
+from base import copy_query, copy_upsert, get_conn, put_conn, upsert
+import factor_store
+from factor_cache import notify_factor_changed
+from lineage import LineageRecorder
+from operators import OPERATORS
+from panel import load_panel as _load_panel
 import psycopg2
 import numpy as np
 import pandas as pd
 
-def load_processed_data(conn, table: str, start_date: str = None, end_date: str = None) -> pd.DataFrame:
-    """Load data from processed.* schema."""
+COMPUTE_START = os.getenv("FACTOR_COMPUTE_START") or None
+LOOKBACK_DAYS = int(os.getenv("FACTOR_LOOKBACK_DAYS", "365"))
+
+_lineage = LineageRecorder()
+
+# Set by factor_batch.py inside its workers: tables loaded once by the parent
+# ({table: (DataFrame, {lineage name: watermark}, since)}, see factor_batch.preload)
+# and a list collecting save_factor_values output for one bulk write instead
+# of writing directly.
+_preloaded: dict[str, tuple[pd.DataFrame, dict[str, dict], str | None]] = {}
+_captured: list | None = None
+
+def _default_start(start):
+    """Explicit start wins; otherwise an incremental run reads from COMPUTE_START minus the lookback."""
+    if start or not COMPUTE_START:
+        return start
+    return (pd.Timestamp(COMPUTE_START) - pd.Timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+
+_DATE_COLUMNS = ("trade_date", "obs_date")
+_date_columns: dict[str, str | None] = {}
+
+def _date_column(conn, table: str) -> str | None:
+    """The date column of processed.<table> (trade_date or obs_date), looked up once per table."""
+    if table not in _date_columns:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT column_name FROM information_schema.columns"
+                " WHERE table_schema = 'processed' AND table_name = %s AND column_name = ANY(%s)",
+                (table, list(_DATE_COLUMNS)),
+            )
+            found = {r[0] for r in cur.fetchall()}
+        _date_columns[table] = next((c for c in _DATE_COLUMNS if c in found), None)
+    return _date_columns[table]
+
+def _source_names(table: str, filters: dict, df: pd.DataFrame) -> list[str]:
+    """Lineage names of a processed read: one per feature_series series (requested or returned), else the table."""
+    if table != "feature_series":
+        return [table]
+    if len(filters) == 2:
+        return [f"feature_series/{filters['target_type']}/{filters['transform_method']}"]
+    if df.empty or not {"target_type", "transform_method"} <= set(df.columns):
+        return []
+    pairs = df[["target_type", "transform_method"]].drop_duplicates().itertuples(index=False)
+    return [f"feature_series/{t}/{m}" for t, m in pairs]
+
+def _served_from_memory(table: str, filters: dict, start_date: str | None) -> bool:
+    """Whether the preloaded rows of `table` cover this read (series and date window)."""
+    if table not in _preloaded:
+        return False
+    _, watermarks, since = _preloaded[table]
+    if since and (not start_date or start_date < since):
+        return False
+    if table != "feature_series" or table in watermarks:      # whole table loaded
+        return True
+    return len(filters) == 2 and f"feature_series/{filters['target_type']}/{filters['transform_method']}" in watermarks
+
+def load_processed_data(
+    conn,
+    table: str,
+    start_date: str = None,
+    end_date: str = None,
+    target_type: str = None,
+    transform_method: str = None,
+) -> pd.DataFrame:
+    """
+    Load data from processed.* schema; the date window applies to the table's
+    trade_date / obs_date. For feature_series, target_type / transform_method
+    narrow the read, and lineage records each series read rather than the
+    whole table.
+    """
+    start_date = _default_start(start_date)
+    filters = {k: v for k, v in (("target_type", target_type), ("transform_method", transform_method)) if v}
+    if filters and table != "feature_series":
+        raise ValueError("target_type / transform_method only apply to feature_series")
+
+    if _served_from_memory(table, filters, start_date):
+        df, watermarks, _ = _preloaded[table]
+        keep = pd.Series(True, index=df.index)
+        for col, value in filters.items():
+            keep &= df[col] == value
+        date_col = next((c for c in _DATE_COLUMNS if c in df.columns), None)
+        if date_col is not None and (start_date or end_date):
+            dates = pd.to_datetime(df[date_col])
+            if start_date:
+                keep &= dates >= pd.Timestamp(start_date)
+            if end_date:
+                keep &= dates <= pd.Timestamp(end_date)
+        out = df if keep.all() else df[keep]
+        for name in _source_names(table, filters, out):
+            _lineage.inputs.setdefault(f"processed:{name}", watermarks.get(name) or {"max_date": None, "version": None})
+        return out
+
     query = f"SELECT * FROM processed.{table}"
     conditions = []
     params = []
 
-    if start_date:
-        conditions.append("trade_date >= %s")
+    for col, value in filters.items():
+        conditions.append(f"{col} = %s")
+        params.append(value)
+    date_col = _date_column(conn, table) if start_date or end_date else None
+    if start_date and date_col:
+        conditions.append(f"{date_col} >= %s")
         params.append(start_date)
-    if end_date:
-        conditions.append("trade_date <= %s")
+    if end_date and date_col:
+        conditions.append(f"{date_col} <= %s")
         params.append(end_date)
 
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
 
-    return pd.read_sql(query, conn, params=params if params else None)
+    df = pd.read_sql(query, conn, params=params if params else None)
+    for name in _source_names(table, filters, df):
+        _lineage.record_input(conn, "processed", name)
+    return df
+
+def load_panel(
+    transform_method: str,
+    fields=("transformed_value",),
+    start: str = None,
+    end: str = None,
+    target_type: str = "asset",
+    conn=None,
+):
+    """Date x asset matrices of processed.feature_series (see panel.load_panel)."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+    try:
+        _lineage.record_input(conn, "processed", f"feature_series/{target_type}/{transform_method}")
+        return _load_panel(transform_method, fields, _default_start(start), end, target_type, conn)
+    finally:
+        if own_conn:
+            put_conn(conn)
+
+def load_factor_values(conn, factor_name: str, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+    """Load another factor from factors.asset_values -> columns asset_code, trade_date, value."""
+    _lineage.record_input(conn, "factor", factor_name)
+    start_date = _default_start(start_date)
+    sql = "SELECT asset_code, trade_date, value FROM factors.asset_values WHERE factor_name = %s"
+    params = [factor_name]
+    if start_date:
+        sql += " AND trade_date >= %s"
+        params.append(start_date)
+    if end_date:
+        sql += " AND trade_date <= %s"
+        params.append(end_date)
+    df = copy_query(conn, sql, params, dtype={"asset_code": str})
+    df["trade_date"] = pd.to_datetime(df["trade_date"])
+    return df
 
-def save_factor_values(conn, factor_name: str, df: pd.DataFrame, asset_level: bool = True):
+def save_factor_values(
+    conn,
+    factor_name: str,
+    df: pd.DataFrame,
+    asset_level: bool = True,
+    replace_range: tuple[str, str] | None = None,
+) -> int:
     """
     Save factor values to factors.values or factors.asset_values.
 
     df must have columns:
     - For asset-level: ['asset_code', 'trade_date', 'value']
     - For portfolio-level: ['trade_date', 'value']
+
+    The caller's DataFrame is not modified. Rows are streamed to Postgres
+    with COPY and upserted on the primary key. With replace_range=(start, end)
+    existing rows of this factor in that trade_date window are deleted first
+    (same transaction), so the window ends up holding exactly the new rows.
+    Asset-level rows are then mirrored to the Parquet factor store, and
+    running query services are told to drop their cached reads of this factor.
+    In an incremental run (COMPUTE_START set) rows before COMPUTE_START are
+    dropped, so the lookback history is never rewritten.
+    Returns the number of rows written.
     """
     if asset_level:
         table = "factors.asset_values"
-        df['factor_name'] = factor_name
-        rows = df[['factor_name', 'asset_code', 'trade_date', 'value']].to_dict('records')
+        columns = ['factor_name', 'asset_code', 'trade_date', 'value']
         conflict_cols = ['factor_name', 'asset_code', 'trade_date']
     else:
         table = "factors.values"
-        df['factor_name'] = factor_name
-        rows = df[['factor_name', 'trade_date', 'value']].to_dict('records')
+        columns = ['factor_name', 'trade_date', 'value']
         conflict_cols = ['factor_name', 'trade_date']
 
-    upsert(conn, table, rows, conflict_cols, ['value'])
-    print(f"✓ Saved {len(rows)} rows to {table}")
+    missing = set(columns[1:]) - set(df.columns)
+    if missing:
+        raise ValueError(f"save_factor_values: DataFrame is missing columns {sorted(missing)}")
+
+    if COMPUTE_START and replace_range is None:
+        df = df[pd.to_datetime(df['trade_date']) >= pd.Timestamp(COMPUTE_START)]
+
+    if _captured is not None:
+        _captured.append((factor_name, df, asset_level, replace_range))
+        through = pd.to_datetime(df['trade_date']).max() if len(df) else None
+        _lineage.record_output(factor_name, str(through.date()) if through is not None else None)
+        print(f"✓ Captured {len(df)} rows for {factor_name} (batch write)")
+        return len(df)
+
+    delete_where = delete_params = None
+    if replace_range is not None:
+        delete_where = "factor_name = %s AND trade_date BETWEEN %s AND %s"
+        delete_params = (factor_name, replace_range[0], replace_range[1])
+
+    t0 = time.perf_counter()
+    # same transaction as the write below; copy_upsert commits or rolls back both
+    version = factor_store.bump_versions(conn, [factor_name])[factor_name] if asset_level else None
+    n = copy_upsert(
+        conn, table, df, columns,
+        conflict_cols=conflict_cols,
+        update_cols=['value'],
+        constants={'factor_name': factor_name},
+        delete_where=delete_where,
+        delete_params=delete_params,
+    )
+    elapsed = time.perf_counter() - t0
+    rate = n / elapsed if elapsed > 0 else float(n)
+    print(f"✓ Saved {n} rows to {table} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    if asset_level:
+        factor_store.write_factor(conn, factor_name, df, version, replace_range)
+    notify_factor_changed(conn, [factor_name])
+    through = pd.to_datetime(df['trade_date']).max() if len(df) else None
+    _lineage.record_output(factor_name, str(through.date()) if through is not None else None)
+    return n
 
 def save_factor_metadata(conn, factor_name: str, description: str, python_code: str, source_paper: str = None):
     """Save factor metadata."""
@@ -59,12 +260,23 @@ def save_factor_metadata(conn, factor_name: str, description: str, python_code:
                 source_paper = EXCLUDED.source_paper,
                 updated_at = NOW()
         """, (factor_name, description, python_code, source_paper))
-    conn.commit()
+    notify_factor_changed(conn, [factor_name])     # commits the upsert and the notification together
     print(f"✓ Saved metadata for factor '{factor_name}'")
 
+def persist_lineage(declared=()) -> None:
+    """Write the lineage recorded during this run (called by the sandbox worker)."""
+    if not _lineage.outputs:
+        return
+    conn = get_conn()
+    try:
+        _lineage.persist(conn, list(declared))
+    finally:
+        put_conn(conn)
+
 def build_namespace():
     """Build the execution namespace for factor scripts."""
     return {
+        **OPERATORS,
         'get_conn': get_conn,
         'put_conn': put_conn,
         'upsert': upsert,
@@ -72,6 +284,9 @@ def build_namespace():
         'np': np,
         'pd': pd,
         'load_processed_data': load_processed_data,
+        'load_panel': load_panel,
+        'load_factor_values': load_factor_values,
+        'COMPUTE_START': COMPUTE_START,
         'save_factor_values': save_factor_values,
         'save_factor_metadata': save_factor_metadata,
     }
@@ -0,0 +1,310 @@
+"""
+Read paths for factor data used by the web server (/api/factors/*).
+
+Asset-level values (factors.asset_values) come from the Parquet mirror
+(factor_store.py) when it is in sync, otherwise straight from Postgres via
+COPY; market-level values (factors.values, --level market) always come from
+Postgres. Output is JSON on stdout; values are JSON numbers (null for NaN).
+
+Two ways to keep chart payloads small:
+  - downsampling: each asset's series is reduced to at most max_points
+    points, by LTTB (largest-triangle-three-buckets, keeps the visual shape)
+    or minmax (each bucket's low and high, keeps every extreme)
+  - keyset pagination: rows ordered by (trade_date, asset_code), `limit`
+    rows per page, continuing after the cursor "<trade_date>|<asset_code>"
+    returned with the previous page (an index range scan, never OFFSET)
+
+Usage:
+    python etl/factor_query.py list
+    python etl/factor_query.py data --factor mom_20 [--start 2024-01-01] [--end 2024-12-31] [--codes 600000.SH,000001.SZ]
+    python etl/factor_query.py data --factor mom_20 --codes 600000.SH --max-points 500 --downsample lttb
+    python etl/factor_query.py data --factor mom_20 --limit 5000 [--after "2024-03-01|600000.SH"]
+    python etl/factor_query.py data --factor market_breadth --level market --max-points 500
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+import factor_store
+from base import copy_query, get_conn, put_conn
+
+logger = logging.getLogger(__name__)
+
+
+def list_factors(conn) -> list[dict]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT factor_name, description, source_paper, created_at"
+            " FROM factors.metadata ORDER BY created_at DESC"
+        )
+        rows = cur.fetchall()
+    return [{"name": r[0], "description": r[1], "source": r[2], "created": str(r[3])} for r in rows]
+
+
+def parse_cursor(cursor: str | None) -> tuple[str, str] | None:
+    """'2024-03-01|600000.SH' -> ('2024-03-01', '600000.SH'); market-level cursors are just the date."""
+    if not cursor:
+        return None
+    day, _, code = cursor.partition("|")
+    if not day:
+        raise ValueError(f"Invalid cursor {cursor!r}; expected '<trade_date>|<asset_code>'")
+    return str(pd.Timestamp(day).date()), code
+
+
+def query_factor_data(
+    conn,
+    factor_name: str,
+    start: str | None = None,
+    end: str | None = None,
+    asset_codes: list[str] | None = None,
+    after: tuple[str, str] | None = None,
+    limit: int | None = None,
+) -> tuple[pd.DataFrame, str]:
+    """
+    One factor's values as asset_code / trade_date / value sorted by
+    (trade_date, asset_code). `after` / `limit` select one keyset page:
+    rows strictly after the (trade_date, asset_code) cursor, at most limit.
+    Returns (df, source) with source 'parquet' or 'postgres'.
+    """
+    if factor_store.is_fresh(conn, factor_name):
+        df = factor_store.read_factor(factor_name, start, end, asset_codes, after, limit)
+        return df, "parquet"
+
+    sql = "SELECT asset_code, trade_date, value FROM factors.asset_values WHERE factor_name = %s"
+    params: list = [factor_name]
+    if start:
+        sql += " AND trade_date >= %s"
+        params.append(start)
+    if end:
+        sql += " AND trade_date <= %s"
+        params.append(end)
+    if asset_codes:
+        sql += " AND asset_code = ANY(%s)"
+        params.append(list(asset_codes))
+    # byte order of asset_code, the order of the Parquet mirror (idx_factors_asset_values_keyset_c)
+    if after:
+        sql += ' AND (trade_date, asset_code COLLATE "C") > (%s::date, %s)'
+        params += list(after)
+    sql += ' ORDER BY trade_date, asset_code COLLATE "C"'
+    if limit:
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    df = copy_query(conn, sql, params, dtype={"asset_code": str})
+    df["trade_date"] = pd.to_datetime(df["trade_date"])
+    return df, "postgres"
+
+
+def query_market_values(
+    conn,
+    factor_name: str,
+    start: str | None = None,
+    end: str | None = None,
+    after: str | None = None,
+    limit: int | None = None,
+) -> pd.DataFrame:
+    """Market-level values from factors.values -> trade_date / value, optionally one keyset page after `after`."""
+    sql = "SELECT trade_date, value FROM factors.values WHERE factor_name = %s"
+    params: list = [factor_name]
+    if start:
+        sql += " AND trade_date >= %s"
+        params.append(start)
+    if end:
+        sql += " AND trade_date <= %s"
+        params.append(end)
+    if after:
+        sql += " AND trade_date > %s"
+        params.append(after)
+    sql += " ORDER BY trade_date"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    df = copy_query(conn, sql, params)
+    df["trade_date"] = pd.to_datetime(df["trade_date"])
+    return df
+
+
+def next_cursor(df: pd.DataFrame, limit: int | None) -> str | None:
+    """Cursor of the page after df, or None when df was the last page."""
+    if not limit or len(df) < limit:
+        return None
+    last = df.iloc[-1]
+    day = f"{last['trade_date']:%Y-%m-%d}"
+    return f"{day}|{last['asset_code']}" if last["asset_code"] else day
+
+
+# ── downsampling ───────────────────────────────────────────
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-triangle-three-buckets: indices of n_out points of (x, y) that
+    preserve the visual shape. First and last points are always kept, so a
+    budget of 1 or 2 gives just those.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i == n_out - 3:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            nxt = slice(edges[i + 1], edges[i + 2])
+            avg_x, avg_y = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax_buckets(group: np.ndarray, position: np.ndarray, y: np.ndarray, n_buckets: np.ndarray) -> np.ndarray:
+    """
+    For rows sorted by (group, x): indices of the lowest and highest y in each
+    of n_buckets[group] equal-count buckets per group, in x order, plus every
+    group's first and last row. Vectorized over all groups at once.
+    """
+    size = np.bincount(group)
+    bucket = (position * n_buckets[group] // size[group]).astype(np.int64)
+    key = group.astype(np.int64) * (int(n_buckets.max()) + 1) + bucket
+    order = np.lexsort((y, key))
+    k = key[order]
+    first = np.r_[True, k[1:] != k[:-1]]
+    last = np.r_[k[1:] != k[:-1], True]
+    ends = np.r_[True, group[1:] != group[:-1]] | np.r_[group[1:] != group[:-1], True]
+    return np.unique(np.concatenate([order[first], order[last], np.flatnonzero(ends)]))
+
+
+def downsample(df: pd.DataFrame, max_points: int, method: str = "lttb") -> pd.DataFrame:
+    """
+    Reduce each asset's series to about max_points rows (NaN values are
+    dropped first). Result is sorted by (trade_date, asset_code) like the input.
+    """
+    if method not in ("lttb", "minmax"):
+        raise ValueError(f"Unknown downsampling method {method!r}; use lttb or minmax")
+    df = df[df["value"].notna()]
+    if df.empty or max_points <= 0:
+        return df.reset_index(drop=True)
+    df = df.sort_values(["asset_code", "trade_date"], kind="stable", ignore_index=True)
+    codes = df["asset_code"].to_numpy()
+    x = df["trade_date"].to_numpy(dtype="datetime64[D]").astype(np.int64).astype("float64")
+    y = df["value"].to_numpy(dtype="float64")
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    bounds = np.r_[starts, len(df)]
+
+    if method == "lttb":
+        keep = np.concatenate([
+            lo + lttb(x[lo:hi], y[lo:hi], max_points) for lo, hi in zip(bounds[:-1], bounds[1:])
+        ])
+    else:
+        sizes = np.diff(bounds)
+        group = np.repeat(np.arange(len(starts)), sizes)
+        position = np.arange(len(df)) - np.repeat(starts, sizes)
+        n_buckets = np.maximum(np.minimum(max_points // 2, sizes), 1)
+        keep = minmax_buckets(group, position, y, n_buckets)
+    out = df.iloc[keep]
+    return out.sort_values(["trade_date", "asset_code"], kind="stable", ignore_index=True)
+
+
+def _records(factor_name: str, df: pd.DataFrame) -> list[dict]:
+    """Row dicts for /api/factors/data; values are floats (None for NaN), asset_code None at market level."""
+    dates = df["trade_date"].dt.strftime("%Y-%m-%d").tolist()
+    values = df["value"].astype("float64")
+    values = values.astype(object).where(values.notna(), None).tolist()
+    return [
+        {"factor_name": factor_name, "asset_code": c or None, "trade_date": d, "value": v}
+        for c, d, v in zip(df["asset_code"].tolist(), dates, values)
+    ]
+
+
+def factor_data(
+    conn,
+    factor_name: str,
+    start: str | None = None,
+    end: str | None = None,
+    asset_codes: list[str] | None = None,
+    max_points: int | None = None,
+    method: str = "lttb",
+    after: str | None = None,
+    limit: int | None = None,
+    level: str = "asset",
+) -> dict:
+    """
+    The /api/factors/data payload: {"data", "source", "next_cursor",
+    "rows_scanned"}. max_points (downsampling) and limit / after (paging)
+    are mutually exclusive. level="market" reads factors.values instead of
+    factors.asset_values (asset_codes do not apply).
+    """
+    if max_points and (limit or after):
+        raise ValueError("Use either max_points (downsampling) or limit/after (pagination), not both")
+    cursor = parse_cursor(after)
+    if level == "asset":
+        df, source = query_factor_data(conn, factor_name, start, end, asset_codes, cursor, limit)
+    elif level == "market":
+        df = query_market_values(conn, factor_name, start, end, cursor[0] if cursor else None, limit)
+        df.insert(0, "asset_code", "")
+        source = "postgres"
+    else:
+        raise ValueError(f"Unknown level {level!r}; use asset or market")
+    scanned = len(df)
+    if max_points:
+        df = downsample(df, max_points, method)
+    return {
+        "data": _records(factor_name, df),
+        "source": source,
+        "next_cursor": next_cursor(df, limit),
+        "rows_scanned": scanned,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Factor data queries for the web server")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    p = sub.add_parser("data")
+    p.add_argument("--factor", required=True)
+    p.add_argument("--start", default=None)
+    p.add_argument("--end", default=None)
+    p.add_argument("--codes", default="", help="comma-separated asset codes")
+    p.add_argument("--max-points", type=int, default=None, help="downsample each asset to this many points")
+    p.add_argument("--downsample", default="lttb", choices=["lttb", "minmax"])
+    p.add_argument("--limit", type=int, default=None, help="page size (keyset pagination)")
+    p.add_argument("--after", default=None, help='cursor "<trade_date>|<asset_code>" from the previous page')
+    p.add_argument("--level", default="asset", choices=["asset", "market"],
+                   help="asset: factors.asset_values, market: factors.values")
+    args = parser.parse_args()
+
+    conn = get_conn()
+    try:
+        if args.cmd == "list":
+            result = list_factors(conn)
+        else:
+            codes = [c.strip() for c in args.codes.split(",") if c.strip()] or None
+            result = factor_data(
+                conn, args.factor, args.start, args.end, codes,
+                args.max_points, args.downsample, args.after, args.limit, args.level,
+            )
+            logger.info(f"{args.factor}: {len(result['data'])} of {result['rows_scanned']} rows from {result['source']}")
+        print(json.dumps(result, ensure_ascii=False, allow_nan=False))
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        put_conn(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,47 @@
 """
 Execute LLM-generated factor production scripts.
-Usage: python etl/factor_runner.py --script <path>
+Usage: python etl/factor_runner.py --script <path> [--start 2024-06-01] [--timeout 600] [--max-memory-mb 4096]
+
+The script runs in a sandbox.py worker subprocess with CPU / memory /
+wall-clock limits; runtime and peak RSS are reported on stderr. After a
+successful run the inputs it read and the factors it saved are recorded in
+factors.dependencies / factors.compute_state (see factor_scheduler.py).
+--start runs incrementally: only rows from that date on are written.
 
 Pre-built namespace includes:
 - get_conn / put_conn / upsert / psycopg2
 - numpy (np) / pandas (pd)
-- load_processed_data / save_factor_values / save_factor_metadata
+- load_processed_data / load_factor_values / save_factor_values / save_factor_metadata
+- load_panel (date x asset matrices from a shared mmap cache)
+- panel operators from operators.py: cs_rank / cs_zscore / winsorize / neutralize,
+  ts_delay / ts_delta / ts_sum / ts_mean / ts_std / ts_corr / ts_rank / decay_linear
 """
 import argparse
 import sys
-import traceback
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from factor_namespace import build_namespace
+from sandbox import add_limit_args, limits_from_args, run_script
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--script", required=True)
+    parser.add_argument("--start", default=None, help="incremental run: write rows from this date on")
+    add_limit_args(parser)
     args = parser.parse_args()
 
     if not os.path.isfile(args.script):
         print(f"[错误] 脚本文件不存在: {args.script}", file=sys.stderr)
         sys.exit(1)
 
-    with open(args.script, "r", encoding="utf-8") as f:
-        script_content = f.read()
-
-    ns = build_namespace()
-    try:
-        exec(compile(script_content, args.script, "exec"), ns)
-    except Exception:
-        traceback.print_exc()
-        sys.exit(1)
+    env = {"FACTOR_COMPUTE_START": args.start} if args.start else None
+    result = run_script(args.script, namespace="factor", limits=limits_from_args(args), env=env)
+    print(result.summary(), file=sys.stderr)
+    if not result.ok:
+        if result.error:
+            print(f"[错误] {result.error}", file=sys.stderr)
+        sys.exit(result.returncode if result.returncode > 0 else 1)
 
 if __name__ == "__main__":
     main()
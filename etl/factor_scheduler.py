@@ -0,0 +1,281 @@
+"""
+Incremental factor recompute driven by recorded lineage.
+
+Each factor's inputs (factors.dependencies) and the input watermarks it saw
+on its last run (factors.compute_state) are compared with the current
+watermarks (lineage.py):
+  - unchanged inputs                -> factor is clean, skipped
+  - an input only gained newer dates -> recompute from the first new date
+  - a feature_series series had older dates rewritten (its write log says
+    from which date)             -> recompute from that date
+  - anything else (updates / deletes in a processed table, new input,
+    never run)                   -> full recompute
+  - no recorded inputs              -> recompute after computed_through
+Dirtiness also propagates to downstream factors within the same run. Factor scripts
+(factors.metadata.python_code) then run in sandbox workers: a factor starts
+as soon as all of its upstream factors have finished, so independent
+branches run in parallel, and a failure skips everything downstream of it.
+
+Incremental runs pass FACTOR_COMPUTE_START / FACTOR_LOOKBACK_DAYS to the
+script (see factor_namespace): inputs are read from the start date minus the
+lookback and only rows from the start date on are written.
+
+Usage:
+    python etl/factor_scheduler.py --dry-run          # show what would run
+    python etl/factor_scheduler.py --jobs 4
+    python etl/factor_scheduler.py --factors mom_20 --full   # mom_20 and its dependents, full history
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from base import get_conn, put_conn
+from lineage import parse_source_key, revised_from, source_key, watermark
+from sandbox import add_limit_args, limits_from_args, run_script
+
+logger = logging.getLogger(__name__)
+
+FULL = None     # plan value meaning "recompute the whole history"
+
+
+# ── graph ──────────────────────────────────────────────────
+
+def load_graph(conn) -> tuple[dict[str, str], dict[str, set[str]], dict[str, dict]]:
+    """
+    Returns (code, deps, state):
+      code[factor]  -> python_code from factors.metadata
+      deps[factor]  -> set of source keys ('processed:...', 'factor:...')
+      state[factor] -> {"computed_through": str | None, "watermarks": {key: watermark}}
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT factor_name, python_code FROM factors.metadata")
+        code = dict(cur.fetchall())
+        cur.execute("SELECT factor_name, source_kind, source_name FROM factors.dependencies")
+        deps: dict[str, set[str]] = {name: set() for name in code}
+        for name, kind, source in cur.fetchall():
+            deps.setdefault(name, set()).add(source_key(kind, source))
+        cur.execute("SELECT factor_name, computed_through, input_watermarks FROM factors.compute_state")
+        state = {
+            name: {
+                "computed_through": str(through) if through else None,
+                "watermarks": (wm if isinstance(wm, dict) else json.loads(wm or "{}")),
+            }
+            for name, through, wm in cur.fetchall()
+        }
+    return code, deps, state
+
+
+def factor_parents(deps: dict[str, set[str]], known: set[str]) -> dict[str, set[str]]:
+    """Upstream factors of each factor, restricted to factors that can be run."""
+    parents = {}
+    for name in known:
+        ups = set()
+        for key in deps.get(name, ()):
+            kind, source = parse_source_key(key)
+            if kind == "factor" and source in known and source != name:
+                ups.add(source)
+        parents[name] = ups
+    return parents
+
+
+def topological_order(parents: dict[str, set[str]]) -> list[str]:
+    """Kahn's algorithm; raises on a dependency cycle."""
+    children: dict[str, set[str]] = {n: set() for n in parents}
+    indegree = {n: len(ups) for n, ups in parents.items()}
+    for n, ups in parents.items():
+        for u in ups:
+            children[u].add(n)
+    queue = sorted(n for n, d in indegree.items() if d == 0)
+    order = []
+    while queue:
+        n = queue.pop(0)
+        order.append(n)
+        for c in sorted(children[n]):
+            indegree[c] -= 1
+            if indegree[c] == 0:
+                queue.append(c)
+    if len(order) != len(parents):
+        cycle = sorted(n for n, d in indegree.items() if d > 0)
+        raise ValueError(f"Dependency cycle among factors: {cycle}")
+    return order
+
+
+# ── planning ───────────────────────────────────────────────
+
+def _merge_start(a, b):
+    """Combine two recompute starts: full history dominates, otherwise the earlier date."""
+    if a is FULL or b is FULL:
+        return FULL
+    return min(a, b)
+
+
+def _input_start(stored: dict | None, current: dict, revised: str | None = None) -> str | None | bool:
+    """
+    Recompute start implied by one input: False if unchanged; for a pure
+    append the first new date; `revised` (earliest date rewritten since the
+    stored watermark, feature_series only) when it falls within the dates
+    already computed; FULL for anything else, including updates or deletes
+    in a processed table.
+    """
+    if stored == current:
+        return False
+    if not stored or stored.get("rewrites") != current.get("rewrites"):
+        return FULL
+    old_max, new_max = stored.get("max_date"), current.get("max_date")
+    if revised is not None and old_max and revised <= old_max:
+        return revised
+    if old_max and new_max and new_max > old_max:
+        return (date.fromisoformat(old_max) + timedelta(days=1)).isoformat()
+    return FULL
+
+
+def plan(conn, factors: list[str] | None = None, full: bool = False) -> tuple[dict[str, str | None], dict[str, set[str]], dict[str, str]]:
+    """
+    Decide which factors to recompute. Returns (todo, parents, code) where
+    todo maps factor -> recompute start date (None = full history), in
+    topological order.
+    """
+    code, deps, state = load_graph(conn)
+    known = set(code)
+    parents = factor_parents(deps, known)
+    order = topological_order(parents)
+
+    current: dict[str, dict] = {}
+    for key in sorted({k for name in known for k in deps.get(name, ())}):
+        kind, source = parse_source_key(key)
+        current[key] = watermark(conn, kind, source)
+
+    revisions: dict[tuple[str, int | None], str | None] = {}
+
+    def _revised(key: str, stored: dict | None) -> str | None:
+        kind, source = parse_source_key(key)
+        if kind != "processed" or not source.startswith("feature_series/") or stored == current[key]:
+            return None
+        since = (stored or {}).get("write_version")
+        if (key, since) not in revisions:
+            revisions[key, since] = revised_from(conn, source, since)
+        return revisions[key, since]
+
+    todo: dict[str, str | None] = {}
+    selected = set(factors) if factors else known
+    unknown = selected - known
+    if unknown:
+        raise ValueError(f"Unknown factors (not in factors.metadata): {sorted(unknown)}")
+
+    for name in order:
+        start: str | None | bool = False
+        if name in selected:
+            st = state.get(name)
+            if full or st is None:
+                start = FULL
+            elif not deps.get(name):
+                # no tracked inputs to compare: only extend past what was computed
+                through = st["computed_through"]
+                start = (date.fromisoformat(through) + timedelta(days=1)).isoformat() if through else FULL
+            else:
+                for key in deps[name]:
+                    stored = st["watermarks"].get(key)
+                    s = _input_start(stored, current[key], _revised(key, stored))
+                    if s is not False:
+                        start = s if start is False else _merge_start(start, s)
+        for up in parents[name]:
+            if up in todo:
+                start = todo[up] if start is False else _merge_start(start, todo[up])
+        if start is not False:
+            todo[name] = start
+    return todo, parents, code
+
+
+# ── execution ──────────────────────────────────────────────
+
+def _run_one(name: str, python_code: str, start: str | None, lookback_days: int, limits: dict):
+    with tempfile.NamedTemporaryFile("w", suffix=f"_{name}.py", delete=False, encoding="utf-8") as f:
+        f.write(python_code)
+        path = f.name
+    try:
+        env = {"FACTOR_COMPUTE_START": start or "", "FACTOR_LOOKBACK_DAYS": str(lookback_days)}
+        return run_script(path, namespace="factor", limits=limits, env=env)
+    finally:
+        os.unlink(path)
+
+
+def run_plan(
+    todo: dict[str, str | None],
+    parents: dict[str, set[str]],
+    code: dict[str, str],
+    jobs: int = 4,
+    lookback_days: int = 365,
+    limits: dict | None = None,
+) -> dict[str, str]:
+    """
+    Run the planned factors; each starts once its upstream factors in the
+    plan have succeeded. Returns {factor: 'ok' | 'failed' | 'skipped'}.
+    """
+    status: dict[str, str] = {}
+    pending = list(todo)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                ups = parents[name] & set(todo)
+                if any(status.get(u) in ("failed", "skipped") for u in ups):
+                    status[name] = "skipped"
+                    pending.remove(name)
+                    logger.warning(f"{name}: skipped, an upstream factor failed")
+                elif all(status.get(u) == "ok" for u in ups):
+                    pending.remove(name)
+                    start = todo[name]
+                    logger.info(f"{name}: recompute {'from ' + start if start else 'full history'}")
+                    fut = pool.submit(_run_one, name, code[name], start, lookback_days, limits or {})
+                    running[fut] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    result = fut.result()
+                    ok, detail = result.ok, result.summary() + (f" {result.error}" if result.error else "")
+                except Exception as e:
+                    ok, detail = False, str(e)
+                status[name] = "ok" if ok else "failed"
+                (logger.info if ok else logger.error)(f"{name}: {detail}")
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental factor recompute")
+    parser.add_argument("--factors", default="", help="comma-separated factors to consider (their dependents follow)")
+    parser.add_argument("--full", action="store_true", help="recompute the whole history")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without running it")
+    parser.add_argument("--jobs", type=int, default=4, help="factor scripts run in parallel")
+    parser.add_argument("--lookback-days", type=int, default=365,
+                        help="calendar days of input history read before the recompute start")
+    add_limit_args(parser)
+    args = parser.parse_args()
+
+    names = [f.strip() for f in args.factors.split(",") if f.strip()] or None
+    conn = get_conn()
+    try:
+        todo, parents, code = plan(conn, names, full=args.full)
+    finally:
+        put_conn(conn)
+
+    print(json.dumps({n: (s or "full") for n, s in todo.items()}, indent=2))
+    if args.dry_run or not todo:
+        return
+    status = run_plan(todo, parents, code, args.jobs, args.lookback_days, limits_from_args(args))
+    print(json.dumps(status, indent=2))
+    if any(s != "ok" for s in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
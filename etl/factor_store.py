@@ -0,0 +1,356 @@
+"""
+Columnar Parquet mirror of factors.asset_values.
+
+Layout (hive partitioning, one file per factor x year):
+    FACTOR_STORE_DIR/factor=<name>/year=<YYYY>/part.parquet
+    FACTOR_STORE_DIR/factor=<name>/_manifest.json
+
+Files hold (asset_code, trade_date, value) sorted by trade_date, asset_code
+with modest row groups, so date and asset_code filters are pushed down to
+partition pruning plus row-group statistics instead of scanning everything.
+
+Every write of factors.asset_values (save_factor_values, the factor_batch
+bulk write, including their replace_range deletes) calls bump_versions() in
+the same transaction, so factors.asset_value_versions is the single record
+of what the table holds per factor. write_factor() then updates the touched
+years and records the version in the manifest; is_fresh() compares only the
+version (a primary-key lookup) and readers fall back to Postgres when the
+mirror is stale or missing. sync_factor() rebuilds a factor's mirror from the
+database and still checks COUNT / MAX(trade_date) against what it mirrored. Partition files are written to
+FACTOR_STORE_DIR/_tmp first and renamed into place, so a dataset scan never
+sees a half-written file.
+
+Usage:
+    python etl/factor_store.py --sync                 # rebuild every factor
+    python etl/factor_store.py --sync mom_20,value_ep
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from base import copy_query, get_conn, put_conn
+from config import FACTOR_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["asset_code", "trade_date", "value"]
+ROW_GROUP_SIZE = 65_536
+
+
+def _factor_dir(factor_name: str):
+    return FACTOR_STORE_DIR / f"factor={factor_name}"
+
+
+def _manifest_path(factor_name: str):
+    return _factor_dir(factor_name) / "_manifest.json"
+
+
+def read_manifest(factor_name: str) -> dict | None:
+    try:
+        return json.loads(_manifest_path(factor_name).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(factor_name: str, manifest: dict) -> None:
+    path = _manifest_path(factor_name)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _invalidate(factor_name: str) -> None:
+    try:
+        _manifest_path(factor_name).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _db_version(conn, factor_name: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM factors.asset_value_versions WHERE factor_name = %s", (factor_name,))
+        row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+def _db_watermark(conn, factor_name: str) -> tuple[int, str | None, int]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*), MAX(trade_date) FROM factors.asset_values WHERE factor_name = %s",
+            (factor_name,),
+        )
+        count, max_date = cur.fetchone()
+    return int(count), (str(max_date) if max_date else None), _db_version(conn, factor_name)
+
+
+def bump_versions(conn, factor_names) -> dict[str, int]:
+    """
+    Bump the version of these factors and return the new versions. Does not
+    commit: call it on the connection that is about to write
+    factors.asset_values, so the bump commits (or rolls back) with the write.
+    The row locks also serialise concurrent writers of the same factor.
+    """
+    versions = {}
+    with conn.cursor() as cur:
+        for name in sorted(set(factor_names)):     # fixed order, no lock-order deadlocks
+            cur.execute(
+                """
+                INSERT INTO factors.asset_value_versions (factor_name, version) VALUES (%s, 1)
+                ON CONFLICT (factor_name) DO UPDATE SET
+                    version = factors.asset_value_versions.version + 1,
+                    updated_at = NOW()
+                RETURNING version
+                """,
+                (name,),
+            )
+            versions[name] = int(cur.fetchone()[0])
+    return versions
+
+
+def is_fresh(conn, factor_name: str) -> bool:
+    """True when the mirror was built from the factor's current version of factors.asset_values."""
+    manifest = read_manifest(factor_name)
+    if manifest is None:
+        return False
+    return manifest.get("version") == _db_version(conn, factor_name)
+
+
+# ── write ──────────────────────────────────────────────────
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    out = pd.DataFrame({
+        "asset_code": df["asset_code"].astype(str).to_numpy(),
+        "trade_date": pd.to_datetime(df["trade_date"]).to_numpy(dtype="datetime64[ms]"),
+        "value":      pd.to_numeric(df["value"], errors="coerce").astype("float64").to_numpy(),
+    })
+    return out
+
+
+def _partition_path(factor_name: str, year: int):
+    return _factor_dir(factor_name) / f"year={year}" / "part.parquet"
+
+
+def _write_partition(factor_name: str, year: int, part: pd.DataFrame) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = _partition_path(factor_name, year)
+    if part.empty:
+        shutil.rmtree(path.parent, ignore_errors=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part = part.sort_values(["trade_date", "asset_code"], kind="stable")
+    table = pa.Table.from_pandas(part[COLUMNS], preserve_index=False)
+    # outside the factor's dataset directory, so readers never pick up a partial file
+    tmp_dir = FACTOR_STORE_DIR / "_tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / f"{factor_name}-{year}-{uuid.uuid4().hex}.parquet"
+    try:
+        pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _read_partition(factor_name: str, year: int) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    path = _partition_path(factor_name, year)
+    if not path.exists():
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in
+                             zip(COLUMNS, ["object", "datetime64[ms]", "float64"])})
+    return pq.read_table(path, columns=COLUMNS).to_pandas()
+
+
+def _write_all(factor_name: str, df: pd.DataFrame, count: int, max_date: str | None, version: int) -> None:
+    shutil.rmtree(_factor_dir(factor_name), ignore_errors=True)
+    _factor_dir(factor_name).mkdir(parents=True, exist_ok=True)
+    partitions = {}
+    for year, part in df.groupby(df["trade_date"].dt.year):
+        _write_partition(factor_name, int(year), part)
+        partitions[str(int(year))] = len(part)
+    _write_manifest(factor_name, {"rows": count, "max_date": max_date, "version": version, "partitions": partitions})
+
+
+def sync_factor(conn, factor_name: str) -> int:
+    """
+    Rebuild one factor's mirror from factors.asset_values. Returns rows written.
+    Also checks COUNT / MAX(trade_date) against the old manifest: a mirror at
+    the current version that disagrees was changed by a write that bypassed
+    bump_versions(), which is logged.
+    """
+    count, max_date, version = _db_watermark(conn, factor_name)
+    old = read_manifest(factor_name)
+    if old and old.get("version") == version and (old.get("rows"), old.get("max_date")) != (count, max_date):
+        logger.warning(f"factor_store: {factor_name} changed without a version bump "
+                       f"(mirror {old.get('rows')} rows to {old.get('max_date')}, db {count} rows to {max_date})")
+    df = copy_query(
+        conn,
+        "SELECT asset_code, trade_date, value FROM factors.asset_values WHERE factor_name = %s",
+        [factor_name],
+        dtype={"asset_code": str},
+    )
+    _write_all(factor_name, _normalize(df), count, max_date, version)
+    logger.info(f"factor_store: synced {factor_name} ({len(df)} rows)")
+    return len(df)
+
+
+def write_factor(
+    conn,
+    factor_name: str,
+    df: pd.DataFrame,
+    version: int,
+    replace_range: tuple[str, str] | None = None,
+) -> None:
+    """
+    Mirror rows just upserted into factors.asset_values (called by
+    save_factor_values after its commit); version is what bump_versions()
+    returned for that write. Only the years present in df (or in
+    replace_range) are rewritten. If the mirror was not in sync before (its
+    version is not the one just replaced) the factor is rebuilt from Postgres
+    instead. Failures only invalidate the mirror.
+    """
+    try:
+        manifest = read_manifest(factor_name)
+        if manifest is None or manifest.get("version") != version - 1:     # missed a write in between
+            sync_factor(conn, factor_name)
+            return
+
+        new = _normalize(df)
+        years = set(new["trade_date"].dt.year.unique().tolist())
+        if replace_range is not None:
+            lo, hi = pd.Timestamp(replace_range[0]), pd.Timestamp(replace_range[1])
+            years |= set(range(lo.year, hi.year + 1))
+
+        partitions = dict(manifest.get("partitions", {}))
+        for year in sorted(years):
+            old = _read_partition(factor_name, year)
+            if replace_range is not None:
+                old = old[(old["trade_date"] < lo) | (old["trade_date"] > hi)]
+            part = pd.concat([old, new[new["trade_date"].dt.year == year]], ignore_index=True)
+            part = part.drop_duplicates(["asset_code", "trade_date"], keep="last")
+            _write_partition(factor_name, year, part)
+            if part.empty:
+                partitions.pop(str(year), None)
+            else:
+                partitions[str(year)] = len(part)
+
+        max_date = None
+        if partitions:
+            last = _read_partition(factor_name, max(int(y) for y in partitions))
+            max_date = str(last["trade_date"].max().date())
+        _write_manifest(factor_name, {"rows": sum(partitions.values()), "max_date": max_date,
+                                      "version": version, "partitions": partitions})
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"factor_store: mirror update for {factor_name} failed, invalidated: {e}")
+        _invalidate(factor_name)
+
+
+# ── read ───────────────────────────────────────────────────
+
+def read_factor(
+    factor_name: str,
+    start: str | None = None,
+    end: str | None = None,
+    asset_codes: list[str] | None = None,
+    after: tuple[str, str] | None = None,
+    limit: int | None = None,
+) -> pd.DataFrame:
+    """
+    Read one factor from the mirror -> asset_code, trade_date, value sorted by
+    (trade_date, asset_code). Filters are pushed down to the Parquet scan.
+    after=(trade_date, asset_code) keeps only rows strictly after that key and
+    limit stops the scan once that many rows are read: files are sorted by the
+    same key, so year partitions are read in order and each scan ends early.
+    Check is_fresh() first if the result must match Postgres.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    root = _factor_dir(factor_name)
+    if not root.exists():
+        return pd.DataFrame(columns=COLUMNS)
+
+    expr = None
+    first_year = last_year = None
+
+    def _and(e):
+        nonlocal expr
+        expr = e if expr is None else expr & e
+
+    if start:
+        ts = pd.Timestamp(start)
+        first_year = ts.year
+        _and(ds.field("trade_date") >= ts.to_datetime64())
+    if end:
+        ts = pd.Timestamp(end)
+        last_year = ts.year
+        _and(ds.field("trade_date") <= ts.to_datetime64())
+    if asset_codes:
+        _and(ds.field("asset_code").isin(list(asset_codes)))
+    if after:
+        day = pd.Timestamp(after[0]).to_datetime64()
+        first_year = max(first_year or 0, pd.Timestamp(after[0]).year)
+        _and((ds.field("trade_date") > day)
+             | ((ds.field("trade_date") == day) & (ds.field("asset_code") > after[1])))
+
+    if limit:
+        years = sorted(int(p.name.split("=", 1)[1]) for p in root.glob("year=*"))
+        tables, remaining = [], int(limit)
+        for year in years:
+            if (first_year and year < first_year) or (last_year and year > last_year):
+                continue
+            part = ds.dataset(_partition_path(factor_name, year), format="parquet")
+            table = part.scanner(columns=COLUMNS, filter=expr).head(remaining)
+            tables.append(table)
+            remaining -= table.num_rows
+            if remaining <= 0:
+                break
+        if not tables:
+            return pd.DataFrame(columns=COLUMNS)
+        df = pa.concat_tables(tables).to_pandas()
+    else:
+        dataset = ds.dataset(root, format="parquet", partitioning="hive")
+        if first_year:
+            _and(ds.field("year") >= first_year)
+        if last_year:
+            _and(ds.field("year") <= last_year)
+        df = dataset.to_table(columns=COLUMNS, filter=expr).to_pandas()
+    return df.sort_values(["trade_date", "asset_code"], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet mirror of factors.asset_values")
+    parser.add_argument("--sync", nargs="?", const="", default=None,
+                        help="rebuild the mirror of these comma-separated factors (default: all)")
+    args = parser.parse_args()
+    if args.sync is None:
+        parser.print_help()
+        return
+
+    conn = get_conn()
+    try:
+        names = [f.strip() for f in args.sync.split(",") if f.strip()]
+        if not names:
+            with conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT factor_name FROM factors.asset_values ORDER BY 1")
+                names = [r[0] for r in cur.fetchall()]
+        for name in names:
+            n = sync_factor(conn, name)
+            print(f"✓ {name}: {n} rows")
+    finally:
+        put_conn(conn)
+
+
+if __name__ == "__main__":
+    main()
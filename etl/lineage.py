@@ -0,0 +1,203 @@
+"""
+Factor lineage: which inputs each factor reads and how fresh they were.
+
+Sources are identified by (kind, name):
+    ('processed', '<table>')                         load_processed_data(conn, table)
+    ('processed', 'feature_series/<type>/<method>')   load_panel(method, target_type=type), or
+                                                      load_processed_data(conn, "feature_series"),
+                                                      one key per series read
+    ('factor',    '<factor_name>')                    load_factor_values(conn, name)
+
+While a factor script runs, the factor namespace records every source it
+reads together with the source's watermark at read time, plus every factor
+it saves and the last trade_date written. After a successful run the
+recorder is persisted to factors.dependencies / factors.compute_state, which
+factor_scheduler.py compares against current watermarks to decide what to
+recompute.
+
+A watermark is {"max_date": "YYYY-MM-DD" | None, "version": str}: max_date is
+the newest date in the source, version changes whenever its rows do. So that
+factor_scheduler.py can tell appends from revisions, processed tables also
+carry "rewrites" (updated + deleted rows so far) and feature_series series
+"write_version" (their latest processed.feature_series_writes version, see
+revised_from).
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+SOURCE_KINDS = ("processed", "factor")
+
+
+def source_key(kind: str, name: str) -> str:
+    return f"{kind}:{name}"
+
+
+def parse_source_key(key: str) -> tuple[str, str]:
+    kind, _, name = key.partition(":")
+    if kind not in SOURCE_KINDS or not name:
+        raise ValueError(f"Invalid dependency '{key}'; expected 'processed:<name>' or 'factor:<name>'")
+    return kind, name
+
+
+# ── watermarks ─────────────────────────────────────────────
+
+def _table_watermark(cur, table: str) -> dict:
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns"
+        " WHERE table_schema = 'processed' AND table_name = %s"
+        " AND column_name IN ('obs_date', 'trade_date')",
+        (table,),
+    )
+    cols = [r[0] for r in cur.fetchall()]
+    max_date = None
+    if cols:
+        cur.execute(f"SELECT MAX({cols[0]}) FROM processed.{table}")
+        max_date = cur.fetchone()[0]
+    cur.execute(
+        "SELECT n_tup_ins + n_tup_upd + n_tup_del, n_tup_upd + n_tup_del FROM pg_stat_user_tables"
+        " WHERE schemaname = 'processed' AND relname = %s",
+        (table,),
+    )
+    row = cur.fetchone()
+    return {
+        "max_date": str(max_date) if max_date else None,
+        "version": str(row[0] if row else 0),
+        "rewrites": int(row[1]) if row else 0,
+    }
+
+
+def _feature_watermark(cur, target_type: str, method: str) -> dict:
+    cur.execute(
+        "SELECT COUNT(*), MAX(obs_date) FROM processed.feature_series"
+        " WHERE target_type = %s AND transform_method = %s",
+        (target_type, method),
+    )
+    count, max_date = cur.fetchone()
+    # the write log also catches rewrites of existing rows, which leave COUNT / MAX unchanged
+    cur.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM processed.feature_series_writes"
+        " WHERE target_type = %s AND transform_method = %s",
+        (target_type, method),
+    )
+    write_version = int(cur.fetchone()[0])
+    return {
+        "max_date": str(max_date) if max_date else None,
+        "version": f"{count}:{write_version}",
+        "write_version": write_version,
+    }
+
+
+def _factor_watermark(cur, factor_name: str) -> dict:
+    cur.execute(
+        "SELECT computed_through, computed_at FROM factors.compute_state WHERE factor_name = %s",
+        (factor_name,),
+    )
+    row = cur.fetchone()
+    if row is None:
+        # never run through the runner: fall back to the stored values themselves
+        cur.execute(
+            "SELECT MAX(trade_date), COUNT(*) FROM factors.asset_values WHERE factor_name = %s",
+            (factor_name,),
+        )
+        max_date, count = cur.fetchone()
+        return {"max_date": str(max_date) if max_date else None, "version": f"rows:{count}"}
+    return {"max_date": str(row[0]) if row[0] else None, "version": str(row[1])}
+
+
+def revised_from(conn, name: str, since_version: int | None) -> str | None:
+    """
+    Earliest obs_date written to feature_series series `name`
+    ('feature_series/<type>/<method>') by writes logged after since_version,
+    or None when nothing was logged since.
+    """
+    _, target_type, method = name.split("/", 2)
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT MIN(min_obs_date) FROM processed.feature_series_writes"
+            " WHERE target_type = %s AND transform_method = %s AND version > %s",
+            (target_type, method, since_version or 0),
+        )
+        first = cur.fetchone()[0]
+    return str(first) if first else None
+
+
+def watermark(conn, kind: str, name: str) -> dict:
+    """Current watermark of one source."""
+    with conn.cursor() as cur:
+        if kind == "factor":
+            return _factor_watermark(cur, name)
+        if name.startswith("feature_series/"):
+            _, target_type, method = name.split("/", 2)
+            return _feature_watermark(cur, target_type, method)
+        return _table_watermark(cur, name)
+
+
+# ── recorder ───────────────────────────────────────────────
+
+@dataclass
+class LineageRecorder:
+    """Inputs read and outputs written by one factor script run."""
+    inputs: dict[str, dict] = field(default_factory=dict)       # source key -> watermark at read time
+    outputs: dict[str, str | None] = field(default_factory=dict)  # factor -> max trade_date written
+
+    def record_input(self, conn, kind: str, name: str) -> None:
+        key = source_key(kind, name)
+        if key in self.inputs:
+            return
+        try:
+            self.inputs[key] = watermark(conn, kind, name)
+        except Exception as e:            # lineage must never break the factor script
+            conn.rollback()
+            logger.warning(f"lineage: could not read watermark of {key}: {e}")
+            self.inputs[key] = {"max_date": None, "version": None}
+
+    def record_output(self, factor_name: str, max_date: str | None) -> None:
+        prev = self.outputs.get(factor_name)
+        if prev is None or (max_date is not None and max_date > prev):
+            self.outputs[factor_name] = max_date
+        else:
+            self.outputs.setdefault(factor_name, prev)
+
+    def persist(self, conn, declared: list[str] | tuple[str, ...] = ()) -> None:
+        """
+        Replace the dependency rows of every output factor with the recorded
+        plus declared (DEPENDS_ON) sources and update its compute_state.
+        computed_through only moves forward, so incremental runs keep the
+        full-history high-water mark.
+        """
+        if not self.outputs:
+            return
+        inputs = dict(self.inputs)
+        for key in declared:
+            kind, name = parse_source_key(key)
+            if key not in inputs:
+                inputs[key] = watermark(conn, kind, name)
+
+        with conn.cursor() as cur:
+            for factor_name, through in self.outputs.items():
+                deps = {k: v for k, v in inputs.items() if k != source_key("factor", factor_name)}
+                cur.execute("DELETE FROM factors.dependencies WHERE factor_name = %s", (factor_name,))
+                for key in deps:
+                    kind, name = parse_source_key(key)
+                    cur.execute(
+                        "INSERT INTO factors.dependencies (factor_name, source_kind, source_name)"
+                        " VALUES (%s, %s, %s)",
+                        (factor_name, kind, name),
+                    )
+                cur.execute(
+                    """
+                    INSERT INTO factors.compute_state (factor_name, computed_through, input_watermarks, computed_at)
+                    VALUES (%s, %s, %s, NOW())
+                    ON CONFLICT (factor_name) DO UPDATE SET
+                        computed_through = GREATEST(factors.compute_state.computed_through,
+                                                    EXCLUDED.computed_through),
+                        input_watermarks = EXCLUDED.input_watermarks,
+                        computed_at = NOW()
+                    """,
+                    (factor_name, through, json.dumps(deps)),
+                )
+        conn.commit()
+        logger.info(f"lineage: recorded {len(inputs)} inputs for {sorted(self.outputs)}")
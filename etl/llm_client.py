@@ -5,9 +5,27 @@ LLM 客户端：统一封装 OpenAI / Anthropic / DeepSeek / Ollama
     client = LLMClient()          # 从 config.py 读取配置
     response = client.generate("请帮我生成一个因子计算脚本...")
     print(response)
+
+    # 流式输出：逐段返回 token
+    for chunk in client.stream("..."):
+        print(chunk, end="", flush=True)
+
+    # 并发批量生成（限制并发数）
+    texts = client.generate_many(["prompt1", "prompt2", ...], concurrency=4)
+    texts = await client.agenerate_many([...], concurrency=4)   # 异步版本
+
+默认复用 keep-alive 连接池（同一 host 不重复 TLS 握手）；keep_alive=False 时每次新建连接。
+遵循 HTTP(S)_PROXY / NO_PROXY（urllib.request.getproxies）：https 经代理 CONNECT 隧道，http 直接发给代理。
 """
+import asyncio
+import base64
+import http.client
+import json
 import logging
-from typing import Any
+import threading
+from typing import Any, Iterator
+from urllib.parse import unquote, urlsplit
+from urllib.request import getproxies, proxy_bypass
 
 from config import LLM_PROVIDER, LLM_MODEL, load_llm_config
 
@@ -23,6 +41,73 @@ _DEFAULTS: dict[str, str] = {
 }
 
 
+# ── 代理 ─────────────────────────────────────────────────
+def _proxy_for(scheme: str, host: str) -> tuple[str, int, dict[str, str]] | None:
+    """按环境变量（Windows 下含系统设置）解析 scheme://host 应走的代理，返回 (host, port, 代理认证头) 或 None。"""
+    proxy = getproxies().get(scheme)
+    if not proxy or proxy_bypass(host):
+        return None
+    parts = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    headers = {}
+    if parts.username:
+        cred = f"{unquote(parts.username)}:{unquote(parts.password or '')}".encode()
+        headers["Proxy-Authorization"] = "Basic " + base64.b64encode(cred).decode()
+    return parts.hostname, parts.port or 80, headers
+
+
+# ── keep-alive 连接池 ─────────────────────────────────────
+class _ConnectionPool:
+    """
+    按 (scheme, host, port) 缓存空闲的 http.client 连接，线程安全。
+    每个 host 最多保留 maxsize 条空闲连接，超出的直接关闭。
+    配置了代理时新建的连接连向代理：https 通过 set_tunnel 建立 CONNECT 隧道。
+    """
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme: str, host: str, port: int, timeout: float,
+                proxy: tuple[str, int, dict[str, str]] | None = None) -> http.client.HTTPConnection:
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        if proxy is None:
+            return cls(host, port, timeout=timeout)
+        proxy_host, proxy_port, proxy_headers = proxy
+        conn = cls(proxy_host, proxy_port, timeout=timeout)
+        if scheme == "https":
+            conn.set_tunnel(host, port, headers=proxy_headers or None)
+        return conn
+
+    def release(self, scheme: str, host: str, port: int, conn: http.client.HTTPConnection) -> None:
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for c in conns:
+                    c.close()
+            self._idle.clear()
+
+
+_POOL = _ConnectionPool()
+
+
 class LLMClient:
     def __init__(
         self,
@@ -30,6 +115,8 @@ class LLMClient:
         api_key: str | None = None,
         model: str | None = None,
         base_url: str | None = None,
+        timeout: float = 120,
+        keep_alive: bool = True,
     ):
         # 每次实例化都实时读取 llm-keys.json，key 改了无需重启
         cfg = load_llm_config(provider)
@@ -37,6 +124,9 @@ class LLMClient:
         self.api_key  = api_key  or cfg["api_key"]
         self.model    = model    or cfg["model"]
         self.base_url = (base_url or cfg["base_url"] or _DEFAULTS.get(self.provider, "")).rstrip("/")
+        # timeout 为单次 socket 读写超时；流式模式下即两段 token 之间的最长等待
+        self.timeout    = timeout
+        self.keep_alive = keep_alive
 
         if self.provider not in _DEFAULTS:
             raise ValueError(
@@ -48,29 +138,84 @@ class LLMClient:
     def generate(self, prompt: str, system: str | None = None) -> str:
         """发送 prompt，返回模型回复文本。"""
         logger.info(f"LLM [{self.provider}/{self.model}] 请求中...")
+        if self._use_anthropic():
+            body = self._post(*self._anthropic_request(prompt, system, stream=False))
+            return body["content"][0]["text"]
+        # openai / deepseek / ollama / gemini / 代理 anthropic
+        body = self._post(*self._openai_request(prompt, system, stream=False))
+        return body["choices"][0]["message"]["content"]
+
+    def stream(self, prompt: str, system: str | None = None) -> Iterator[str]:
+        """流式请求，按到达顺序逐段 yield 文本增量。"""
+        logger.info(f"LLM [{self.provider}/{self.model}] 流式请求中...")
+        if self._use_anthropic():
+            for event in self._post_stream(*self._anthropic_request(prompt, system, stream=True)):
+                if event.get("type") == "content_block_delta":
+                    text = event.get("delta", {}).get("text")
+                    if text:
+                        yield text
+                elif event.get("type") == "error":
+                    raise RuntimeError(f"Anthropic stream error: {event.get('error')}")
+        else:
+            for event in self._post_stream(*self._openai_request(prompt, system, stream=True)):
+                choices = event.get("choices") or []
+                if choices:
+                    text = (choices[0].get("delta") or {}).get("content")
+                    if text:
+                        yield text
+
+    async def agenerate(self, prompt: str, system: str | None = None) -> str:
+        """generate 的异步版本（在线程池中执行阻塞 I/O）。"""
+        return await asyncio.to_thread(self.generate, prompt, system)
+
+    async def agenerate_many(
+        self,
+        prompts: list[str],
+        system: str | None = None,
+        concurrency: int = 4,
+    ) -> list[str | BaseException]:
+        """
+        并发生成多个 prompt，最多 concurrency 个请求同时在途。
+        返回与 prompts 同序的列表；单个请求失败时对应位置为异常对象，不影响其他请求。
+        """
+        sem = asyncio.Semaphore(max(1, concurrency))
+
+        async def _one(p: str) -> str:
+            async with sem:
+                return await self.agenerate(p, system)
+
+        return await asyncio.gather(*(_one(p) for p in prompts), return_exceptions=True)
+
+    def generate_many(
+        self,
+        prompts: list[str],
+        system: str | None = None,
+        concurrency: int = 4,
+    ) -> list[str | BaseException]:
+        """agenerate_many 的同步入口。"""
+        return asyncio.run(self.agenerate_many(prompts, system, concurrency))
+
+    # ── 请求构造 ───────────────────────────────────────────
+    def _use_anthropic(self) -> bool:
         # 若配置了自定义 base_url（代理），一律走 OpenAI 兼容接口
         is_proxy = self.base_url and self.base_url not in (
             _DEFAULTS.get("anthropic", ""), "https://api.anthropic.com"
         )
-        if self.provider == "anthropic" and not is_proxy:
-            return self._call_anthropic(prompt, system)
-        else:
-            # openai / deepseek / ollama / gemini / 代理 anthropic
-            return self._call_openai_compat(prompt, system)
+        return self.provider == "anthropic" and not is_proxy
 
     # ── OpenAI 兼容接口（OpenAI / DeepSeek / Ollama）──────
-    def _call_openai_compat(self, prompt: str, system: str | None) -> str:
-        import urllib.request, json
-
+    def _openai_request(self, prompt: str, system: str | None, stream: bool) -> tuple[str, dict, bytes]:
         messages: list[dict[str, str]] = []
         if system:
             messages.append({"role": "system", "content": system})
         messages.append({"role": "user", "content": prompt})
 
-        payload = json.dumps({
+        payload_dict: dict[str, Any] = {
             "model":    self.model,
             "messages": messages,
-        }).encode()
+        }
+        if stream:
+            payload_dict["stream"] = True
 
         headers: dict[str, str] = {
             "Content-Type":  "application/json",
@@ -82,17 +227,10 @@ class LLMClient:
             if self.base_url.endswith("/chat/completions")
             else f"{self.base_url}/chat/completions"
         )
-        req = urllib.request.Request(url, data=payload, headers=headers, method="POST")
-
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            body: dict[str, Any] = json.loads(resp.read().decode())
-
-        return body["choices"][0]["message"]["content"]
+        return url, headers, json.dumps(payload_dict).encode()
 
     # ── Anthropic Messages API ─────────────────────────────
-    def _call_anthropic(self, prompt: str, system: str | None) -> str:
-        import urllib.request, json
-
+    def _anthropic_request(self, prompt: str, system: str | None, stream: bool) -> tuple[str, dict, bytes]:
         payload_dict: dict[str, Any] = {
             "model":      self.model,
             "max_tokens": 8192,
@@ -100,8 +238,9 @@ class LLMClient:
         }
         if system:
             payload_dict["system"] = system
+        if stream:
+            payload_dict["stream"] = True
 
-        payload = json.dumps(payload_dict).encode()
         headers = {
             "Content-Type":      "application/json",
             "x-api-key":         self.api_key,
@@ -109,15 +248,105 @@ class LLMClient:
         }
 
         url = f"{self.base_url}/v1/messages"
-        req = urllib.request.Request(url, data=payload, headers=headers, method="POST")
+        return url, headers, json.dumps(payload_dict).encode()
 
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            body: dict[str, Any] = json.loads(resp.read().decode())
+    # ── HTTP 传输 ──────────────────────────────────────────
+    def _open(self, url: str, headers: dict, payload: bytes):
+        """
+        从连接池取连接并发送 POST，返回 (conn, resp, pool_key)。
+        复用的连接可能已被服务端关闭，此时换新连接重试一次。
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+        key = (scheme, parts.hostname, port)
 
-        return body["content"][0]["text"]
+        headers = {**headers, "Connection": "keep-alive" if self.keep_alive else "close"}
+        proxy = _proxy_for(scheme, parts.hostname)
+        if proxy is not None and scheme == "http":
+            # 明文 HTTP 经代理：请求行用绝对 URL，认证头随请求发送
+            path = f"{scheme}://{parts.netloc}{path}"
+            headers.update(proxy[2])
+        for attempt in range(2):
+            conn = _POOL.acquire(*key, timeout=self.timeout, proxy=proxy)
+            reused = conn.sock is not None
+            try:
+                conn.request("POST", path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                return conn, resp, key
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if not reused or attempt:
+                    raise
+            except BaseException:
+                # 超时 / TLS 错误等：连接状态未知，不能留给连接池
+                conn.close()
+                raise
+        raise RuntimeError("unreachable")
+
+    def _finish(self, conn, resp, key) -> None:
+        if self.keep_alive and not resp.will_close:
+            _POOL.release(*key, conn)
+        else:
+            conn.close()
+
+    def _post(self, url: str, headers: dict, payload: bytes) -> dict[str, Any]:
+        conn, resp, key = self._open(url, headers, payload)
+        try:
+            raw = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        self._finish(conn, resp, key)
+        if resp.status >= 400:
+            raise RuntimeError(f"LLM API HTTP {resp.status}: {raw[:500].decode(errors='replace')}")
+        return json.loads(raw.decode())
+
+    def _post_stream(self, url: str, headers: dict, payload: bytes) -> Iterator[dict[str, Any]]:
+        """发送流式请求，解析 SSE，逐个 yield data 字段的 JSON 事件。"""
+        conn, resp, key = self._open(url, headers, payload)
+        completed = False
+        try:
+            if resp.status >= 400:
+                raw = resp.read()
+                completed = True
+                raise RuntimeError(f"LLM API HTTP {resp.status}: {raw[:500].decode(errors='replace')}")
+            while True:
+                line = resp.readline()
+                if not line:
+                    completed = True
+                    break
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    resp.read()
+                    completed = True
+                    break
+                event = json.loads(data)
+                yield event
+                if event.get("type") == "message_stop":
+                    resp.read()
+                    completed = True
+                    break
+        finally:
+            # 消费者中途退出时响应体未读完，连接不可复用
+            if completed:
+                self._finish(conn, resp, key)
+            else:
+                conn.close()
 
 
 # ── 便捷函数 ───────────────────────────────────────────────
 def generate(prompt: str, system: str | None = None, **kwargs: Any) -> str:
     """使用全局配置快速调用 LLM。"""
     return LLMClient(**kwargs).generate(prompt, system)
+
+
+def stream(prompt: str, system: str | None = None, **kwargs: Any) -> Iterator[str]:
+    """使用全局配置流式调用 LLM。"""
+    return LLMClient(**kwargs).stream(prompt, system)
@@ -0,0 +1,187 @@
+"""
+指数成分股入库（时点区间）
+Wind wset → meta.index_constituents（in_date / out_date 生效区间）
+
+首次加载用 sectorconstituent 取起始日成分作为种子，之后用 indexhistory 的纳入/剔除记录
+推进区间，最后与结束日的 sectorconstituent 快照核对（不一致处按结束日修正并告警）。
+每个指数的进度记在 meta.index_constituent_watermarks，重跑只拉取水位之后的变动。
+
+入库后按日期取成分不再需要逐日调用 wset：
+  panel.universe_asof(conn, index_code, dates)        — 多个日期一次查询，返回长表
+  panel.load_universe_mask(conn, index_code, dates)   — date x code 布尔矩阵，供回测屏蔽非成分股
+
+用法：
+  python etl/load_constituents.py --indexes 000300.SH,000905.SH --start 2015-01-01 [--end 2024-12-31]
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from base import call_wind, get_conn, put_conn, upsert
+
+logger = logging.getLogger(__name__)
+
+# indexhistory 的 tradestatus 取值
+STATUS_IN = "纳入"
+STATUS_OUT = "剔除"
+
+
+def _wset_frame(table_name: str, options: str) -> pd.DataFrame:
+    """调用 wset，返回以（小写）字段名为列的 DataFrame；wset 的 data 按字段分行。"""
+    data = call_wind("wset", {"tableName": table_name, "options": options}).get("data") or {}
+    fields = [f.lower() for f in data.get("fields") or []]
+    return pd.DataFrame(dict(zip(fields, data.get("data") or [])), columns=fields)
+
+
+def fetch_members(index_code: str, on: date) -> set[str]:
+    """某一日的成分股代码集合。"""
+    df = _wset_frame("sectorconstituent", f"date={on:%Y-%m-%d};windcode={index_code}")
+    return set(df["wind_code"].dropna()) if "wind_code" in df.columns else set()
+
+
+def fetch_changes(index_code: str, start: date, end: date) -> pd.DataFrame:
+    """[start, end] 内的成分变动，返回 trade_date, asset_code, status（'in' / 'out'），按日期排序。"""
+    df = _wset_frame("indexhistory", f"startdate={start:%Y-%m-%d};enddate={end:%Y-%m-%d};windcode={index_code}")
+    if df.empty or not {"tradedate", "tradecode", "tradestatus"} <= set(df.columns):
+        return pd.DataFrame(columns=["trade_date", "asset_code", "status"])
+    out = pd.DataFrame({
+        "trade_date": pd.to_datetime(df["tradedate"]).dt.date,
+        "asset_code": df["tradecode"],
+        "status": df["tradestatus"].map({STATUS_IN: "in", STATUS_OUT: "out"}),
+    }).dropna()
+    # 同日先剔除再纳入，避免调入调出同一代码时区间被提前关闭
+    out["order"] = (out["status"] == "in").astype(int)
+    return out.sort_values(["trade_date", "order"], kind="stable").drop(columns="order")
+
+
+def _get_watermark(conn, index_code: str) -> date | None:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT loaded_through FROM meta.index_constituent_watermarks WHERE index_code = %s",
+            (index_code,),
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _open_intervals(conn, index_code: str) -> dict[str, date]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT asset_code, in_date FROM meta.index_constituents WHERE index_code = %s AND out_date IS NULL",
+            (index_code,),
+        )
+        return dict(cur.fetchall())
+
+
+def apply_changes(open_: dict[str, date], changes: pd.DataFrame) -> list[tuple[str, date, date]]:
+    """
+    按时间顺序把纳入/剔除作用到当前未结束的区间 open_（原地修改）。
+    返回被关闭的区间 [(asset_code, in_date, out_date)]；重复的纳入/剔除记录被忽略，
+    因此从旧水位重跑是幂等的。
+    """
+    closed = []
+    for d, code, status in changes[["trade_date", "asset_code", "status"]].itertuples(index=False):
+        if status == "in":
+            open_.setdefault(code, d)
+        elif code in open_:
+            in_date = open_.pop(code)
+            if d > in_date:
+                closed.append((code, in_date, d))
+    return closed
+
+
+def load_index(index_code: str, start: date, end: date) -> int:
+    """增量更新一个指数的成分区间，返回写入（新增或更新）的区间数。"""
+    conn = get_conn()
+    try:
+        watermark = _get_watermark(conn, index_code)
+        if watermark is None:
+            open_ = {code: start for code in fetch_members(index_code, start)}
+            if not open_:
+                logger.warning(f"{index_code} {start} 无成分数据，跳过")
+                return 0
+            begin = start + timedelta(days=1)
+        else:
+            open_ = _open_intervals(conn, index_code)
+            begin = watermark + timedelta(days=1)
+            if begin > end:
+                logger.info(f"{index_code} 成分已是最新，跳过")
+                return 0
+
+        stored = {} if watermark is None else dict(open_)   # 已入库的未结束区间，无需重写
+        closed = apply_changes(open_, fetch_changes(index_code, begin, end)) if begin <= end else []
+
+        # 与结束日快照核对：变动记录缺失或口径不一致时以快照为准
+        members = fetch_members(index_code, end)
+        if members:
+            stale = set(open_) - members
+            missing = members - set(open_)
+            if stale or missing:
+                logger.warning(
+                    f"{index_code} {end} 快照与变动记录不一致：多 {len(stale)} 只、缺 {len(missing)} 只，按快照修正"
+                )
+            for code in stale:
+                in_date = open_.pop(code)
+                if end > in_date:
+                    closed.append((code, in_date, end))
+            for code in missing:
+                open_[code] = end
+
+        rows = [
+            {"index_code": index_code, "asset_code": code, "in_date": in_date, "out_date": out_date}
+            for code, in_date, out_date in closed
+        ] + [
+            {"index_code": index_code, "asset_code": code, "in_date": in_date, "out_date": None}
+            for code, in_date in open_.items() if stored.get(code) != in_date
+        ]
+        n = upsert(conn, "meta.index_constituents", rows,
+                   conflict_cols=["index_code", "asset_code", "in_date"], update_cols=["out_date"])
+        upsert(
+            conn, "meta.index_constituent_watermarks",
+            [{"index_code": index_code, "start_date": start, "loaded_through": end, "updated_at": datetime.now()}],
+            conflict_cols=["index_code"], update_cols=["loaded_through", "updated_at"],
+        )
+        logger.info(f"{index_code} 成分 {len(open_)} 只，写入区间 {n} 条（{len(closed)} 条结束）")
+        return n
+    finally:
+        put_conn(conn)
+
+
+def load_constituents(index_codes: list[str], start: str = "2015-01-01", end: str | None = None) -> dict[str, int]:
+    """
+    批量更新多个指数的成分区间。
+    返回 {index_code: 写入区间数}，失败的指数为 -1。
+    """
+    start_d = datetime.strptime(start, "%Y-%m-%d").date()
+    end_d = datetime.strptime(end, "%Y-%m-%d").date() if end else date.today()
+    results: dict[str, int] = {}
+    for code in index_codes:
+        try:
+            results[code] = load_index(code, start_d, end_d)
+        except Exception as e:
+            logger.error(f"{code} 成分拉取失败: {e}")
+            results[code] = -1
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wset 指数成分股时点区间入库")
+    parser.add_argument("--indexes", required=True, help="逗号分隔的指数代码，如 000300.SH,000905.SH")
+    parser.add_argument("--start", default="2015-01-01", help="首次加载的起始日期（YYYY-MM-DD）")
+    parser.add_argument("--end", default=None, help="结束日期（默认今天）")
+    args = parser.parse_args()
+
+    codes = [c.strip() for c in args.indexes.split(",") if c.strip()]
+    results = load_constituents(codes, args.start, args.end)
+    if any(n < 0 for n in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
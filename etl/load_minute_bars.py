@@ -0,0 +1,259 @@
+"""
+分钟 K 线入库 + 本地重采样
+Wind wsi（BarSize=1）→ raw.intraday_bars（freq='1m'，按月分区）
+                   → 本地重采样为 5m / 15m / 60m 等，不再单独向 Wind 拉取粗周期 K 线
+
+每个代码从已入库的最后一根 1 分钟线之后继续拉取，按 --chunk-days 天切块顺序写入，
+中断后重跑即从断点继续；不同代码在线程池中并发，Wind 调用启动间隔受 --rate 限制。
+wsi 的时间标签是 K 线结束时刻，入库时统一转换为 K 线开始时刻（bar_time）。
+
+重采样按交易时段对齐（SESSIONS）：60 分钟线为 09:30-10:30 / 10:30-11:30 / 13:00-14:00 / 14:00-15:00，
+用 numpy reduceat 对整段数据一次性聚合。
+
+用法：
+  python etl/load_minute_bars.py --codes 600000.SH,000001.SZ --start 2024-01-01 [--end 2024-03-31]
+  python etl/load_minute_bars.py --codes 600000.SH --start 2024-01-01 --resample 5,15,30,60
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from base import (
+    POOL_MAXCONN, RateLimiter, call_wind, copy_query, copy_upsert, ensure_month_partitions, get_conn, put_conn,
+)
+
+logger = logging.getLogger(__name__)
+
+# wsi 字段映射：Wind 字段名 → 数据库列名
+WSI_FIELDS = {
+    "open":   "open",
+    "high":   "high",
+    "low":    "low",
+    "close":  "close",
+    "volume": "volume",
+    "amt":    "amount",
+}
+BAR_COLUMNS = list(WSI_FIELDS.values())
+# 连续交易时段开盘时刻；重采样桶从所在时段的开盘时刻起算
+SESSIONS = (time(9, 30), time(13, 0))
+DEFAULT_RESAMPLE = (5, 15, 60)
+
+
+def _ensure_asset(conn, code: str) -> int:
+    """确保 meta.assets 中存在该资产，返回 asset id。"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO meta.assets (asset_code, asset_class) VALUES (%s, 'stock')"
+            " ON CONFLICT (asset_code) DO UPDATE SET asset_code = EXCLUDED.asset_code"
+            " RETURNING id",
+            (code,),
+        )
+        asset_id = cur.fetchone()[0]
+    conn.commit()
+    return asset_id
+
+
+def _get_last_bar(conn, asset_id: int) -> datetime | None:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT MAX(bar_time) FROM raw.intraday_bars WHERE asset_id = %s AND freq = '1m'",
+            (asset_id,),
+        )
+        row = cur.fetchone()
+    return row[0] if row and row[0] else None
+
+
+# ── 重采样 ─────────────────────────────────────────────────
+
+def resample_bars(df: pd.DataFrame, minutes: int) -> pd.DataFrame:
+    """
+    1 分钟线 → minutes 分钟线（向量化）。
+    df 列：asset_id, bar_time（K 线开始时刻）, open, high, low, close, volume, amount。
+    桶按所在交易时段的开盘时刻对齐，不跨午休；开盘前的集合竞价 K 线并入第一个桶。
+    高低价忽略 NaN，成交量/额按 0 累加。
+    """
+    if df.empty:
+        return df.copy()
+    df = df.sort_values(["asset_id", "bar_time"], kind="stable")
+    t = pd.to_datetime(df["bar_time"]).to_numpy("datetime64[m]")
+    day = t.astype("datetime64[D]")
+    minute_of_day = (t - day).astype(np.int64)
+
+    opens = np.array([s.hour * 60 + s.minute for s in SESSIONS])
+    session_open = opens[np.clip(np.searchsorted(opens, minute_of_day, side="right") - 1, 0, None)]
+    offset = np.maximum(minute_of_day - session_open, 0)
+    bucket = day + (session_open + offset // minutes * minutes).astype("timedelta64[m]")
+
+    asset = df["asset_id"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, (asset[1:] != asset[:-1]) | (bucket[1:] != bucket[:-1])])
+    ends = np.r_[starts[1:], len(df)] - 1
+
+    def col(name):
+        return df[name].to_numpy(dtype=np.float64)
+
+    return pd.DataFrame({
+        "asset_id": asset[starts],
+        "bar_time": bucket[starts].astype("datetime64[ns]"),
+        "open": col("open")[starts],
+        "high": np.fmax.reduceat(col("high"), starts),
+        "low": np.fmin.reduceat(col("low"), starts),
+        "close": col("close")[ends],
+        "volume": np.add.reduceat(np.nan_to_num(col("volume")), starts),
+        "amount": np.add.reduceat(np.nan_to_num(col("amount")), starts),
+    })
+
+
+# ── 拉取 / 写入 ────────────────────────────────────────────
+
+def fetch_bars(code: str, begin: datetime, end: datetime, options: str = "") -> pd.DataFrame:
+    """拉取 [begin, end] 的 1 分钟线，返回 bar_time（开始时刻）+ 数据库列。"""
+    data = call_wind("wsi", {
+        "codes": code,
+        "fields": ",".join(WSI_FIELDS),
+        "beginTime": begin.strftime("%Y-%m-%d %H:%M:%S"),
+        "endTime": end.strftime("%Y-%m-%d %H:%M:%S"),
+        "options": ";".join(filter(None, ["BarSize=1", options])),
+    }).get("data") or {}
+    times = data.get("times") or []
+    if not times:
+        return pd.DataFrame(columns=["bar_time", *BAR_COLUMNS])
+    # wsi 单代码：data 每行是一个字段的时间序列；时间标签为 K 线结束时刻
+    df = pd.DataFrame({"bar_time": pd.to_datetime(times) - pd.Timedelta(minutes=1)})
+    for field, row in zip(data.get("fields") or [], data.get("data") or []):
+        col = WSI_FIELDS.get(field.lower())
+        if col:
+            df[col] = pd.to_numeric(pd.Series(row, dtype=object), errors="coerce")
+    for c in BAR_COLUMNS:
+        if c not in df.columns:
+            df[c] = np.nan
+    return df.dropna(how="all", subset=BAR_COLUMNS)
+
+
+def write_bars(conn, asset_id: int, df: pd.DataFrame, freq: str) -> int:
+    if df.empty:
+        return 0
+    out = df[["bar_time", *BAR_COLUMNS]].copy()
+    # 以字符串写入，避免 COPY 序列化时把时间截断为日期
+    out["bar_time"] = pd.to_datetime(out["bar_time"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+    return copy_upsert(
+        conn, "raw.intraday_bars", out, ["asset_id", "freq", "bar_time", *BAR_COLUMNS],
+        conflict_cols=["asset_id", "freq", "bar_time"], update_cols=BAR_COLUMNS,
+        constants={"asset_id": asset_id, "freq": freq},
+    )
+
+
+def resample_days(conn, asset_id: int, first: date, last: date, minutes_list) -> int:
+    """用库中 [first, last] 的全部 1 分钟线重建这些交易日的粗周期 K 线。"""
+    if not minutes_list:
+        return 0
+    ones = copy_query(
+        conn,
+        "SELECT asset_id, bar_time, open, high, low, close, volume, amount FROM raw.intraday_bars"
+        " WHERE asset_id = %s AND freq = '1m' AND bar_time >= %s AND bar_time < %s ORDER BY bar_time",
+        (asset_id, first, last + timedelta(days=1)),
+    )
+    if ones.empty:
+        return 0
+    ones["bar_time"] = pd.to_datetime(ones["bar_time"])
+    return sum(write_bars(conn, asset_id, resample_bars(ones, m), f"{m}m") for m in minutes_list)
+
+
+def load_code(code: str, start: datetime, end: datetime, chunk_days: int,
+              resample, limiter: RateLimiter, options: str = "") -> int:
+    """顺序拉取一个代码的各时间块；每块写入 1 分钟线后重建对应日期的粗周期 K 线。"""
+    conn = get_conn()
+    try:
+        asset_id = _ensure_asset(conn, code)
+        last = _get_last_bar(conn, asset_id)
+        begin = max(start, last + timedelta(minutes=1)) if last else start
+        if begin > end:
+            logger.info(f"{code} 分钟线已是最新，跳过")
+            return 0
+
+        logger.info(f"拉取分钟线 {code}  {begin} → {end}")
+        total = 0
+        while begin <= end:
+            # 块边界取在午夜，保证重采样时整日数据都已入库
+            stop = min(datetime.combine(begin.date() + timedelta(days=chunk_days), time()) - timedelta(seconds=1), end)
+            limiter.wait()
+            df = fetch_bars(code, begin, stop, options)
+            if len(df):
+                total += write_bars(conn, asset_id, df, "1m")
+                resample_days(conn, asset_id, df["bar_time"].min().date(), df["bar_time"].max().date(), resample)
+            begin = stop + timedelta(seconds=1)
+        logger.info(f"{code} 1 分钟线写入 {total} 行")
+        return total
+    finally:
+        put_conn(conn)
+
+
+def load_minute_bars(
+    codes: list[str],
+    start: str,
+    end: str | None = None,
+    resample=DEFAULT_RESAMPLE,
+    chunk_days: int = 30,
+    jobs: int = 4,
+    rate: float = 2.0,
+    options: str = "",
+) -> dict[str, int]:
+    """
+    并发拉取多个代码的 1 分钟线写入 raw.intraday_bars，并本地重采样出 resample 中的各周期。
+    返回 {code: 1 分钟线写入行数}，失败的代码为 -1。
+    """
+    begin = datetime.strptime(start, "%Y-%m-%d")
+    end_dt = datetime.combine(datetime.strptime(end, "%Y-%m-%d").date() if end else date.today(), time(23, 59, 59))
+    jobs = max(1, min(jobs, POOL_MAXCONN - 1))
+
+    conn = get_conn()
+    try:
+        days = pd.date_range(begin.date(), end_dt.date(), freq="MS").date.tolist() + [begin.date()]
+        ensure_month_partitions(conn, "raw.intraday_bars", days)   # 并发写入前统一创建
+    finally:
+        put_conn(conn)
+
+    limiter = RateLimiter(rate)
+    results: dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            code: pool.submit(load_code, code, begin, end_dt, chunk_days, resample, limiter, options)
+            for code in codes
+        }
+        for code, future in futures.items():
+            try:
+                results[code] = future.result()
+            except Exception as e:
+                logger.error(f"{code} 分钟线拉取失败（已写入部分可续拉）: {e}")
+                results[code] = -1
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wsi 分钟线入库与本地重采样")
+    parser.add_argument("--codes", required=True, help="逗号分隔的资产代码列表")
+    parser.add_argument("--start", required=True, help="起始日期（YYYY-MM-DD）")
+    parser.add_argument("--end", default=None, help="结束日期（默认今天）")
+    parser.add_argument("--resample", default=",".join(map(str, DEFAULT_RESAMPLE)),
+                        help="逗号分隔的重采样周期（分钟），留空不重采样")
+    parser.add_argument("--chunk-days", type=int, default=30, help="每次 wsi 调用的日历天数")
+    parser.add_argument("--jobs", type=int, default=4, help="并发代码数")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒最多启动的 Wind 调用数（<=0 不限）")
+    args = parser.parse_args()
+
+    codes = [c.strip() for c in args.codes.split(",") if c.strip()]
+    resample = [int(m) for m in args.resample.split(",") if m.strip()]
+    results = load_minute_bars(codes, args.start, args.end, resample, args.chunk_days, args.jobs, args.rate)
+    if any(n < 0 for n in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
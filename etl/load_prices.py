@@ -1,6 +1,11 @@
 """
 日度行情入库（增量）
 Wind wsd → raw.daily_prices
+
+价格按不复权入库，adj_factor（Wind 复权因子）原样保存；前/后复权在读取时由
+panel.adjust_prices / load_price_panel(adjust=...) 计算。除权除息不会改写已入库的历史，
+因此增量拉取始终与已有数据同一口径。
+从前复权（PriceAdj=F）口径升级时需全量重拉一次：python run_all.py --no-incremental
 """
 import logging
 from datetime import date, timedelta
@@ -87,7 +92,7 @@ def load_prices(
                         "fields": wind_fields,
                         "startDate": fetch_start,
                         "endDate": end,
-                        "options": "PriceAdj=F",
+                        "options": "",   # 不复权
                     },
                 )
             except RuntimeError as e:
@@ -0,0 +1,263 @@
+"""
+日内 Tick 入库（分块、并发、断点续拉）
+Wind wst → raw.ticks（按月分区）
+
+每个代码按交易日（raw.trading_calendar）的 SESSION 时段切成 --chunk-minutes 分钟的
+时间块，按时间顺序逐块拉取，每块以 COPY 批量写入后推进 raw.tick_watermarks.fetched_through；
+中断或失败后重跑即从水位继续（与已有 Tick 重叠的部分按主键去重）。
+--start 早于已入库区间起点 fetched_from 时，先从起点向前逆序补拉 [start, fetched_from)，
+每块写入后把 fetched_from 前移，已入库区间始终保持连续：--start 晚于 fetched_through 时
+从 fetched_through 接着拉，--end 早于 fetched_from 时补拉到 fetched_from 为止（covering_range）。
+不同代码在线程池中并发拉取，Wind 调用启动间隔受 --rate 限制。
+
+用法：
+  python etl/load_ticks.py --codes 600000.SH,000001.SZ --start 2024-03-01 [--end 2024-03-08]
+  python etl/load_ticks.py --codes 600000.SH --start 2024-03-01 --jobs 4 --chunk-minutes 30
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from base import (
+    POOL_MAXCONN, RateLimiter, call_wind, copy_upsert, ensure_month_partitions, get_conn, put_conn, upsert,
+)
+
+logger = logging.getLogger(__name__)
+
+SESSION = (time(9, 15), time(15, 30))     # 含集合竞价与盘后
+# wst 字段映射：Wind 字段名 → 数据库列名
+WST_FIELDS = {
+    "last":   "last",
+    "volume": "volume",
+    "amt":    "amount",
+    "bid1":   "bid1",
+    "ask1":   "ask1",
+    "bsize1": "bid_size1",
+    "asize1": "ask_size1",
+}
+
+
+def _ensure_asset(conn, code: str) -> int:
+    """确保 meta.assets 中存在该资产，返回 asset id。"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO meta.assets (asset_code, asset_class) VALUES (%s, 'stock')"
+            " ON CONFLICT (asset_code) DO UPDATE SET asset_code = EXCLUDED.asset_code"
+            " RETURNING id",
+            (code,),
+        )
+        asset_id = cur.fetchone()[0]
+    conn.commit()
+    return asset_id
+
+
+def _get_watermark(conn, asset_id: int) -> tuple[datetime | None, datetime] | None:
+    """已入库区间 (fetched_from, fetched_through)；fetched_from 为 NULL 表示起点未知。"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT fetched_from, fetched_through FROM raw.tick_watermarks WHERE asset_id = %s", (asset_id,))
+        row = cur.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def _trading_days(conn, start: str, end: str) -> list[date]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT trade_date FROM raw.trading_calendar WHERE trade_date BETWEEN %s AND %s ORDER BY trade_date",
+            (start, end),
+        )
+        return [r[0] for r in cur.fetchall()]
+
+
+def time_chunks(days: list[date], chunk_minutes: int, after: datetime | None,
+                now: datetime | None = None, before: datetime | None = None) -> list[tuple[datetime, datetime]]:
+    """交易时段切块；只保留 (after, before) 之内的部分，不超过当前时刻。"""
+    now = now or datetime.now()
+    if before is not None:
+        now = min(now, before)
+    step = timedelta(minutes=chunk_minutes)
+    out = []
+    for d in days:
+        t, close = datetime.combine(d, SESSION[0]), datetime.combine(d, SESSION[1])
+        while t < close and t < now:
+            u = min(t + step, close, now)
+            if after is None or u > after:
+                out.append((max(t, after) if after else t, u))
+            t += step
+    return out
+
+
+def covering_range(start: date, end: date, mark: tuple[datetime | None, datetime] | None) -> tuple[date, date]:
+    """
+    把请求区间 [start, end] 扩展到与已入库区间 mark 相接，保证写入后的区间仍然连续：
+    start 晚于 fetched_through 时从 fetched_through 所在日起，end 早于 fetched_from 时延伸到 fetched_from 所在日。
+    """
+    if mark is None:
+        return start, end
+    fetched_from, fetched_through = (mark[0] or mark[1]).date(), mark[1].date()
+    return min(start, fetched_through), max(end, fetched_from)
+
+
+def fetch_chunk(code: str, fields: str, begin: datetime, end: datetime, options: str) -> pd.DataFrame:
+    """拉取一个时间块，返回 tick_time（字符串，保留毫秒）+ 数据库列。"""
+    data = call_wind("wst", {
+        "codes": code,
+        "fields": fields,
+        "beginTime": begin.strftime("%Y-%m-%d %H:%M:%S"),
+        "endTime": end.strftime("%Y-%m-%d %H:%M:%S"),
+        "options": options,
+    }).get("data") or {}
+    times = data.get("times") or []
+    if not times:
+        return pd.DataFrame(columns=["tick_time", *WST_FIELDS.values()])
+    # wst 单代码：data 每行是一个字段的时间序列
+    df = pd.DataFrame({"tick_time": times})
+    for field, row in zip(data.get("fields") or [], data.get("data") or []):
+        col = WST_FIELDS.get(field.lower())
+        if col:
+            df[col] = row
+    cols = [c for c in WST_FIELDS.values() if c in df.columns]
+    return df.dropna(how="all", subset=cols)
+
+
+def _load_chunk(conn, asset_id: int, code: str, fields: str, begin: datetime, end: datetime,
+                limiter: RateLimiter, options: str) -> int:
+    limiter.wait()
+    df = fetch_chunk(code, fields, begin, end, options)
+    if not len(df):
+        return 0
+    columns = ["asset_id", "tick_time", *[c for c in WST_FIELDS.values() if c in df.columns]]
+    return copy_upsert(
+        conn, "raw.ticks", df, columns,
+        conflict_cols=["asset_id", "tick_time"], constants={"asset_id": asset_id},
+    )
+
+
+def load_code(code: str, days: list[date], fields: str, chunk_minutes: int,
+              limiter: RateLimiter, options: str = "") -> int:
+    """顺序拉取一个代码的所有时间块，每块写入后推进水位；返回写入行数。"""
+    conn = get_conn()
+    try:
+        asset_id = _ensure_asset(conn, code)
+        mark = _get_watermark(conn, asset_id)
+        if mark is None:
+            backfill, chunks = [], time_chunks(days, chunk_minutes, None)
+        else:
+            # 起点未知的旧水位按整段 [start, fetched_through) 补拉，重叠部分按主键去重
+            fetched_from, fetched_through = mark[0] or mark[1], mark[1]
+            backfill = time_chunks(days, chunk_minutes, None, before=fetched_from)[::-1]
+            chunks = time_chunks(days, chunk_minutes, fetched_through)
+            # days 须与已入库区间相接（见 covering_range），否则水位会覆盖从未拉取的日期
+            if (chunks and days[0] > fetched_through.date()) or (backfill and days[-1] < fetched_from.date()):
+                raise ValueError(
+                    f"{code} 拉取区间 {days[0]} → {days[-1]} 与已入库区间 "
+                    f"{fetched_from} → {fetched_through} 不相接，拒绝写入"
+                )
+        if not backfill and not chunks:
+            logger.info(f"{code} Tick 已是最新，跳过")
+            return 0
+
+        total = 0
+        if backfill:
+            logger.info(f"补拉 Tick {code}  {backfill[-1][0]} → {backfill[0][1]}（{len(backfill)} 块）")
+            for begin, end in backfill:          # 从已入库区间起点向前，逐块前移 fetched_from
+                total += _load_chunk(conn, asset_id, code, fields, begin, end, limiter, options)
+                upsert(
+                    conn, "raw.tick_watermarks",
+                    [{"asset_id": asset_id, "fetched_from": begin, "fetched_through": fetched_through,
+                      "updated_at": datetime.now()}],
+                    conflict_cols=["asset_id"], update_cols=["fetched_from", "updated_at"],
+                )
+        if chunks:
+            logger.info(f"拉取 Tick {code}  {chunks[0][0]} → {chunks[-1][1]}（{len(chunks)} 块）")
+            first = chunks[0][0]
+            for begin, end in chunks:
+                total += _load_chunk(conn, asset_id, code, fields, begin, end, limiter, options)
+                upsert(
+                    conn, "raw.tick_watermarks",
+                    [{"asset_id": asset_id, "fetched_from": first, "fetched_through": end,
+                      "updated_at": datetime.now()}],
+                    conflict_cols=["asset_id"], update_cols=["fetched_through", "updated_at"],
+                )
+        logger.info(f"{code} Tick 写入 {total} 行")
+        return total
+    finally:
+        put_conn(conn)
+
+
+def load_ticks(
+    codes: list[str],
+    start: str,
+    end: str | None = None,
+    chunk_minutes: int = 60,
+    jobs: int = 4,
+    rate: float = 2.0,
+    options: str = "",
+) -> dict[str, int]:
+    """
+    并发拉取多个代码 [start, end] 区间的 Tick 并写入 raw.ticks。
+    单个代码失败不影响其他代码，已写入的块由水位保留。
+    返回 {code: 写入行数}，失败的代码为 -1。
+    """
+    if end is None:
+        end = date.today().strftime("%Y-%m-%d")
+    # 每个并发代码占用一个连接，留一个给主线程
+    jobs = max(1, min(jobs, POOL_MAXCONN - 1))
+
+    conn = get_conn()
+    try:
+        start_d, end_d = date.fromisoformat(start), date.fromisoformat(end)
+        ranges = {
+            code: covering_range(start_d, end_d, _get_watermark(conn, _ensure_asset(conn, code)))
+            for code in codes
+        }
+        all_days = _trading_days(conn, min(lo for lo, _ in ranges.values()), max(hi for _, hi in ranges.values()))
+        code_days = {code: [d for d in all_days if lo <= d <= hi] for code, (lo, hi) in ranges.items()}
+        if not any(code_days.values()):
+            logger.warning(f"{start} → {end} 无交易日，请先运行 load_tdays.py")
+            return {}
+        ensure_month_partitions(conn, "raw.ticks", all_days)   # 并发写入前统一创建
+    finally:
+        put_conn(conn)
+
+    fields = ",".join(WST_FIELDS)
+    limiter = RateLimiter(rate)
+    results: dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            code: pool.submit(load_code, code, code_days[code], fields, chunk_minutes, limiter, options)
+            for code in codes if code_days[code]
+        }
+        for code, future in futures.items():
+            try:
+                results[code] = future.result()
+            except Exception as e:
+                logger.error(f"{code} Tick 拉取失败（已写入部分保留在水位内）: {e}")
+                results[code] = -1
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wst Tick 分块并发入库")
+    parser.add_argument("--codes", required=True, help="逗号分隔的资产代码列表")
+    parser.add_argument("--start", required=True, help="起始交易日（YYYY-MM-DD）")
+    parser.add_argument("--end", default=None, help="结束交易日（默认今天）")
+    parser.add_argument("--chunk-minutes", type=int, default=60, help="每次 wst 调用的时间跨度（分钟）")
+    parser.add_argument("--jobs", type=int, default=4, help="并发代码数")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒最多启动的 Wind 调用数（<=0 不限）")
+    args = parser.parse_args()
+
+    codes = [c.strip() for c in args.codes.split(",") if c.strip()]
+    results = load_ticks(codes, args.start, args.end, args.chunk_minutes, args.jobs, args.rate)
+    if any(n < 0 for n in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
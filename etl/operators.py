@@ -0,0 +1,335 @@
+"""
+Vectorized panel operators for factor scripts.
+
+Every operator takes date x asset arrays (rows = dates in ascending order,
+columns = assets), as returned by load_panel / load_price_panel, and treats
+NaN as missing: missing inputs never poison neighbouring cells, they just
+reduce the sample. pandas DataFrames are accepted as well and come back as
+DataFrames with the same index / columns.
+
+Cross-sectional (per row):  cs_rank, cs_zscore, winsorize, neutralize
+Time-series (per column):   ts_delay, ts_delta, ts_sum, ts_mean, ts_std,
+                            ts_corr, ts_rank, decay_linear
+
+All of them are exposed in the factor_namespace, e.g.
+    ret = load_panel("daily_return")["transformed_value"]
+    mom = cs_zscore(winsorize(ts_sum(ret, 20)))
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+
+def _panel_op(func):
+    """Accept DataFrames in place of arrays; wrap the result like the first argument."""
+    @functools.wraps(func)
+    def wrapper(x, *args, **kwargs):
+        frame = x if isinstance(x, pd.DataFrame) else None
+        x = _as_float(x)
+        args = tuple(_as_float(a) if isinstance(a, pd.DataFrame) else a for a in args)
+        out = func(x, *args, **kwargs)
+        if frame is not None:
+            return pd.DataFrame(out, index=frame.index, columns=frame.columns)
+        return out
+    return wrapper
+
+
+def _as_float(x) -> np.ndarray:
+    x = x.to_numpy(dtype="float64") if isinstance(x, pd.DataFrame) else np.asarray(x, dtype="float64")
+    if x.ndim != 2:
+        raise ValueError(f"expected a 2-D date x asset array, got shape {x.shape}")
+    return x
+
+
+# ── cross-sectional ────────────────────────────────────────
+
+@_panel_op
+def cs_rank(x: np.ndarray, pct: bool = True) -> np.ndarray:
+    """
+    Average ranks within each date (ties share their mean rank); NaN stays NaN.
+    pct=True scales ranks to (0, 1] by the number of valid assets that date.
+    """
+    n_rows, n_cols = x.shape
+    order = np.argsort(x, axis=1, kind="stable")          # NaN sorts last
+    s = np.take_along_axis(x, order, axis=1)
+    pos = np.broadcast_to(np.arange(n_cols), s.shape)
+
+    # start / end position of each run of equal values in the sorted rows
+    new_run = np.ones(s.shape, dtype=bool)
+    new_run[:, 1:] = s[:, 1:] != s[:, :-1]
+    run_end = np.ones(s.shape, dtype=bool)
+    run_end[:, :-1] = new_run[:, 1:]
+    start = np.maximum.accumulate(np.where(new_run, pos, 0), axis=1)
+    end = np.minimum.accumulate(np.where(run_end, pos, n_cols)[:, ::-1], axis=1)[:, ::-1]
+
+    ranks = np.where(np.isnan(s), np.nan, (start + end) / 2.0 + 1.0)
+    out = np.empty_like(ranks)
+    np.put_along_axis(out, order, ranks, axis=1)
+    if pct:
+        count = (~np.isnan(x)).sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = out / count
+    return out
+
+
+@_panel_op
+def cs_zscore(x: np.ndarray) -> np.ndarray:
+    """(x - mean) / std within each date; dates with zero dispersion give NaN."""
+    valid = ~np.isnan(x)
+    n = valid.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, x, 0.0).sum(axis=1, keepdims=True) / n
+        dev = np.where(valid, x - mean, 0.0)
+        std = np.sqrt((dev * dev).sum(axis=1, keepdims=True) / (n - 1))
+        out = (x - mean) / np.where(std > 0, std, np.nan)
+    return out
+
+
+@_panel_op
+def winsorize(x: np.ndarray, lower: float = 0.01, upper: float = 0.99) -> np.ndarray:
+    """Clip each date to its own [lower, upper] quantiles (NaN ignored)."""
+    if not 0.0 <= lower < upper <= 1.0:
+        raise ValueError(f"winsorize: need 0 <= lower < upper <= 1, got {lower}, {upper}")
+    out = x.copy()
+    rows = ~np.isnan(x).all(axis=1)
+    if rows.any():
+        lo, hi = np.nanquantile(x[rows], [lower, upper], axis=1)
+        out[rows] = np.clip(x[rows], lo[:, None], hi[:, None])
+    return out
+
+
+def _group_codes(groups, shape: tuple[int, int]) -> tuple[np.ndarray, int]:
+    """Integer group code per cell (-1 = unknown) broadcast to `shape`, plus the number of groups."""
+    g = groups.to_numpy() if isinstance(groups, (pd.DataFrame, pd.Series)) else np.asarray(groups)
+    codes, uniques = pd.factorize(g.ravel(), use_na_sentinel=True)
+    codes = codes.reshape(g.shape)
+    if codes.ndim == 1:
+        codes = np.broadcast_to(codes, shape)
+    if codes.shape != shape:
+        raise ValueError(f"neutralize: groups shape {g.shape} does not match {shape}")
+    return codes.astype(np.int64), len(uniques)
+
+
+def _demean_by_group(values: np.ndarray, codes: np.ndarray, n_groups: int, mask: np.ndarray) -> np.ndarray:
+    """Subtract the per-(date, group) mean over `mask` cells from every column of values (T, N, K)."""
+    n_rows = codes.shape[0]
+    flat = (np.arange(n_rows)[:, None] * n_groups + codes)[mask]
+    size = n_rows * n_groups
+    cnt = np.bincount(flat, minlength=size)
+    out = np.zeros_like(values)
+    for k in range(values.shape[2]):
+        sums = np.bincount(flat, weights=values[..., k][mask], minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / cnt
+        out[..., k][mask] = values[..., k][mask] - means[flat]
+    return out
+
+
+@_panel_op
+def neutralize(
+    x: np.ndarray,
+    groups=None,
+    exposures=None,
+    ridge: float = 1e-8,
+) -> np.ndarray:
+    """
+    Residual of x after a per-date least-squares regression on industry
+    dummies and/or numeric exposures (e.g. log market cap, beta).
+
+    groups:    industry labels per asset (N,) or per date x asset (T, N);
+               cells with a missing label are dropped from that date.
+    exposures: one (T, N) array or a list of them.
+    Without groups an intercept is fitted. All dates are solved at once as a
+    batch of small normal-equation systems; only cells where x, the group and
+    every exposure are known enter the regression, others come back NaN.
+    """
+    if exposures is None:
+        exposures = []
+    elif not isinstance(exposures, (list, tuple)):
+        exposures = [exposures]
+    exp = [_as_float(e) for e in exposures]
+    if any(e.shape != x.shape for e in exp):
+        raise ValueError("neutralize: every exposure must have the same shape as x")
+
+    mask = ~np.isnan(x)
+    for e in exp:
+        mask &= ~np.isnan(e)
+
+    # y and exposures stacked as (T, N, 1 + K)
+    values = np.stack([x, *exp], axis=2)
+    if groups is not None:
+        codes, n_groups = _group_codes(groups, x.shape)
+        mask &= codes >= 0
+        # Frisch-Waugh: projecting out the dummies == demeaning within groups
+        resid = _demean_by_group(values, codes, n_groups, mask)
+    else:
+        n = mask.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(mask[..., None], values, 0.0).sum(axis=1) / n[:, None]
+        resid = np.where(mask[..., None], values - mean[:, None, :], 0.0)
+
+    y, X = resid[..., 0], resid[..., 1:]
+    if X.shape[2]:
+        k = X.shape[2]
+        xtx = np.einsum("tnk,tnl->tkl", X, X) + ridge * np.eye(k)
+        xty = np.einsum("tnk,tn->tk", X, y)
+        beta = np.linalg.solve(xtx, xty[..., None])[..., 0]
+        y = y - np.einsum("tnk,tk->tn", X, beta)
+    return np.where(mask, y, np.nan)
+
+
+# ── time-series ────────────────────────────────────────────
+
+# relative size below which a running-sum variance is rounding error, i.e. zero
+_VAR_EPS = 1e-12
+
+
+def _check_window(window: int, min_periods: int | None) -> int:
+    if window < 1:
+        raise ValueError(f"window must be >= 1, got {window}")
+    return window if min_periods is None else max(1, min(min_periods, window))
+
+
+def _rolling_sum(v: np.ndarray, window: int) -> np.ndarray:
+    """Trailing window sum along axis 0 via cumulative sums (v must be NaN-free)."""
+    c = np.concatenate([np.zeros((1, v.shape[1])), np.cumsum(v, axis=0)])
+    lag = np.maximum(np.arange(1, len(v) + 1) - window, 0)
+    return c[1:] - c[lag]
+
+
+def _shift(x: np.ndarray, periods: int) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    if periods == 0:
+        out[:] = x
+    elif 0 < periods < len(x):
+        out[periods:] = x[:-periods]
+    elif -len(x) < periods < 0:
+        out[:periods] = x[-periods:]
+    return out
+
+
+@_panel_op
+def ts_delay(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    """Value `periods` rows earlier."""
+    return _shift(x, periods)
+
+
+@_panel_op
+def ts_delta(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    """x minus its value `periods` rows earlier."""
+    return x - _shift(x, periods)
+
+
+@_panel_op
+def ts_sum(x: np.ndarray, window: int, min_periods: int | None = None) -> np.ndarray:
+    """Trailing sum over `window` rows; NaN where fewer than min_periods (default window) are valid."""
+    min_periods = _check_window(window, min_periods)
+    valid = ~np.isnan(x)
+    n = _rolling_sum(valid.astype("float64"), window)
+    s = _rolling_sum(np.where(valid, x, 0.0), window)
+    return np.where(n >= min_periods, s, np.nan)
+
+
+@_panel_op
+def ts_mean(x: np.ndarray, window: int, min_periods: int | None = None) -> np.ndarray:
+    """Trailing mean over `window` rows, skipping NaN."""
+    min_periods = _check_window(window, min_periods)
+    valid = ~np.isnan(x)
+    n = _rolling_sum(valid.astype("float64"), window)
+    s = _rolling_sum(np.where(valid, x, 0.0), window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n >= min_periods, s / n, np.nan)
+
+
+@_panel_op
+def ts_std(x: np.ndarray, window: int, min_periods: int | None = None) -> np.ndarray:
+    """Trailing sample standard deviation (ddof=1) over `window` rows, skipping NaN."""
+    min_periods = max(_check_window(window, min_periods), 2)
+    valid = ~np.isnan(x)
+    # centre each column first so the running sums of squares stay well conditioned
+    with np.errstate(invalid="ignore"):
+        centre = np.nan_to_num(np.nanmean(np.where(valid, x, np.nan), axis=0))
+    v = np.where(valid, x - centre, 0.0)
+    n = _rolling_sum(valid.astype("float64"), window)
+    s = _rolling_sum(v, window)
+    ss = _rolling_sum(v * v, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (ss - s * s / n) / (n - 1)
+        var = np.where(var * (n - 1) > _VAR_EPS * ss, var, 0.0)     # cancellation noise of a flat window
+    return np.where(n >= min_periods, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+
+@_panel_op
+def ts_corr(x: np.ndarray, y: np.ndarray, window: int, min_periods: int | None = None) -> np.ndarray:
+    """Trailing Pearson correlation of x and y over rows where both are valid."""
+    min_periods = max(_check_window(window, min_periods), 2)
+    y = _as_float(y)
+    if y.shape != x.shape:
+        raise ValueError(f"ts_corr: shapes differ {x.shape} vs {y.shape}")
+    valid = ~(np.isnan(x) | np.isnan(y))
+    with np.errstate(invalid="ignore"):
+        cx = np.nan_to_num(np.nanmean(np.where(valid, x, np.nan), axis=0))
+        cy = np.nan_to_num(np.nanmean(np.where(valid, y, np.nan), axis=0))
+    a = np.where(valid, x - cx, 0.0)
+    b = np.where(valid, y - cy, 0.0)
+    n = _rolling_sum(valid.astype("float64"), window)
+    sa, sb = _rolling_sum(a, window), _rolling_sum(b, window)
+    saa, sbb, sab = _rolling_sum(a * a, window), _rolling_sum(b * b, window), _rolling_sum(a * b, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sab - sa * sb / n
+        var_a = saa - sa * sa / n
+        var_b = sbb - sb * sb / n
+        r = cov / np.sqrt(var_a * var_b)
+    r = np.clip(r, -1.0, 1.0)
+    flat = (var_a <= _VAR_EPS * saa) | (var_b <= _VAR_EPS * sbb)       # cancellation noise, not variance
+    return np.where((n >= min_periods) & ~flat, r, np.nan)
+
+
+@_panel_op
+def ts_rank(x: np.ndarray, window: int, min_periods: int | None = None) -> np.ndarray:
+    """
+    Percentile rank (0, 1] of the current value within its trailing window,
+    ties counted as half. NaN where the current value is NaN.
+    """
+    min_periods = _check_window(window, min_periods)
+    less = np.zeros_like(x)
+    equal = np.zeros_like(x)
+    n = (~np.isnan(x)).astype("float64")
+    for lag in range(1, window):
+        past = _shift(x, lag)
+        less += past < x
+        equal += past == x
+        n += ~np.isnan(past)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = (less + 0.5 * equal + 1.0) / n
+    return np.where(~np.isnan(x) & (n >= min_periods), out, np.nan)
+
+
+@_panel_op
+def decay_linear(x: np.ndarray, window: int, min_periods: int | None = None) -> np.ndarray:
+    """
+    Linearly decaying weighted mean: weight `window` on today down to 1 on
+    the oldest row. Missing rows are skipped and the weights renormalised.
+    """
+    min_periods = _check_window(window, min_periods)
+    # weight of row s at date t is s - (t - window): two running sums give
+    #   sum(w * x) = sum(s * x) - (t - window) * sum(x)
+    valid = ~np.isnan(x)
+    v = np.where(valid, x, 0.0)
+    m = valid.astype("float64")
+    s = np.arange(len(x), dtype="float64")[:, None]
+    base = s - window
+    total = _rolling_sum(s * v, window) - base * _rolling_sum(v, window)
+    weight = _rolling_sum(s * m, window) - base * _rolling_sum(m, window)
+    n = _rolling_sum(m, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n >= min_periods, total / weight, np.nan)
+
+OPERATORS = {
+    f.__name__: f
+    for f in (
+        cs_rank, cs_zscore, winsorize, neutralize,
+        ts_delay, ts_delta, ts_sum, ts_mean, ts_std, ts_corr, ts_rank, decay_linear,
+    )
+}
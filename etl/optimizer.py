@@ -0,0 +1,548 @@
+"""
+Portfolio optimization: factor scores -> optimized weights (roadmap stage five).
+
+Covariance estimates come from raw.daily_prices returns over a trailing
+window ending at each rebalance date, with one of two estimators:
+  - ledoit_wolf: sample covariance shrunk towards a scaled identity with the
+    Ledoit-Wolf (2004) optimal intensity
+  - factor: statistical factor model, the top `n_factors` principal
+    components of the window plus diagonal specific variance (kept in
+    factored form, so large universes never build an n x n matrix)
+Assets need `min_obs` of the window observed to enter an estimate; missing
+returns inside the window count as zero.
+
+Solvers (long-only, fully invested, optional per-asset cap):
+  - mean_variance: max alpha'w - risk_aversion/2 * w'Sw by accelerated
+    projected gradient onto the capped simplex, alpha = ic * vol * zscore
+    (Grinold) of the signal, everything in daily units
+  - risk_parity: equal risk contributions w_i (Sw)_i by damped Newton on
+    1/2 y'Sy - b'log y, w = y / sum(y) (the cap does not apply)
+solve_path() walks all rebalance dates in order and starts each solve (and
+the power iteration for the step size) from the previous date's solution.
+
+Estimates are cached per date under CACHE_DIR/cov, keyed by estimator and
+window, together with the raw.daily_prices watermark. When prices only
+gained newer dates, cached dates are reused and only new rebalance dates
+are estimated; a revision of older prices rebuilds the cache. Within a
+run, Ledoit-Wolf windows are advanced with rolling cross-product sums
+(add the new rows, drop the old ones) instead of re-summing each window.
+
+Usage:
+    python etl/optimizer.py --factor mom_20 --method mean_variance --cov ledoit_wolf --freq M --max-weight 0.05
+    python etl/optimizer.py --factor mom_20 --method risk_parity --cov factor --top-fraction 0.2 --weights-csv w.csv
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import traceback
+from dataclasses import asdict, dataclass
+from typing import NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from backtest import BacktestConfig, BacktestData, load_data, run_backtest
+from base import get_conn, put_conn
+from config import CACHE_DIR
+from operators import cs_rank, cs_zscore
+
+logger = logging.getLogger(__name__)
+
+_COV_DIR = CACHE_DIR / "cov"
+REANCHOR_STEPS = 24     # rolling sums are recomputed from scratch this often to bound drift
+
+
+@dataclass(frozen=True)
+class OptimizerConfig:
+    method: str = "mean_variance"   # mean_variance / risk_parity
+    cov_method: str = "ledoit_wolf" # ledoit_wolf / factor
+    window: int = 252               # trading days of returns per estimate
+    n_factors: int = 10             # principal components for cov_method="factor"
+    min_obs: float = 0.8            # fraction of the window an asset must have traded
+    risk_aversion: float = 10.0
+    ic: float = 0.05                # information coefficient used to scale alpha
+    top_fraction: float = 1.0       # keep this fraction of valid names, best signal first
+    max_weight: float | None = None
+    freq: str = "M"
+    cost_bps: float = 10.0
+    signal_lag: int = 1
+    tol: float = 1e-8
+    max_iter: int = 500
+
+
+class CovEstimate(NamedTuple):
+    codes: np.ndarray               # assets covered, sorted
+    cov: np.ndarray | None          # (n, n) dense covariance, or None in factored form
+    loadings: np.ndarray | None     # (n, k) factor exposures scaled by factor vol
+    specific: np.ndarray | None     # (n,) specific variances
+
+    def take(self, idx: np.ndarray) -> "CovEstimate":
+        if self.cov is not None:
+            return CovEstimate(self.codes[idx], self.cov[np.ix_(idx, idx)], None, None)
+        return CovEstimate(self.codes[idx], None, self.loadings[idx], self.specific[idx])
+
+    def matvec(self, x: np.ndarray) -> np.ndarray:
+        if self.cov is not None:
+            return self.cov @ x
+        return self.loadings @ (self.loadings.T @ x) + self.specific * x
+
+    def variances(self) -> np.ndarray:
+        if self.cov is not None:
+            return np.diag(self.cov).copy()
+        return (self.loadings ** 2).sum(axis=1) + self.specific
+
+
+# ── covariance estimation ──────────────────────────────────
+
+def ledoit_wolf(x: np.ndarray, xtx: np.ndarray | None = None, sx: np.ndarray | None = None) -> np.ndarray:
+    """
+    Ledoit-Wolf shrinkage of the (biased) sample covariance of the T x n
+    window x towards mu * I. xtx / sx (x'x and column sums) may be passed
+    in when they are maintained incrementally; the fourth-moment term is
+    an O(T n) pass over x either way.
+    """
+    t, n = x.shape
+    if xtx is None:
+        xtx = x.T @ x
+    if sx is None:
+        sx = x.sum(axis=0)
+    m = sx / t
+    s = xtx / t - np.outer(m, m)
+    mu = np.trace(s) / n
+    d2 = (np.sum(s * s) - 2 * mu * np.trace(s) + n * mu * mu) / n
+    norms = np.einsum("ij,ij->i", x - m, x - m)
+    b2 = (np.sum(norms ** 2) - t * np.sum(s * s)) / (n * t * t)
+    shrink = min(max(b2, 0.0), d2) / d2 if d2 > 0 else 1.0
+    out = (1.0 - shrink) * s
+    out[np.diag_indices(n)] += shrink * mu
+    return out
+
+
+def factor_model(x: np.ndarray, n_factors: int) -> tuple[np.ndarray, np.ndarray]:
+    """PCA factor model of the T x n window -> (loadings (n, k), specific variances (n,))."""
+    t, n = x.shape
+    xc = x - x.mean(axis=0)
+    k = max(1, min(n_factors, n - 1, t - 1))
+    _, s, vt = np.linalg.svd(xc, full_matrices=False)
+    loadings = vt[:k].T * (s[:k] / np.sqrt(t))
+    total = (xc ** 2).mean(axis=0)
+    specific = np.maximum(total - (loadings ** 2).sum(axis=1), 1e-6 * max(total.mean(), 1e-12))
+    return loadings, specific
+
+
+def price_watermark(conn, through: str | None = None) -> tuple[int, str | None]:
+    sql = "SELECT COUNT(*), MAX(trade_date) FROM raw.daily_prices"
+    params: list = []
+    if through is not None:
+        sql += " WHERE trade_date <= %s"
+        params.append(through)
+    with conn.cursor() as cur:
+        cur.execute(sql, params or None)
+        count, max_date = cur.fetchone()
+    return int(count), (str(max_date) if max_date else None)
+
+
+def _cache_dir(cfg: OptimizerConfig):
+    name = f"{cfg.cov_method}_w{cfg.window}_m{cfg.min_obs:g}"
+    if cfg.cov_method == "factor":
+        name += f"_k{cfg.n_factors}"
+    return _COV_DIR / name
+
+
+def _read_meta(path) -> dict:
+    try:
+        return json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(path, meta: dict) -> None:
+    tmp = path / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp, path / "meta.json")
+
+
+def _save_estimate(path, day: str, est: CovEstimate) -> None:
+    arrays = {"codes": est.codes}
+    if est.cov is not None:
+        arrays["cov"] = est.cov.astype("float32")
+    else:
+        arrays["loadings"] = est.loadings.astype("float32")
+        arrays["specific"] = est.specific
+    tmp = path / f"{day}.tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path / f"{day}.npz")
+
+
+def _load_estimate(path, day: str) -> CovEstimate:
+    with np.load(path / f"{day}.npz") as f:
+        if "cov" in f:
+            return CovEstimate(f["codes"], f["cov"].astype("float64"), None, None)
+        return CovEstimate(f["codes"], None, f["loadings"].astype("float64"), f["specific"])
+
+
+def _open_cache(conn, cfg: OptimizerConfig):
+    """Cache directory and the dates whose estimates are still valid for the current prices."""
+    path = _cache_dir(cfg)
+    path.mkdir(parents=True, exist_ok=True)
+    meta = _read_meta(path)
+    count, max_date = price_watermark(conn)
+    unchanged = meta.get("row_count") == count and meta.get("max_date") == max_date
+    appended = (
+        meta.get("max_date")
+        and max_date
+        and max_date > meta["max_date"]
+        and price_watermark(conn, meta["max_date"])[0] == meta.get("row_count")
+    )
+    if unchanged or appended:
+        cached = set(meta.get("dates", []))
+    else:
+        if meta:
+            logger.info(f"{path.name}: prices revised, rebuilding covariance cache")
+        for old in path.glob("*.npz"):
+            old.unlink()
+        cached = set()
+    return path, {"row_count": count, "max_date": max_date, "dates": sorted(cached)}
+
+
+def covariance_path(
+    returns: np.ndarray,
+    dates: np.ndarray,
+    codes: np.ndarray,
+    rows: np.ndarray,
+    cfg: OptimizerConfig,
+    conn=None,
+) -> dict[int, CovEstimate]:
+    """
+    Covariance estimates for the given (ascending) rows of the returns grid,
+    each from the `window` rows ending at that row. Rows without a full
+    window get no estimate. With conn, estimates are read from / written to
+    the on-disk cache.
+    """
+    w = cfg.window
+    rows = [int(r) for r in rows if r - w + 1 >= 1]      # returns row 0 is always NaN
+    if not rows:
+        return {}
+    cache, meta = (None, None)
+    if conn is not None:
+        cache, meta = _open_cache(conn, cfg)
+    cached = set(meta["dates"]) if meta else set()
+
+    x = np.nan_to_num(returns, nan=0.0)
+    observed = ~np.isnan(returns)
+    need_obs = cfg.min_obs * w
+
+    out: dict[int, CovEstimate] = {}
+    xtx = sx = cnt = None
+    prev, steps = None, 0
+    for r in rows:
+        day = str(dates[r])
+        if day in cached:
+            out[r] = _load_estimate(cache, day)
+            continue
+        lo = r - w + 1
+        if cfg.cov_method == "ledoit_wolf":
+            if prev is None or r - prev >= w or steps >= REANCHOR_STEPS:
+                xtx = x[lo: r + 1].T @ x[lo: r + 1]
+                sx = x[lo: r + 1].sum(axis=0)
+                cnt = observed[lo: r + 1].sum(axis=0)
+                steps = 0
+            else:
+                add, drop = slice(prev + 1, r + 1), slice(prev - w + 1, lo)
+                xtx += x[add].T @ x[add] - x[drop].T @ x[drop]
+                sx += x[add].sum(axis=0) - x[drop].sum(axis=0)
+                cnt += observed[add].sum(axis=0) - observed[drop].sum(axis=0)
+                steps += 1
+            prev = r
+            idx = np.flatnonzero(cnt >= need_obs)
+            if len(idx) < 2:
+                continue
+            cov = ledoit_wolf(x[lo: r + 1, idx], xtx[np.ix_(idx, idx)], sx[idx])
+            est = CovEstimate(codes[idx], cov, None, None)
+        elif cfg.cov_method == "factor":
+            idx = np.flatnonzero(observed[lo: r + 1].sum(axis=0) >= need_obs)
+            if len(idx) < 2:
+                continue
+            loadings, specific = factor_model(x[lo: r + 1, idx], cfg.n_factors)
+            est = CovEstimate(codes[idx], None, loadings, specific)
+        else:
+            raise ValueError(f"Unknown covariance method {cfg.cov_method!r}; use ledoit_wolf or factor")
+        out[r] = est
+        if cache is not None:
+            _save_estimate(cache, day, est)
+            cached.add(day)
+
+    if cache is not None:
+        _write_meta(cache, {**meta, "dates": sorted(cached)})
+    return out
+
+
+# ── solvers ────────────────────────────────────────────────
+
+def project_capped_simplex(v: np.ndarray, cap: float | None = None, iterations: int = 60) -> np.ndarray:
+    """Euclidean projection onto {0 <= w <= cap, sum(w) = 1} (bisection on the shift)."""
+    n = len(v)
+    cap = 1.0 if cap is None else max(cap, 1.0 / n)
+    lo, hi = v.min() - 1.0, v.max()
+    for _ in range(iterations):
+        tau = 0.5 * (lo + hi)
+        if np.clip(v - tau, 0.0, cap).sum() > 1.0:
+            lo = tau
+        else:
+            hi = tau
+    return np.clip(v - 0.5 * (lo + hi), 0.0, cap)
+
+
+def _top_eigenvalue(est: CovEstimate, v0: np.ndarray | None, iterations: int = 50) -> tuple[float, np.ndarray]:
+    v = np.ones(len(est.codes)) if v0 is None else v0.copy()
+    v /= np.linalg.norm(v)
+    lam = 0.0
+    for _ in range(iterations):
+        u = est.matvec(v)
+        lam_new = float(v @ u)
+        v = u / np.linalg.norm(u)
+        if abs(lam_new - lam) <= 1e-6 * abs(lam_new):
+            lam = lam_new
+            break
+        lam = lam_new
+    return lam, v
+
+
+def mean_variance(
+    alpha: np.ndarray,
+    est: CovEstimate,
+    risk_aversion: float,
+    max_weight: float | None = None,
+    w0: np.ndarray | None = None,
+    lipschitz: float | None = None,
+    tol: float = 1e-8,
+    max_iter: int = 500,
+) -> tuple[np.ndarray, int]:
+    """max alpha'w - risk_aversion/2 w'Sw over the capped simplex (FISTA). Returns (w, iterations)."""
+    n = len(alpha)
+    if lipschitz is None:
+        lipschitz = risk_aversion * _top_eigenvalue(est, None)[0]
+    step = 1.0 / max(lipschitz * 1.1, 1e-12)
+    w = project_capped_simplex(np.full(n, 1.0 / n) if w0 is None else w0, max_weight)
+    y, t = w, 1.0
+    for it in range(1, max_iter + 1):
+        grad = risk_aversion * est.matvec(y) - alpha
+        w_new = project_capped_simplex(y - step * grad, max_weight)
+        if np.abs(w_new - w).sum() < tol:
+            return w_new, it
+        if (y - w_new) @ (w_new - w) > 0:       # momentum overshoots: adaptive restart
+            t = 1.0
+        t_new = 0.5 * (1.0 + np.sqrt(1.0 + 4.0 * t * t))
+        y = w_new + (t - 1.0) / t_new * (w_new - w)
+        w, t = w_new, t_new
+    return w, max_iter
+
+
+def risk_parity(
+    est: CovEstimate,
+    budget: np.ndarray | None = None,
+    w0: np.ndarray | None = None,
+    tol: float = 1e-8,
+    max_iter: int = 500,
+) -> tuple[np.ndarray, int]:
+    """
+    Weights whose risk contributions w_i (Sw)_i are proportional to budget.
+
+    Minimizes the strictly convex f(y) = 1/2 y'Sy - b'log y with damped
+    Newton steps (backtracking keeps y > 0 and f decreasing), which
+    converges for any positive definite S, negative covariances included;
+    at the minimum y_i (Sy)_i = b_i. The Newton system S + diag(b / y^2) is
+    solved directly for a dense estimate and through the Woodbury identity
+    in factored form. Returns (w = y / sum(y), Newton iterations).
+    """
+    n = len(est.codes)
+    b = np.full(n, 1.0 / n) if budget is None else budget / budget.sum()
+    y = 1.0 / np.sqrt(est.variances()) if w0 is None else np.maximum(w0, 1e-12)
+    y = y * np.sqrt(b.sum() / (y @ est.matvec(y)))      # optimal scale along the starting ray
+
+    def objective(v):
+        return 0.5 * v @ est.matvec(v) - b @ np.log(v)
+
+    f = objective(y)
+    for it in range(1, max_iter + 1):
+        grad = est.matvec(y) - b / y
+        curv = b / (y * y)
+        if est.cov is not None:
+            dy = -np.linalg.solve(est.cov + np.diag(curv), grad)
+        else:
+            inv_d = 1.0 / (est.specific + curv)
+            lt = est.loadings.T * inv_d                     # L' D^-1
+            core = np.eye(est.loadings.shape[1]) + lt @ est.loadings
+            dy = -(inv_d * grad - lt.T @ np.linalg.solve(core, lt @ grad))
+        decrement = -grad @ dy                              # squared Newton decrement
+        if np.abs(dy).max() <= tol * y.max():               # inside the quadratic region: take the full step
+            y = y + dy
+            return y / y.sum(), it
+        t = 1.0
+        neg = dy < 0
+        if neg.any():
+            t = min(1.0, 0.99 * float(np.min(-y[neg] / dy[neg])))
+        while True:
+            f_new = objective(y + t * dy)
+            if f_new <= f - 0.25 * t * decrement or t < 1e-12:
+                break
+            t *= 0.5
+        y, f = y + t * dy, f_new
+    logger.warning(f"risk_parity: no convergence after {max_iter} Newton iterations (decrement {decrement:.3g})")
+    return y / y.sum(), max_iter
+
+
+# ── rebalance path ─────────────────────────────────────────
+
+def _warm_start(prev_w: np.ndarray | None, prev_codes: np.ndarray | None, codes: np.ndarray) -> np.ndarray | None:
+    """Map the previous solution onto the current universe; new names start at the average weight."""
+    if prev_w is None or len(prev_codes) == 0:
+        return None
+    pos = np.searchsorted(prev_codes, codes)
+    hit = (pos < len(prev_codes)) & (prev_codes[np.minimum(pos, len(prev_codes) - 1)] == codes)
+    w = np.full(len(codes), 1.0 / len(codes))
+    w[hit] = prev_w[pos[hit]]
+    return w / w.sum()
+
+
+def solve_path(
+    signal: np.ndarray,
+    codes: np.ndarray,
+    rows: np.ndarray,
+    estimates: dict[int, CovEstimate],
+    cfg: OptimizerConfig,
+) -> tuple[np.ndarray, dict]:
+    """
+    Optimized weights on every row in `rows` (already lagged signal), each
+    solve warm-started from the previous date. Returns (targets on the full
+    grid, solver diagnostics).
+    """
+    targets = np.zeros(signal.shape)
+    z = cs_zscore(signal)
+    pct = cs_rank(signal)
+    prev_w = prev_codes = eig_v = None
+    iters, solved = [], 0
+    for r in rows:
+        est = estimates.get(int(r))
+        if est is None:
+            continue
+        cols = np.minimum(np.searchsorted(codes, est.codes), len(codes) - 1)
+        keep = codes[cols] == est.codes                 # cached estimates may cover codes off this grid
+        keep &= ~np.isnan(pct[r, cols])
+        if cfg.top_fraction < 1.0:
+            keep &= pct[r, cols] > 1.0 - cfg.top_fraction
+        idx = np.flatnonzero(keep)
+        if len(idx) < 2:
+            continue
+        sub = est.take(idx)
+        w0 = _warm_start(prev_w, prev_codes, sub.codes)
+        if cfg.method == "mean_variance":
+            vol = np.sqrt(sub.variances())
+            zs = z[r, cols[idx]]
+            alpha = cfg.ic * vol * np.nan_to_num(zs - np.nanmean(zs))
+            v0 = None if eig_v is None else _warm_start(np.abs(eig_v), prev_codes, sub.codes)
+            lam, eig_v = _top_eigenvalue(sub, v0)
+            w, it = mean_variance(alpha, sub, cfg.risk_aversion, cfg.max_weight, w0,
+                                  cfg.risk_aversion * lam, cfg.tol, cfg.max_iter)
+        elif cfg.method == "risk_parity":
+            w, it = risk_parity(sub, None, w0, cfg.tol, cfg.max_iter)
+        else:
+            raise ValueError(f"Unknown optimizer method {cfg.method!r}; use mean_variance or risk_parity")
+        targets[r, cols[idx]] = w
+        prev_w, prev_codes = w, sub.codes
+        iters.append(it)
+        solved += 1
+    diag = {
+        "rebalances": int(len(rows)),
+        "solved": solved,
+        "mean_iterations": float(np.mean(iters)) if iters else 0.0,
+        "max_iterations": int(max(iters)) if iters else 0,
+    }
+    return targets, diag
+
+
+def optimize(data: BacktestData, cfg: OptimizerConfig, conn=None) -> tuple[np.ndarray, dict]:
+    """Target weights on data's grid for cfg.freq rebalances -> (targets, diagnostics)."""
+    freq = cfg.freq.upper()
+    if freq not in data.rebalance:
+        raise ValueError(f"rebalance mask for {cfg.freq} not loaded")
+    signal = data.signal
+    if cfg.signal_lag > 0:
+        signal = np.vstack([np.full((cfg.signal_lag, signal.shape[1]), np.nan), signal[:-cfg.signal_lag]])
+    rows = np.flatnonzero(data.rebalance[freq])
+    estimates = covariance_path(data.returns, data.dates, data.codes, rows, cfg, conn)
+    return solve_path(signal, data.codes, rows, estimates, cfg)
+
+
+def run_optimized(data: BacktestData, cfg: OptimizerConfig, conn=None) -> dict:
+    """Optimize, then backtest the weights -> {config, stats, solver, dates, equity, targets}."""
+    targets, diag = optimize(data, cfg, conn)
+    bt = BacktestConfig(freq=cfg.freq, cost_bps=cfg.cost_bps, signal_lag=cfg.signal_lag)
+    result = run_backtest(data, bt, targets=targets)
+    return {**result, "config": asdict(cfg), "solver": diag, "targets": targets}
+
+
+def _clean(v):
+    if isinstance(v, float) and not np.isfinite(v):
+        return None
+    return v
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Factor portfolio optimization")
+    parser.add_argument("--factor", required=True)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--method", default="mean_variance", choices=["mean_variance", "risk_parity"])
+    parser.add_argument("--cov", default="ledoit_wolf", choices=["ledoit_wolf", "factor"])
+    parser.add_argument("--window", type=int, default=252)
+    parser.add_argument("--n-factors", type=int, default=10)
+    parser.add_argument("--min-obs", type=float, default=0.8)
+    parser.add_argument("--risk-aversion", type=float, default=10.0)
+    parser.add_argument("--ic", type=float, default=0.05)
+    parser.add_argument("--top-fraction", type=float, default=1.0)
+    parser.add_argument("--max-weight", type=float, default=None)
+    parser.add_argument("--freq", default="M", choices=["D", "W", "M"])
+    parser.add_argument("--cost-bps", type=float, default=10.0)
+    parser.add_argument("--signal-lag", type=int, default=1)
+    parser.add_argument("--weights-csv", default=None, help="write rebalance weights (long format) to this file")
+    args = parser.parse_args()
+
+    cfg = OptimizerConfig(
+        method=args.method, cov_method=args.cov, window=args.window, n_factors=args.n_factors,
+        min_obs=args.min_obs, risk_aversion=args.risk_aversion, ic=args.ic, top_fraction=args.top_fraction,
+        max_weight=args.max_weight, freq=args.freq, cost_bps=args.cost_bps, signal_lag=args.signal_lag,
+    )
+    try:
+        conn = get_conn()
+        try:
+            data = load_data(conn, args.factor, args.start, args.end, freqs=(cfg.freq,))
+            logger.info(f"Loaded {len(data.dates)} dates x {len(data.codes)} assets for {args.factor}")
+            result = run_optimized(data, cfg, conn)
+        finally:
+            put_conn(conn)
+
+        if args.weights_csv:
+            r, c = np.nonzero(result["targets"])
+            pd.DataFrame({
+                "trade_date": data.dates[r],
+                "asset_code": data.codes[c],
+                "weight": result["targets"][r, c],
+            }).to_csv(args.weights_csv, index=False)
+        out = {
+            "config": result["config"],
+            "solver": result["solver"],
+            "stats": {k: _clean(v) for k, v in result["stats"].items()},
+        }
+        print(json.dumps(out, ensure_ascii=False, indent=2))
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
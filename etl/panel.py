@@ -0,0 +1,521 @@
+"""
+Wide (date x asset) panels over processed.feature_series for factor scripts.
+
+load_panel() returns dense float64 matrices plus date / target index arrays,
+backed by a memory-mapped on-disk cache under CACHE_DIR/panels so that many
+factor runs share one zero-copy panel instead of each re-reading and
+pivoting the long-format table.
+
+Cache layout per (target_type, transform_method):
+    meta.json              current version + DB watermark (row count, max obs_date,
+                           latest processed.feature_series_writes version)
+    v<N>/dates.npy         datetime64[D], ascending
+    v<N>/ids.npy           int64 target ids (columns)
+    v<N>/codes.npy         asset / indicator codes aligned with ids
+    v<N>/<field>.npy       float64 (n_dates, n_targets), NaN where missing
+
+A refresh builds the panel in a private temporary directory, renames it to
+the next free version directory and then swaps meta.json, so readers holding
+an older mmap are never affected and concurrent refreshes never write into
+the same directory. Writers log every write of a series with
+record_feature_write; when the writes since the cached version only touched
+dates after the cached max obs_date, just those rows are fetched and merged
+into the existing matrices, otherwise the panel is rebuilt.
+"""
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from base import copy_query, get_conn, put_conn
+from config import CACHE_DIR
+
+PANEL_FIELDS = ("raw_value", "transformed_value")
+
+_PANEL_DIR = CACHE_DIR / "panels"
+
+
+class Panel(NamedTuple):
+    dates: np.ndarray               # datetime64[D], shape (n_dates,)
+    ids: np.ndarray                 # int64 target ids, shape (n_targets,)
+    codes: np.ndarray               # asset_code / indicator_code per column
+    values: dict[str, np.ndarray]   # field -> (n_dates, n_targets) float64
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.values[key]
+        return tuple.__getitem__(self, key)
+
+
+def pivot_long(row_keys, col_keys, values, row_index=None, col_index=None):
+    """
+    Scatter long-format (row_key, col_key, value) triples into a dense matrix.
+    Returns (matrix, row_index, col_index); missing cells are NaN. Explicit
+    row_index / col_index must be sorted; keys outside them are dropped.
+    """
+    row_keys = np.asarray(row_keys)
+    col_keys = np.asarray(col_keys)
+    values = np.asarray(values, dtype="float64")
+
+    if row_index is None:
+        row_index, ri = np.unique(row_keys, return_inverse=True)
+        row_ok = np.ones(len(ri), dtype=bool)
+    else:
+        ri = np.searchsorted(row_index, row_keys)
+        ri_c = np.minimum(ri, len(row_index) - 1)
+        row_ok = (ri < len(row_index)) & (row_index[ri_c] == row_keys)
+        ri = ri_c
+    if col_index is None:
+        col_index, ci = np.unique(col_keys, return_inverse=True)
+        col_ok = np.ones(len(ci), dtype=bool)
+    else:
+        ci = np.searchsorted(col_index, col_keys)
+        ci_c = np.minimum(ci, len(col_index) - 1)
+        col_ok = (ci < len(col_index)) & (col_index[ci_c] == col_keys)
+        ci = ci_c
+
+    ok = row_ok & col_ok
+    matrix = np.full((len(row_index), len(col_index)), np.nan)
+    matrix[ri[ok], ci[ok]] = values[ok]
+    return matrix, row_index, col_index
+
+
+# ── cache bookkeeping ──────────────────────────────────────
+
+def _cache_dir(target_type: str, transform_method: str):
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in transform_method)
+    return _PANEL_DIR / f"{target_type}__{safe}"
+
+
+def _read_meta(path) -> dict:
+    try:
+        return json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _open_version(path, version: int) -> Panel:
+    vdir = path / f"v{version}"
+    values = {f: np.load(vdir / f"{f}.npy", mmap_mode="r") for f in PANEL_FIELDS}
+    return Panel(
+        dates=np.load(vdir / "dates.npy"),
+        ids=np.load(vdir / "ids.npy"),
+        codes=np.load(vdir / "codes.npy"),
+        values=values,
+    )
+
+
+def _versions(path) -> list[int]:
+    return [int(p.name[1:]) for p in path.glob("v*") if p.name[1:].isdigit()]
+
+
+def _write_version(path, meta: dict, panel: Panel) -> dict:
+    """
+    Build panel in a private temporary directory, rename it to the next free
+    v<N>, then atomically swap meta.json unless a concurrent refresh already
+    published a newer version.
+    """
+    build = Path(tempfile.mkdtemp(prefix=".build-", dir=path))
+    try:
+        np.save(build / "dates.npy", panel.dates)
+        np.save(build / "ids.npy", panel.ids)
+        np.save(build / "codes.npy", panel.codes)
+        for f in PANEL_FIELDS:
+            np.save(build / f"{f}.npy", np.ascontiguousarray(panel.values[f]))
+        version = max([meta.get("version", 0), *_versions(path)]) + 1
+        while True:
+            try:
+                os.replace(build, path / f"v{version}")
+                break
+            except OSError:
+                if not (path / f"v{version}").exists():
+                    raise
+                version += 1          # claimed by a concurrent refresh
+    except BaseException:
+        shutil.rmtree(build, ignore_errors=True)
+        raise
+
+    new_meta = {**meta, "version": version}
+    if _read_meta(path).get("version", 0) < version:
+        tmp = path / f"meta.json.{uuid.uuid4().hex}.tmp"
+        tmp.write_text(json.dumps(new_meta), encoding="utf-8")
+        os.replace(tmp, path / "meta.json")
+
+    # keep the previous version for readers that opened it moments ago
+    for old in _versions(path):
+        if old < version - 1:
+            shutil.rmtree(path / f"v{old}", ignore_errors=True)
+    return new_meta
+
+
+# ── DB access ──────────────────────────────────────────────
+
+def _watermark(conn, target_type: str, transform_method: str, through=None) -> tuple[int, str | None]:
+    sql = (
+        "SELECT COUNT(*), MAX(obs_date) FROM processed.feature_series"
+        " WHERE target_type = %s AND transform_method = %s"
+    )
+    params: list = [target_type, transform_method]
+    if through is not None:
+        sql += " AND obs_date <= %s"
+        params.append(through)
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        count, max_date = cur.fetchone()
+    return int(count), (str(max_date) if max_date else None)
+
+
+def _write_state(conn, target_type: str, transform_method: str, since_version) -> tuple[int, str | None]:
+    """Latest logged write version of a series and the earliest obs_date written after since_version."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COALESCE(MAX(version), 0), MIN(min_obs_date) FILTER (WHERE version > %s)"
+            " FROM processed.feature_series_writes WHERE target_type = %s AND transform_method = %s",
+            (since_version or 0, target_type, transform_method),
+        )
+        version, changed_from = cur.fetchone()
+    return int(version), (str(changed_from) if changed_from else None)
+
+
+def record_feature_write(conn, df: pd.DataFrame) -> None:
+    """
+    Log a committed write of processed.feature_series (columns obs_date,
+    target_type, transform_method): one new version per series in df with
+    the obs_date range written. Call it after the rows are committed, so a
+    reader never sees the new version together with the old rows.
+    """
+    if df.empty:
+        return
+    dates = pd.to_datetime(df["obs_date"])
+    stats = dates.groupby([df["target_type"], df["transform_method"]]).agg(["min", "max", "size"])
+    with conn.cursor() as cur:
+        for (target_type, method), (lo, hi, n) in stats.sort_index().iterrows():   # fixed lock order
+            # serialises writers of one series until commit, so versions appear in commit order
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"feature_series/{target_type}/{method}",))
+            cur.execute(
+                """
+                INSERT INTO processed.feature_series_writes
+                    (target_type, transform_method, version, min_obs_date, max_obs_date, row_count)
+                SELECT %s, %s, COALESCE(MAX(version), 0) + 1, %s, %s, %s
+                FROM processed.feature_series_writes WHERE target_type = %s AND transform_method = %s
+                """,
+                (target_type, method, lo.date(), hi.date(), int(n), target_type, method),
+            )
+    conn.commit()
+
+
+def _fetch_rows(conn, target_type: str, transform_method: str, after: str | None = None):
+    sql = (
+        "SELECT obs_date, target_id, raw_value, transformed_value"
+        " FROM processed.feature_series"
+        " WHERE target_type = %s AND transform_method = %s"
+    )
+    params: list = [target_type, transform_method]
+    if after:
+        sql += " AND obs_date > %s"
+        params.append(after)
+    df = copy_query(conn, sql, params, dtype={"target_id": "int64"})
+    dates = df["obs_date"].to_numpy(dtype="datetime64[D]")
+    return dates, df["target_id"].to_numpy(), df
+
+
+def _fetch_codes(conn, target_type: str, ids: np.ndarray) -> np.ndarray:
+    if target_type == "asset":
+        sql = "SELECT id, asset_code FROM meta.assets WHERE id = ANY(%s)"
+    else:
+        sql = "SELECT id, indicator_code FROM meta.indicators WHERE id = ANY(%s)"
+    with conn.cursor() as cur:
+        cur.execute(sql, ([int(i) for i in ids],))
+        mapping = dict(cur.fetchall())
+    return np.array([mapping.get(int(i)) or str(int(i)) for i in ids])
+
+
+def _build_full(conn, target_type: str, transform_method: str) -> Panel:
+    dates, ids, df = _fetch_rows(conn, target_type, transform_method)
+    values = {}
+    d_index = i_index = None
+    for f in PANEL_FIELDS:
+        values[f], d_index, i_index = pivot_long(dates, ids, df[f].to_numpy(), d_index, i_index)
+    return Panel(d_index, i_index.astype("int64"), _fetch_codes(conn, target_type, i_index), values)
+
+
+def _extend(conn, old: Panel, target_type: str, transform_method: str, after: str) -> Panel:
+    """Merge rows with obs_date > after into an existing panel."""
+    dates, ids, df = _fetch_rows(conn, target_type, transform_method, after)
+    new_dates = np.unique(dates)              # all > old.dates[-1] by construction
+    all_dates = np.concatenate([old.dates, new_dates])
+    all_ids = np.union1d(old.ids, ids).astype("int64")
+
+    col_pos = np.searchsorted(all_ids, old.ids)
+    values = {}
+    for f in PANEL_FIELDS:
+        mat = np.full((len(all_dates), len(all_ids)), np.nan)
+        mat[: len(old.dates), col_pos] = old.values[f]
+        mat[len(old.dates):], _, _ = pivot_long(dates, ids, df[f].to_numpy(), new_dates, all_ids)
+        values[f] = mat
+
+    if len(all_ids) == len(old.ids):
+        codes = old.codes
+    else:
+        codes = _fetch_codes(conn, target_type, all_ids)
+    return Panel(all_dates, all_ids, codes, values)
+
+
+def refresh_panel(conn, transform_method: str, target_type: str = "asset") -> tuple[Panel, dict]:
+    """Bring the on-disk cache up to date with the DB and return the mmapped panel."""
+    path = _cache_dir(target_type, transform_method)
+    path.mkdir(parents=True, exist_ok=True)
+    meta = _read_meta(path)
+    # read the markers before the rows: a write landing in between only makes the cache look older
+    write_version, changed_from = _write_state(conn, target_type, transform_method, meta.get("write_version"))
+    count, max_date = _watermark(conn, target_type, transform_method)
+
+    if (
+        meta.get("version")
+        and meta.get("row_count") == count
+        and meta.get("max_date") == max_date
+        and meta.get("write_version") == write_version
+    ):
+        return _open_version(path, meta["version"]), meta
+
+    incremental = (
+        meta.get("version")
+        and meta.get("max_date")
+        and "write_version" in meta
+        and max_date
+        and max_date > meta["max_date"]
+        and (changed_from is None or changed_from > meta["max_date"])     # no rewrite of cached dates
+        and _watermark(conn, target_type, transform_method, meta["max_date"])[0] == meta["row_count"]
+    )
+    if incremental:
+        panel = _extend(conn, _open_version(path, meta["version"]), target_type, transform_method, meta["max_date"])
+    else:
+        panel = _build_full(conn, target_type, transform_method)
+
+    meta = _write_version(
+        path, {**meta, "row_count": count, "max_date": max_date, "write_version": write_version}, panel
+    )
+    return _open_version(path, meta["version"]), meta
+
+
+def load_panel(
+    transform_method: str,
+    fields: str | list[str] | tuple[str, ...] = ("transformed_value",),
+    start: str | None = None,
+    end: str | None = None,
+    target_type: str = "asset",
+    conn=None,
+) -> Panel:
+    """
+    Load processed.feature_series for one transform_method as date x target matrices.
+
+    Returns Panel(dates, ids, codes, values) where values[field] is a read-only
+    (n_dates, n_targets) float64 view of the memory-mapped cache; panel["field"]
+    is shorthand for panel.values["field"]. The date window slices rows without
+    copying. Copy a matrix (np.array(m)) before modifying it in place.
+    """
+    if isinstance(fields, str):
+        fields = [fields]
+    unknown = [f for f in fields if f not in PANEL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown panel fields {unknown}; available: {list(PANEL_FIELDS)}")
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+    try:
+        panel, _ = refresh_panel(conn, transform_method, target_type)
+    finally:
+        if own_conn:
+            put_conn(conn)
+
+    lo = np.searchsorted(panel.dates, np.datetime64(start, "D")) if start else 0
+    hi = np.searchsorted(panel.dates, np.datetime64(end, "D"), side="right") if end else len(panel.dates)
+    return Panel(
+        dates=panel.dates[lo:hi],
+        ids=panel.ids,
+        codes=panel.codes,
+        values={f: panel.values[f][lo:hi] for f in fields},
+    )
+
+
+# ── factor / price panels (uncached) ───────────────────────
+
+def load_factor_panel(conn, factor_name: str, start: str | None = None, end: str | None = None):
+    """
+    Read one factor from factors.asset_values as a (n_dates, n_assets) matrix.
+    Returns (matrix, dates[datetime64[D]], asset_codes). Served from the
+    Parquet factor store when it is in sync with the database.
+    """
+    import factor_store
+
+    if factor_store.is_fresh(conn, factor_name):
+        df = factor_store.read_factor(factor_name, start, end)
+        return pivot_long(
+            df["trade_date"].to_numpy(dtype="datetime64[D]"),
+            df["asset_code"].to_numpy(dtype=str),
+            df["value"].to_numpy(dtype="float64"),
+        )
+
+    sql = "SELECT trade_date, asset_code, value FROM factors.asset_values WHERE factor_name = %s"
+    params: list = [factor_name]
+    if start:
+        sql += " AND trade_date >= %s"
+        params.append(start)
+    if end:
+        sql += " AND trade_date <= %s"
+        params.append(end)
+    df = copy_query(conn, sql, params, dtype={"asset_code": str})
+    return pivot_long(
+        df["trade_date"].to_numpy(dtype="datetime64[D]"),
+        df["asset_code"].to_numpy(dtype=str),
+        df["value"].to_numpy(),
+    )
+
+
+PRICE_FIELDS = ("open", "high", "low", "close")
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    """Carry the last non-NaN value down each column; leading NaNs stay NaN."""
+    idx = np.where(np.isnan(matrix), 0, np.arange(len(matrix))[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return matrix[idx, np.arange(matrix.shape[1])]
+
+
+def adjust_prices(prices: np.ndarray, adj_factor: np.ndarray, how: str = "backward") -> np.ndarray:
+    """
+    Apply Wind cumulative adjustment factors to unadjusted prices on the
+    same (n_dates, n_assets) grid.
+
+    backward: price * adj_factor (history fixed, later prices scaled up)
+    forward:  price * adj_factor / adj_factor[last row] (the last date of the
+              grid keeps its traded price; earlier prices are scaled down)
+
+    Factors only change on ex-dates, so gaps are filled from the previous
+    row (leading gaps from the first known factor); assets without any
+    factor, such as indexes, are left unadjusted.
+    """
+    if how not in ("forward", "backward"):
+        raise ValueError(f"Unknown adjustment {how!r}; use 'forward' or 'backward'")
+    adj = _ffill(np.asarray(adj_factor, dtype="float64"))
+    adj = _ffill(adj[::-1])[::-1]                  # leading gaps
+    adj = np.where(np.isnan(adj), 1.0, adj)
+    if how == "forward" and len(adj):
+        adj = adj / adj[-1]
+    return prices * adj
+
+
+def load_price_panel(
+    conn,
+    field: str = "close",
+    codes: list[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    adjust: str | None = None,
+):
+    """
+    Read one raw.daily_prices column as a (n_dates, n_assets) matrix keyed by
+    asset_code. Prices are stored unadjusted next to Wind's adj_factor;
+    adjust="backward" / "forward" applies it to open / high / low / close
+    (see adjust_prices; forward is anchored on the last date read, i.e.
+    `end`). Use an adjusted series for returns.
+    Returns (matrix, dates[datetime64[D]], asset_codes).
+    """
+    if field not in (*PRICE_FIELDS, "volume", "amount", "pct_chg", "adj_factor"):
+        raise ValueError(f"Unknown price field: {field}")
+    if adjust and field not in PRICE_FIELDS:
+        raise ValueError(f"adjust only applies to {PRICE_FIELDS}, not {field}")
+    extra = ", p.adj_factor" if adjust else ""
+    sql = (
+        f"SELECT p.trade_date, a.asset_code, p.{field} AS value{extra}"
+        " FROM raw.daily_prices p JOIN meta.assets a ON a.id = p.asset_id"
+        " WHERE TRUE"
+    )
+    params: list = []
+    if codes:
+        sql += " AND a.asset_code = ANY(%s)"
+        params.append(list(codes))
+    if start:
+        sql += " AND p.trade_date >= %s"
+        params.append(start)
+    if end:
+        sql += " AND p.trade_date <= %s"
+        params.append(end)
+    df = copy_query(conn, sql, params or None, dtype={"asset_code": str})
+    dates = df["trade_date"].to_numpy(dtype="datetime64[D]")
+    asset_codes = df["asset_code"].to_numpy(dtype=str)
+    matrix, d_index, c_index = pivot_long(dates, asset_codes, df["value"].to_numpy())
+    if adjust:
+        adj, _, _ = pivot_long(dates, asset_codes, df["adj_factor"].to_numpy(), d_index, c_index)
+        matrix = adjust_prices(matrix, adj, adjust)
+    return matrix, d_index, c_index
+
+
+def align(matrix: np.ndarray, dates: np.ndarray, codes: np.ndarray, to_dates: np.ndarray, to_codes: np.ndarray):
+    """Reindex a (dates x codes) matrix onto another sorted grid; missing cells become NaN."""
+    out = np.full((len(to_dates), len(to_codes)), np.nan)
+    if out.size == 0:
+        return out
+    di = np.searchsorted(to_dates, dates)
+    ci = np.searchsorted(to_codes, codes)
+    d_ok = (di < len(to_dates)) & (to_dates[np.minimum(di, len(to_dates) - 1)] == dates)
+    c_ok = (ci < len(to_codes)) & (to_codes[np.minimum(ci, len(to_codes) - 1)] == codes)
+    out[np.ix_(di[d_ok], ci[c_ok])] = matrix[np.ix_(d_ok, c_ok)]
+    return out
+
+
+# ── index universes (meta.index_constituents) ──────────────
+
+def universe_asof(conn, index_code: str, dates):
+    """
+    Members of index_code on each of `dates` in one query, as a long
+    DataFrame (trade_date, asset_code) sorted by date then code.
+    """
+    days = [str(d) for d in np.asarray(dates, dtype="datetime64[D]")]
+    sql = (
+        "SELECT d.trade_date, c.asset_code"
+        " FROM unnest(%s::date[]) AS d(trade_date)"
+        " JOIN meta.index_constituents c"
+        "   ON c.index_code = %s AND c.in_date <= d.trade_date"
+        "  AND (c.out_date IS NULL OR c.out_date > d.trade_date)"
+        " ORDER BY d.trade_date, c.asset_code"
+    )
+    return copy_query(conn, sql, (days, index_code), dtype={"asset_code": str})
+
+
+def load_universe_mask(conn, index_code: str, dates, codes=None):
+    """
+    Membership of index_code as a (n_dates, n_codes) bool matrix on a
+    sorted date grid. codes defaults to every code ever in the index over
+    the window. Returns (mask, dates[datetime64[D]], codes).
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    if len(dates) == 0:
+        codes = np.array([], dtype=str) if codes is None else np.asarray(codes)
+        return np.zeros((0, len(codes)), dtype=bool), dates, codes
+    sql = (
+        "SELECT asset_code, in_date, out_date FROM meta.index_constituents"
+        " WHERE index_code = %s AND in_date <= %s AND (out_date IS NULL OR out_date > %s)"
+    )
+    df = copy_query(conn, sql, (index_code, str(dates[-1]), str(dates[0])), dtype={"asset_code": str})
+    iv_codes = df["asset_code"].to_numpy(dtype=str)
+    codes = np.unique(iv_codes) if codes is None else np.asarray(codes)
+
+    ci = np.searchsorted(codes, iv_codes)
+    ok = (ci < len(codes)) & (codes[np.minimum(ci, len(codes) - 1)] == iv_codes)
+    lo = np.searchsorted(dates, df["in_date"].to_numpy(dtype="datetime64[D]"))
+    out = pd.to_datetime(df["out_date"]).to_numpy(dtype="datetime64[D]")      # NULL -> NaT
+    hi = np.where(np.isnat(out), len(dates), np.searchsorted(dates, out))
+
+    # +1 where an interval starts, -1 where it ends; a running sum > 0 means member
+    delta = np.zeros((len(dates) + 1, len(codes)), dtype=np.int32)
+    np.add.at(delta, (lo[ok], ci[ok]), 1)
+    np.add.at(delta, (hi[ok], ci[ok]), -1)
+    return np.cumsum(delta[:-1], axis=0) > 0, dates, codes
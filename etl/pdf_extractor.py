@@ -1,11 +1,24 @@
 """
 Extract text from PDF files.
-Usage: python etl/pdf_extractor.py --pdf <path>
-Outputs JSON: {"ok": true, "text": "..."}
+
+Pages are extracted in parallel across a process pool (one page range per
+task) and the result is cached under CACHE_DIR/pdf by the SHA-256 of the file
+content, so uploading the same paper again costs a hash and a file read.
+
+Usage:
+    python etl/pdf_extractor.py --pdf <path> [--workers N] [--no-cache] [--stream]
+
+Outputs JSON: {"ok": true, "text": "...", "pages": N, "cached": bool}
+With --stream, one JSON line per page as soon as it (and every page before
+it) is ready: {"page": 1, "text": "..."}, then a final
+{"ok": true, "pages": N, "cached": bool}.
 """
 import argparse
+import hashlib
 import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 try:
     from pypdf import PdfReader
@@ -13,21 +26,115 @@ except ImportError:
     print(json.dumps({"ok": False, "error": "pypdf not installed"}))
     sys.exit(1)
 
-def extract_text(pdf_path: str) -> str:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import CACHE_DIR
+
+PDF_CACHE_DIR = CACHE_DIR / "pdf"
+MIN_PAGES_PER_TASK = 4      # below this a task costs more to start than to run
+
+
+def file_hash(pdf_path: str) -> str:
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_cache(digest: str) -> list[str] | None:
+    path = PDF_CACHE_DIR / f"{digest}.json"
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))["pages"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_cache(digest: str, pages: list[str]) -> None:
+    PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PDF_CACHE_DIR / f"{digest}.json"
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"pages": pages}, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _extract_range(pdf_path: str, start: int, stop: int) -> list[str]:
+    """Runs in a worker: text of pages [start, stop)."""
     reader = PdfReader(pdf_path)
-    text_parts = []
-    for page in reader.pages:
-        text_parts.append(page.extract_text())
-    return "\n\n".join(text_parts)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _ranges(n_pages: int, workers: int) -> list[tuple[int, int]]:
+    # ~2 tasks per worker so a slow range does not leave the others idle
+    size = max(MIN_PAGES_PER_TASK, -(-n_pages // (workers * 2)))
+    return [(i, min(i + size, n_pages)) for i in range(0, n_pages, size)]
+
+
+def iter_pages(pdf_path: str, workers: int | None = None, use_cache: bool = True):
+    """
+    Yield (page_number, text) in page order, 1-based. Ranges are extracted
+    in parallel and each page is yielded as soon as every page before it is
+    done. The generator's return value is True when served from cache.
+    """
+    digest = file_hash(pdf_path) if use_cache else None
+    pages = _read_cache(digest) if digest else None
+    if pages is not None:
+        for i, text in enumerate(pages, 1):
+            yield i, text
+        return True
+
+    n_pages = len(PdfReader(pdf_path).pages)
+    workers = max(1, min(workers or os.cpu_count() or 1, -(-n_pages // MIN_PAGES_PER_TASK)))
+    ranges = _ranges(n_pages, workers)
+    pages = []
+    if workers == 1:
+        for start, stop in ranges:
+            for text in _extract_range(pdf_path, start, stop):
+                pages.append(text)
+                yield len(pages), text
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_extract_range, pdf_path, start, stop) for start, stop in ranges]
+            for future in futures:
+                for text in future.result():
+                    pages.append(text)
+                    yield len(pages), text
+
+    if digest:
+        _write_cache(digest, pages)
+    return False
+
+
+def extract_text(pdf_path: str, workers: int | None = None, use_cache: bool = True) -> str:
+    return "\n\n".join(text for _, text in iter_pages(pdf_path, workers, use_cache))
+
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--pdf", required=True)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not write the content-hash cache")
+    parser.add_argument("--stream", action="store_true", help="print one JSON line per page as it is ready")
     args = parser.parse_args()
 
     try:
-        text = extract_text(args.pdf)
-        print(json.dumps({"ok": True, "text": text}, ensure_ascii=False))
+        pages = iter_pages(args.pdf, args.workers, not args.no_cache)
+        texts = []
+        n_pages = 0
+        while True:
+            try:
+                n_pages, text = next(pages)
+            except StopIteration as stop:
+                cached = bool(stop.value)
+                break
+            if args.stream:
+                print(json.dumps({"page": n_pages, "text": text}, ensure_ascii=False), flush=True)
+            else:
+                texts.append(text)
+        result = {"ok": True, "pages": n_pages, "cached": cached}
+        if not args.stream:
+            result["text"] = "\n\n".join(texts)
+        print(json.dumps(result, ensure_ascii=False))
     except Exception as e:
         print(json.dumps({"ok": False, "error": str(e)}))
         sys.exit(1)
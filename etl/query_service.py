@@ -0,0 +1,253 @@
+"""
+Long-lived read service for the web server.
+
+src/server.ts forwards /api/factors/list, /api/factors/data and the
+schema-context endpoints here instead of starting a Python interpreter per
+request. The process keeps pandas / pyarrow imported and a warm
+base.get_pool() connection pool, and answers JSON over HTTP on localhost
+(QUERY_SERVICE_HOST / QUERY_SERVICE_PORT, default 127.0.0.1:3002):
+
+    GET /health
+    GET /factors/list
+    GET /factors/data?factor=mom_20[&start=2024-01-01][&end=2024-12-31][&codes=600000.SH,000001.SZ]
+                     [&level=asset|market] [&max_points=500&method=lttb|minmax] | [&limit=5000[&after=...]]
+    GET /schema-context[?schemas=processed,raw]
+
+Responses are {"ok": true, ...} or {"ok": false, "error": ...} with a 4xx /
+5xx status. Requests run on a thread each; at most POOL_MAXCONN of them hold
+a database connection at a time, and a connection that went bad (e.g. the
+database restarted) is dropped and the request retried once.
+
+/factors/list and /factors/data responses are cached in memory
+(factor_cache.py, QUERY_CACHE_MB) under the normalized query and dropped per
+factor when a writer sends NOTIFY factor_changed; the X-Cache response header
+says hit or miss.
+
+Usage:
+    python etl/query_service.py [--host 127.0.0.1] [--port 3002]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import psycopg2
+
+from base import POOL_MAXCONN, get_conn, put_conn
+from config import QUERY_CACHE_MB, QUERY_SERVICE_HOST, QUERY_SERVICE_PORT
+from factor_cache import ALL, FactorChangeListener, ResultCache
+from factor_query import factor_data, list_factors
+from schema_inspector import SCHEMAS, inspect_schemas
+
+logger = logging.getLogger(__name__)
+
+_db_slots = threading.BoundedSemaphore(POOL_MAXCONN)
+_cache = ResultCache(int(QUERY_CACHE_MB * 1024 * 1024))
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def with_conn(fn, *args, **kwargs):
+    """Run fn(conn, ...) on a pooled connection, retrying once on a dropped connection."""
+    with _db_slots:
+        for attempt in (1, 2):
+            conn = get_conn()
+            try:
+                result = fn(conn, *args, **kwargs)
+                conn.rollback()         # never leave a read transaction open on a pooled connection
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                put_conn(conn, close=True)
+                if attempt == 2:
+                    raise
+                logger.warning("query_service: database connection lost, retrying")
+                continue
+            except Exception:
+                conn.rollback()
+                put_conn(conn)
+                raise
+            put_conn(conn)
+            return result
+
+
+def _param(query: dict, name: str, required: bool = False) -> str | None:
+    value = (query.get(name) or [""])[0].strip()
+    if required and not value:
+        raise BadRequest(f"Missing {name}")
+    return value or None
+
+
+def _list(query: dict, name: str) -> list[str] | None:
+    value = _param(query, name)
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+# ── routes ─────────────────────────────────────────────────
+
+def health(_query: dict) -> dict:
+    return {"ok": True, "pid": os.getpid(), "uptime_s": round(time.time() - _started, 1), "cache": _cache.stats()}
+
+
+def factors_list(_query: dict) -> dict:
+    return {"ok": True, "factors": with_conn(list_factors)}
+
+
+def _int(query: dict, name: str) -> int | None:
+    value = _param(query, name)
+    if value is None:
+        return None
+    try:
+        n = int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer") from None
+    if n <= 0:
+        raise BadRequest(f"{name} must be positive")
+    return n
+
+
+def _date(query: dict, name: str) -> str | None:
+    value = _param(query, name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise BadRequest(f"{name} must be a date (YYYY-MM-DD)") from None
+
+
+def _data_args(query: dict) -> dict:
+    """factor_data keyword arguments, normalized so equivalent queries share a cache key."""
+    codes = _list(query, "codes")
+    max_points = _int(query, "max_points")
+    return {
+        "factor_name": _param(query, "factor", required=True),
+        "start": _date(query, "start"),
+        "end": _date(query, "end"),
+        "asset_codes": sorted(set(codes)) if codes else None,
+        "max_points": max_points,
+        "method": (_param(query, "method") or "lttb") if max_points else "lttb",
+        "after": _param(query, "after"),
+        "limit": _int(query, "limit"),
+        "level": _param(query, "level") or "asset",
+    }
+
+
+def factors_data(query: dict) -> dict:
+    try:
+        result = with_conn(factor_data, **_data_args(query))
+    except ValueError as e:
+        raise BadRequest(str(e)) from None
+    return {"ok": True, **result}
+
+
+def _cache_key(path: str, query: dict) -> tuple[tuple, str] | None:
+    """(key, tag) for cacheable routes, None otherwise."""
+    if path == "/factors/list":
+        return (path,), ALL
+    if path == "/factors/data":
+        args = _data_args(query)
+        key = (path,) + tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in sorted(args.items()))
+        return key, args["factor_name"]
+    return None
+
+
+def schema_context(query: dict) -> dict:
+    schemas = _list(query, "schemas") or SCHEMAS
+    unknown = [s for s in schemas if s not in SCHEMAS]
+    if unknown:
+        raise BadRequest(f"Unknown schemas {unknown}; available: {SCHEMAS}")
+    return {"ok": True, "data": with_conn(inspect_schemas, schemas)}
+
+
+ROUTES = {
+    "/health": health,
+    "/factors/list": factors_list,
+    "/factors/data": factors_data,
+    "/schema-context": schema_context,
+}
+CACHED_ROUTES = ("/factors/list", "/factors/data")
+
+
+def _encode(body: dict) -> bytes:
+    # NaN / Infinity are not JSON; fail loudly instead of sending a body JSON.parse rejects
+    return json.dumps(body, ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # keep-alive between requests from server.ts
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/") or "/"
+        route = ROUTES.get(path)
+        started = time.perf_counter()
+        cached = None
+        if route is None:
+            status, payload = 404, _encode({"ok": False, "error": f"Unknown path {url.path}"})
+        else:
+            query = parse_qs(url.query)
+            try:
+                cacheable = _cache_key(path, query) if _cache.enabled else None
+                if cacheable is not None:
+                    cached = _cache.get(cacheable[0])
+                if cached is not None:
+                    status, payload = 200, cached
+                else:
+                    token = _cache.token(cacheable[1]) if cacheable is not None else None
+                    status, payload = 200, _encode(route(query))
+                    if cacheable is not None:
+                        _cache.put(cacheable[0], cacheable[1], payload, token)
+            except BadRequest as e:
+                status, payload = 400, _encode({"ok": False, "error": str(e)})
+            except Exception as e:
+                logger.error(f"{url.path} failed:\n{traceback.format_exc()}")
+                status, payload = 500, _encode({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        if status == 200 and path in CACHED_ROUTES:
+            self.send_header("X-Cache", "hit" if cached is not None else "miss")
+        self.end_headers()
+        self.wfile.write(payload)
+        logger.info(f"GET {self.path} -> {status} ({len(payload)} B, {(time.perf_counter() - started) * 1000:.0f} ms"
+                    f"{', cached' if cached is not None else ''})")
+
+    def log_message(self, format, *args):     # request lines are logged in do_GET
+        pass
+
+
+_started = time.time()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent read service for the web server")
+    parser.add_argument("--host", default=QUERY_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=QUERY_SERVICE_PORT)
+    args = parser.parse_args()
+
+    put_conn(get_conn())        # open the pool (and fail fast on bad credentials) before listening
+    if _cache.max_bytes > 0:
+        FactorChangeListener(_cache).start()
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    server.daemon_threads = True
+    logger.info(f"query_service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
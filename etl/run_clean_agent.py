@@ -2,6 +2,7 @@
 ETL Clean Agent
 功能：从 DB 读取 raw 数据样本 → 填充 prompt 模板 → 调用 LLM →
       提取生成的 process_data() 函数 → 沙盒预览 → 确认后全量写入 processed.feature_series
+      daily_return / YoY / MoM / volatility_20d 等标准转换请直接使用 transforms.py，无需经过 LLM
 
 用法：
   # 清洗宏观指标（indicator_id=1，对应 meta.indicators.id）
@@ -28,7 +29,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 import pandas as pd
 import psycopg2
 from base import get_conn, put_conn, upsert
+from panel import record_feature_write
 from llm_client import LLMClient
+from sandbox import run_process_data
 
 logger = logging.getLogger(__name__)
 
@@ -164,37 +167,22 @@ def _extract_code(llm_response: str) -> str:
 
 def _run_in_sandbox(code: str, raw_df: pd.DataFrame, target_type: str, target_id: int) -> pd.DataFrame:
     """
-    在受控命名空间中 exec 生成的代码，调用 process_data()，返回结果 DataFrame。
-    注意：沙盒模式下 upsert 是 no-op，不真正写库。
+    在 sandbox worker 子进程中 exec 生成的代码，调用 process_data()，返回结果 DataFrame。
+    worker 受 CPU / 内存 / 墙钟时间限制，数据经 Arrow 文件进出；
+    沙盒模式下 upsert 是 no-op，不真正写库。
     """
-    def _noop_upsert(*args, **kwargs):
-        return 0
-
-    ns: dict = {
-        "pd": pd,
-        "np": __import__("numpy"),
-        "get_conn": get_conn,
-        "put_conn": put_conn,
-        "upsert": _noop_upsert,   # 沙盒：禁止写库
-        "psycopg2": psycopg2,
-    }
-
-    exec(compile(code, "<llm_generated>", "exec"), ns)   # noqa: S102
-
-    if "process_data" not in ns:
-        raise ValueError("LLM 生成的代码中未定义 process_data 函数。")
-
-    result = ns["process_data"](raw_df.copy(), target_type, target_id)
-
-    if not isinstance(result, pd.DataFrame):
-        raise TypeError(f"process_data 应返回 DataFrame，实际返回: {type(result)}")
+    result = run_process_data(code, raw_df, target_type, target_id)
+    logger.info(f"      {result.summary()}")
+    if not result.ok:
+        raise RuntimeError(f"process_data 沙盒执行失败: {result.error}")
 
+    out = result.output
     required_cols = {"obs_date", "target_type", "target_id", "raw_value", "transformed_value", "transform_method"}
-    missing = required_cols - set(result.columns)
+    missing = required_cols - set(out.columns)
     if missing:
         raise ValueError(f"返回的 DataFrame 缺少必要列: {missing}")
 
-    return result
+    return out
 
 
 # ══════════════════════════════════════════════════════════════
@@ -212,13 +200,15 @@ def _write_to_db(conn, result_df: pd.DataFrame) -> int:
             "transformed_value": float(row["transformed_value"]) if pd.notna(row["transformed_value"]) else None,
             "transform_method":  str(row["transform_method"]),
         })
-    return upsert(
+    n = upsert(
         conn,
         table="processed.feature_series",
         rows=rows,
         conflict_cols=["obs_date", "target_type", "target_id", "transform_method"],
         update_cols=["raw_value", "transformed_value"],
     )
+    record_feature_write(conn, result_df)      # 写入已提交后再登记版本，供面板缓存/血缘判断改写
+    return n
 
 
 # ══════════════════════════════════════════════════════════════
@@ -0,0 +1,334 @@
+"""
+生成代码隔离执行引擎
+LLM 生成的清洗/因子脚本与 process_data() 不再在宿主进程内 exec，
+而是放到独立 worker 子进程中运行：
+  · resource rlimit 限制 CPU 时间与地址空间（仅 POSIX；Windows 下只有墙钟超时）
+  · 墙钟超时后强制 kill
+  · worker 结束时上报运行时间与峰值 RSS
+  · DataFrame 通过 Arrow IPC 文件进出 worker（读端内存映射），不走 pickle
+
+用法：
+  from sandbox import run_script, run_process_data
+  result = run_script("factor.py", namespace="factor")
+  result = run_process_data(code, raw_df, "asset", 2)
+  print(result.runtime_s, result.peak_rss_mb, result.output)
+
+worker 入口（由本模块自行拉起）：python sandbox.py --worker <spec.json>
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import SANDBOX_MAX_CPU_S, SANDBOX_MAX_MEMORY_MB, SANDBOX_TIMEOUT_S
+
+try:
+    import resource
+except ImportError:          # Windows
+    resource = None
+
+_WORKER = os.path.abspath(__file__)
+
+# worker 退出码
+EXIT_ERROR = 1
+EXIT_MEMORY = 3
+
+
+@dataclass
+class SandboxResult:
+    ok: bool
+    returncode: int
+    runtime_s: float
+    peak_rss_mb: float | None = None
+    timed_out: bool = False
+    error: str | None = None
+    output: object = None           # run_process_data 的结果 DataFrame
+
+    def summary(self) -> str:
+        rss = f"{self.peak_rss_mb:.1f} MB" if self.peak_rss_mb is not None else "未知"
+        status = "超时" if self.timed_out else ("成功" if self.ok else "失败")
+        return f"[sandbox] {status}，运行 {self.runtime_s:.2f}s，峰值内存 {rss}"
+
+
+def default_limits() -> dict:
+    """从 config 读取默认限制；值 <= 0 表示不限制。"""
+    return {
+        "timeout_s":     SANDBOX_TIMEOUT_S,
+        "max_memory_mb": SANDBOX_MAX_MEMORY_MB,
+        "max_cpu_s":     SANDBOX_MAX_CPU_S,
+    }
+
+
+def add_limit_args(parser: argparse.ArgumentParser) -> None:
+    """沙盒资源限制参数（clean_runner / factor_runner 等命令行共用）。"""
+    defaults = default_limits()
+    parser.add_argument("--timeout", type=float, default=defaults["timeout_s"],
+                        help="墙钟超时秒数（<=0 不限制）")
+    parser.add_argument("--max-memory-mb", type=float, default=defaults["max_memory_mb"],
+                        help="地址空间上限 MB（<=0 不限制，仅 POSIX）")
+    parser.add_argument("--max-cpu-s", type=float, default=defaults["max_cpu_s"],
+                        help="CPU 时间上限秒数（<=0 不限制，仅 POSIX）")
+
+
+def limits_from_args(args) -> dict:
+    return {
+        "timeout_s":     args.timeout,
+        "max_memory_mb": args.max_memory_mb,
+        "max_cpu_s":     args.max_cpu_s,
+    }
+
+
+# ══════════════════════════════════════════════════════════════
+# 资源限制与统计（worker 侧）
+# ══════════════════════════════════════════════════════════════
+
+def apply_limits(max_memory_mb: float = 0, max_cpu_s: float = 0) -> None:
+    """在当前进程设置地址空间与 CPU 时间上限。非 POSIX 平台静默跳过。"""
+    if resource is None:
+        return
+    if max_memory_mb and max_memory_mb > 0:
+        limit = int(max_memory_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if max_cpu_s and max_cpu_s > 0:
+        soft = int(max_cpu_s)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 1))
+
+
+def peak_rss_mb() -> float | None:
+    """当前进程峰值 RSS（MB）；ru_maxrss 在 Linux 为 KB、macOS 为字节。"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+
+# ══════════════════════════════════════════════════════════════
+# Arrow IPC 数据交换
+# ══════════════════════════════════════════════════════════════
+
+def write_arrow(df, path: str) -> None:
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_arrow(path: str):
+    import pyarrow as pa
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+# ══════════════════════════════════════════════════════════════
+# 父进程接口
+# ══════════════════════════════════════════════════════════════
+
+def _spawn(spec: dict, workdir: str, limits: dict, env: dict | None, capture: bool) -> SandboxResult:
+    spec_path = os.path.join(workdir, "spec.json")
+    stats_path = os.path.join(workdir, "stats.json")
+    spec["stats"] = stats_path
+    spec["limits"] = limits
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+
+    child_env = dict(os.environ)
+    if env:
+        child_env.update(env)
+
+    timeout = limits.get("timeout_s") or None
+    if timeout is not None and timeout <= 0:
+        timeout = None
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, _WORKER, "--worker", spec_path],
+        env=child_env,
+        stderr=subprocess.PIPE if capture else None,
+        text=True,
+        encoding="utf-8",
+    )
+    timed_out = False
+    stderr = ""
+    try:
+        _, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        _, stderr = proc.communicate()
+        timed_out = True
+    runtime = time.perf_counter() - t0
+
+    stats: dict = {}
+    if os.path.exists(stats_path):
+        with open(stats_path, encoding="utf-8") as f:
+            stats = json.load(f)
+
+    error = stats.get("error")
+    if timed_out:
+        error = f"执行超时（>{timeout}s），已终止"
+    elif proc.returncode < 0:
+        error = f"worker 被信号 {-proc.returncode} 终止（可能超出 CPU 时间或内存上限）"
+    elif proc.returncode != 0 and not error:
+        error = (stderr or "").strip()[-2000:] or f"worker exited {proc.returncode}"
+
+    return SandboxResult(
+        ok=proc.returncode == 0 and not timed_out,
+        returncode=proc.returncode,
+        runtime_s=stats.get("runtime_s", runtime),
+        peak_rss_mb=stats.get("peak_rss_mb"),
+        timed_out=timed_out,
+        error=error,
+    )
+
+
+def run_script(
+    script_path: str,
+    namespace: str = "clean",
+    limits: dict | None = None,
+    env: dict | None = None,
+) -> SandboxResult:
+    """
+    在 worker 子进程中执行整个脚本文件。
+    namespace: 'clean'（clean_runner 预置命名空间）或 'factor'（factor_namespace）。
+    脚本的 stdout/stderr 直接透传给调用方，便于 SSE 实时日志。
+    """
+    limits = {**default_limits(), **(limits or {})}
+    workdir = tempfile.mkdtemp(prefix="sandbox_")
+    try:
+        spec = {"mode": "script", "namespace": namespace, "script": os.path.abspath(script_path)}
+        return _spawn(spec, workdir, limits, env, capture=False)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_process_data(
+    code: str,
+    raw_df,
+    target_type: str,
+    target_id: int,
+    limits: dict | None = None,
+) -> SandboxResult:
+    """
+    在 worker 子进程中 exec 生成代码并调用 process_data(raw_df, target_type, target_id)。
+    输入/输出 DataFrame 均经 Arrow IPC 文件传递；成功时结果放在 result.output。
+    worker 内 upsert 为 no-op，生成代码无法直接写库。
+    """
+    limits = {**default_limits(), **(limits or {})}
+    workdir = tempfile.mkdtemp(prefix="sandbox_")
+    try:
+        code_path = os.path.join(workdir, "llm_generated.py")
+        in_path = os.path.join(workdir, "input.arrow")
+        out_path = os.path.join(workdir, "output.arrow")
+        with open(code_path, "w", encoding="utf-8") as f:
+            f.write(code)
+        write_arrow(raw_df, in_path)
+
+        spec = {
+            "mode": "process_data",
+            "script": code_path,
+            "input": in_path,
+            "output": out_path,
+            "target_type": target_type,
+            "target_id": target_id,
+        }
+        result = _spawn(spec, workdir, limits, None, capture=True)
+        if result.ok:
+            result.output = read_arrow(out_path)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ══════════════════════════════════════════════════════════════
+# worker 侧
+# ══════════════════════════════════════════════════════════════
+
+def _build_namespace(name: str) -> dict:
+    if name == "factor":
+        from factor_namespace import build_namespace
+    else:
+        from clean_runner import build_namespace
+    return build_namespace()
+
+
+def _worker_process_data(spec: dict) -> None:
+    import numpy as np
+    import pandas as pd
+    import psycopg2
+    from base import get_conn, put_conn
+
+    def _noop_upsert(*args, **kwargs):
+        return 0
+
+    ns: dict = {
+        "pd": pd,
+        "np": np,
+        "get_conn": get_conn,
+        "put_conn": put_conn,
+        "upsert": _noop_upsert,   # 沙盒：禁止写库
+        "psycopg2": psycopg2,
+    }
+    with open(spec["script"], encoding="utf-8") as f:
+        code = f.read()
+    exec(compile(code, "<llm_generated>", "exec"), ns)   # noqa: S102
+
+    if "process_data" not in ns:
+        raise ValueError("LLM 生成的代码中未定义 process_data 函数。")
+
+    raw_df = read_arrow(spec["input"])
+    result = ns["process_data"](raw_df, spec["target_type"], spec["target_id"])
+    if not isinstance(result, pd.DataFrame):
+        raise TypeError(f"process_data 应返回 DataFrame，实际返回: {type(result)}")
+    write_arrow(result, spec["output"])
+
+
+def _worker_main(spec_path: str) -> int:
+    with open(spec_path, encoding="utf-8") as f:
+        spec = json.load(f)
+    limits = spec.get("limits", {})
+    apply_limits(limits.get("max_memory_mb", 0), limits.get("max_cpu_s", 0))
+
+    stats: dict = {}
+    code = 0
+    t0 = time.perf_counter()
+    try:
+        if spec["mode"] == "process_data":
+            _worker_process_data(spec)
+        else:
+            ns = _build_namespace(spec.get("namespace", "clean"))
+            with open(spec["script"], encoding="utf-8") as f:
+                content = f.read()
+            exec(compile(content, spec["script"], "exec"), ns)   # noqa: S102
+            if spec.get("namespace") == "factor":
+                from factor_namespace import persist_lineage
+                persist_lineage(ns.get("DEPENDS_ON", ()))
+    except MemoryError:
+        stats["error"] = f"内存超限（>{limits.get('max_memory_mb')} MB）"
+        code = EXIT_MEMORY
+    except Exception as e:
+        traceback.print_exc()
+        stats["error"] = f"{type(e).__name__}: {e}"
+        code = EXIT_ERROR
+    finally:
+        stats["runtime_s"] = time.perf_counter() - t0
+        stats["peak_rss_mb"] = peak_rss_mb()
+        with open(spec["stats"], "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+    return code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worker", required=True, help="worker spec JSON 路径")
+    args = parser.parse_args()
+    sys.exit(_worker_main(args.worker))
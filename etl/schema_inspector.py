@@ -1,56 +1,170 @@
 """
 查询 raw.* 和 processed.* schema 的表结构、样本数据、行数，输出 JSON 到 stdout。
-供服务端 /api/clean/schema-context 调用。
+供服务端 /api/clean/schema-context、/api/factors/schema-context 调用。
+
+行数默认取 pg_class.reltuples 估算值（ANALYZE 前回退到 pg_stat_user_tables.n_live_tup），
+不做 COUNT(*) 全表扫描；--exact 时才精确计数。
+每张表的行数与样本缓存在 CACHE_DIR/schema_snapshot.json，
+仅当 pg_stat 修改计数（n_tup_ins / n_tup_upd / n_tup_del / n_live_tup）变化时才重新采样，
+未变化的表直接复用快照，刷新页面只需两条系统表查询。
+
+用法：
+  python schema_inspector.py [--schemas processed] [--exact] [--no-cache]
 """
+import argparse
 import json
+import os
 import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from base import get_conn, put_conn
+from config import CACHE_DIR
+
+SCHEMAS = ["meta", "raw", "processed", "factors"]
+SAMPLE_LIMIT = 5
+
+_SNAPSHOT_PATH = CACHE_DIR / "schema_snapshot.json"
+
+
+def _load_snapshot() -> dict:
+    try:
+        return json.loads(_SNAPSHOT_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_snapshot(snapshot: dict) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _SNAPSHOT_PATH.with_name(f"{_SNAPSHOT_PATH.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, _SNAPSHOT_PATH)
+
+
+def _table_stats(cur, schemas: list[str]) -> list[tuple]:
+    """
+    一次查询返回所有表的估算行数与修改计数：
+    (schema, table, reltuples, n_live_tup, n_tup_ins, n_tup_upd, n_tup_del)
+
+    分区子表不单独列出；分区父表（relkind = 'p'）本身没有行和 pg_stat 计数，
+    按 pg_inherits 汇总各分区的估算行数（未 ANALYZE 的分区取 n_live_tup）与修改计数。
+    """
+    cur.execute(
+        "SELECT n.nspname, c.relname,"
+        "       CASE WHEN c.relkind = 'p' THEN COALESCE(p.reltuples, 0) ELSE c.reltuples::bigint END,"
+        "       COALESCE(s.n_live_tup, p.n_live_tup, 0), COALESCE(s.n_tup_ins, p.n_tup_ins, 0),"
+        "       COALESCE(s.n_tup_upd, p.n_tup_upd, 0), COALESCE(s.n_tup_del, p.n_tup_del, 0)"
+        " FROM pg_class c"
+        " JOIN pg_namespace n ON n.oid = c.relnamespace"
+        " LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid"
+        " LEFT JOIN LATERAL ("
+        "   SELECT SUM(CASE WHEN pc.reltuples >= 0 THEN pc.reltuples::bigint"
+        "                   ELSE COALESCE(ps.n_live_tup, 0) END)::bigint AS reltuples,"
+        "          SUM(ps.n_live_tup)::bigint AS n_live_tup, SUM(ps.n_tup_ins)::bigint AS n_tup_ins,"
+        "          SUM(ps.n_tup_upd)::bigint AS n_tup_upd, SUM(ps.n_tup_del)::bigint AS n_tup_del"
+        "   FROM pg_inherits i"
+        "   JOIN pg_class pc ON pc.oid = i.inhrelid"
+        "   LEFT JOIN pg_stat_user_tables ps ON ps.relid = pc.oid"
+        "   WHERE i.inhparent = c.oid"
+        " ) p ON c.relkind = 'p'"
+        " WHERE n.nspname = ANY(%s) AND c.relkind IN ('r', 'p') AND NOT c.relispartition"
+        " ORDER BY n.nspname, c.relname",
+        (schemas,),
+    )
+    return cur.fetchall()
 
 
-def inspect_schema(conn, schema: str) -> list[dict]:
-    tables = []
+def _table_columns(cur, schemas: list[str]) -> dict[str, list[dict]]:
+    """一次查询返回所有表的列信息：{schema.table: [{name, type}, ...]}。"""
+    cur.execute(
+        "SELECT table_schema, table_name, column_name, data_type "
+        "FROM information_schema.columns "
+        "WHERE table_schema = ANY(%s) "
+        "ORDER BY table_schema, table_name, ordinal_position",
+        (schemas,),
+    )
+    columns: dict[str, list[dict]] = {}
+    for schema, tname, col, dtype in cur.fetchall():
+        columns.setdefault(f"{schema}.{tname}", []).append({"name": col, "type": dtype})
+    return columns
+
+
+def inspect_schemas(
+    conn,
+    schemas: list[str] | None = None,
+    exact_counts: bool = False,
+    use_cache: bool = True,
+) -> dict[str, list[dict]]:
+    """
+    返回 {schema: [ {table, columns, row_count, row_count_exact, sample_rows}, ... ]}。
+    exact_counts=True 时对修改过或尚无精确值的表执行 COUNT(*)，结果同样写入快照。
+    """
+    schemas = schemas or SCHEMAS
+    snapshot = _load_snapshot() if use_cache else {}
+    cached_tables: dict = snapshot.get("tables", {})
+    result: dict[str, list[dict]] = {s: [] for s in schemas}
+    dirty = False
+
     with conn.cursor() as cur:
-        cur.execute(
-            "SELECT table_name FROM information_schema.tables "
-            "WHERE table_schema = %s AND table_type = 'BASE TABLE' "
-            "ORDER BY table_name",
-            (schema,),
-        )
-        table_names = [row[0] for row in cur.fetchall()]
+        stats = _table_stats(cur, schemas)
+        columns = _table_columns(cur, schemas)
 
-        for tname in table_names:
+        for schema, tname, reltuples, n_live, n_ins, n_upd, n_del in stats:
             full = f"{schema}.{tname}"
+            sig = [n_live, n_ins, n_upd, n_del]
+            cols = columns.get(full, [])
+            entry = cached_tables.get(full)
 
-            # 列信息
-            cur.execute(
-                "SELECT column_name, data_type "
-                "FROM information_schema.columns "
-                "WHERE table_schema = %s AND table_name = %s "
-                "ORDER BY ordinal_position",
-                (schema, tname),
+            stale = (
+                entry is None
+                or entry.get("sig") != sig
+                or entry.get("columns") != cols
             )
-            columns = [{"name": r[0], "type": r[1]} for r in cur.fetchall()]
-
-            # 行数
-            cur.execute(f"SELECT COUNT(*) FROM {full}")
-            row_count = cur.fetchone()[0]
+            if stale:
+                # reltuples = -1 表示从未 ANALYZE，回退到 pg_stat 活跃行数
+                estimate = reltuples if reltuples >= 0 else n_live
+                entry = {
+                    "sig": sig,
+                    "columns": cols,
+                    "row_count": int(estimate),
+                    "row_count_exact": False,
+                    "sample_rows": _sample_rows(cur, full),
+                }
+                dirty = True
 
-            # 样本
-            cur.execute(f"SELECT * FROM {full} LIMIT 5")
-            col_names = [desc[0] for desc in cur.description]
-            sample_rows = [
-                {col_names[i]: _serialize(val) for i, val in enumerate(row)}
-                for row in cur.fetchall()
-            ]
+            if exact_counts and not entry["row_count_exact"]:
+                cur.execute(f"SELECT COUNT(*) FROM {full}")
+                entry["row_count"] = cur.fetchone()[0]
+                entry["row_count_exact"] = True
+                dirty = True
 
-            tables.append({
+            cached_tables[full] = entry
+            result[schema].append({
                 "table": full,
-                "columns": columns,
-                "row_count": row_count,
-                "sample_rows": sample_rows,
+                "columns": entry["columns"],
+                "row_count": entry["row_count"],
+                "row_count_exact": entry["row_count_exact"],
+                "sample_rows": entry["sample_rows"],
             })
-    return tables
+
+    if use_cache and dirty:
+        snapshot["tables"] = cached_tables
+        _save_snapshot(snapshot)
+    return result
+
+
+def inspect_schema(conn, schema: str, exact_counts: bool = False) -> list[dict]:
+    return inspect_schemas(conn, [schema], exact_counts=exact_counts)[schema]
+
+
+def _sample_rows(cur, full: str) -> list[dict]:
+    cur.execute(f"SELECT * FROM {full} LIMIT {SAMPLE_LIMIT}")
+    col_names = [desc[0] for desc in cur.description]
+    return [
+        {col_names[i]: _serialize(val) for i, val in enumerate(row)}
+        for row in cur.fetchall()
+    ]
 
 
 def _serialize(val):
@@ -63,14 +177,21 @@ def _serialize(val):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--schemas", default=",".join(SCHEMAS),
+                        help="逗号分隔的 schema 列表")
+    parser.add_argument("--exact", action="store_true",
+                        help="使用 COUNT(*) 精确行数（全表扫描）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="忽略并且不写入本地快照")
+    args = parser.parse_args()
+    schemas = [s.strip() for s in args.schemas.split(",") if s.strip()]
+
     conn = get_conn()
     try:
-        result = {
-            "meta": inspect_schema(conn, "meta"),
-            "raw": inspect_schema(conn, "raw"),
-            "processed": inspect_schema(conn, "processed"),
-            "factors": inspect_schema(conn, "factors"),
-        }
+        result = inspect_schemas(
+            conn, schemas, exact_counts=args.exact, use_cache=not args.no_cache,
+        )
         print(json.dumps(result, ensure_ascii=False, indent=2))
     finally:
         put_conn(conn)
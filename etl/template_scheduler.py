@@ -0,0 +1,454 @@
+"""
+Wind Query 模板调度：按 update_frequency 执行 meta.wind_query_templates
+Wind wsd / edb / wss → raw.daily_prices / raw.indicator_series
+
+到期判断只看本地交易日历（raw.trading_calendar）：
+  - as_of：最近一个已收盘的交易日（当天 CLOSE_HOUR 点后含当天）
+  - 每个模板的目标日 = as_of 及之前最近一个"已完结周期"的最后交易日
+    D 每个交易日；W/M/Q/Y 为周/月/季/年的最后交易日，
+    当前周期只有在日历里已出现下一周期的交易日时才算完结
+  - meta.template_runs.last_target_date 早于目标日即到期
+update_frequency 为空或无法识别的模板只在 --ids 显式指定时执行。
+
+拉取区间从 last_data_date（上次实际拿到数据的最后日期）次日开始，
+尚未发布的宏观数据会在之后的运行中自动补上。
+
+同一 wind_function / fields / options / 落库方式 / 拉取区间的模板合并为
+一次 bridge 调用（每次最多 MAX_CODES_PER_CALL 个代码），各批次在线程池中并发执行，
+bridge 调用启动间隔受 --rate 限制，避免触发 Wind 流量限制。
+
+落库：
+  data_type = price            → raw.daily_prices（字段按 load_prices.WSD_FIELDS 映射，忽略 PriceAdj，按不复权入库，
+                                  并自动追加 adjfactor 字段以保存复权因子）
+  其他                          → raw.indicator_series
+    单代码单字段且配置了 target_indicator_id 时写入该指标，
+    否则按代码（多字段时为 "代码:字段"）自动登记 meta.indicators
+  wss 快照取目标日（tradeDate）的值，按目标日落一行
+
+用法：
+  python etl/template_scheduler.py --dry-run           # 只打印到期计划
+  python etl/template_scheduler.py --jobs 3 --rate 2
+  python etl/template_scheduler.py --ids 3,5 --force   # 忽略到期判断，立即执行指定模板
+  python etl/template_scheduler.py --daemon --interval 900
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from base import RateLimiter, call_wind, get_conn, put_conn, upsert
+from load_prices import WSD_FIELDS
+
+logger = logging.getLogger(__name__)
+
+CLOSE_HOUR = 16                 # 该时刻后当天行情视为已收盘
+DEFAULT_START = "2015-01-01"    # 模板未给 beginTime 时首次拉取的起点
+MAX_CODES_PER_CALL = 100
+
+FREQUENCIES = {
+    "d": "D", "daily": "D", "日": "D", "每日": "D",
+    "w": "W", "weekly": "W", "周": "W", "每周": "W",
+    "m": "M", "monthly": "M", "月": "M", "每月": "M",
+    "q": "Q", "quarterly": "Q", "季": "Q", "每季": "Q",
+    "y": "Y", "yearly": "Y", "annual": "Y", "年": "Y", "每年": "Y",
+}
+SERIES_FUNCTIONS = {"wsd", "edb"}       # 带时间区间的函数
+SNAPSHOT_FUNCTIONS = {"wss"}             # 无时间轴的快照
+
+
+def parse_frequency(value: str | None) -> str | None:
+    return FREQUENCIES.get((value or "").strip().lower())
+
+
+# ── 交易日历 / 到期判断 ─────────────────────────────────────
+
+def resolve_as_of(conn, now: datetime | None = None) -> date | None:
+    """最近一个已收盘的交易日。"""
+    now = now or datetime.now()
+    today = now.date()
+    bound = today if now.hour >= CLOSE_HOUR else today - timedelta(days=1)
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(trade_date) FROM raw.trading_calendar WHERE trade_date <= %s", (bound,))
+        row = cur.fetchone()
+    return row[0] if row and row[0] else None
+
+
+def period_targets(conn, as_of: date, freqs: set[str]) -> dict[str, date | None]:
+    """每个频率在 as_of 及之前最近一个已完结周期的最后交易日。"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT trade_date FROM raw.trading_calendar WHERE trade_date <= %s"
+            " ORDER BY trade_date DESC LIMIT 800",
+            (as_of,),
+        )
+        days = sorted(r[0] for r in cur.fetchall())
+        cur.execute("SELECT MIN(trade_date) FROM raw.trading_calendar WHERE trade_date > %s", (as_of,))
+        following = cur.fetchone()[0]
+
+    targets: dict[str, date | None] = {}
+    idx = pd.DatetimeIndex(days)
+    for freq in freqs:
+        if freq == "D" or not days:
+            targets[freq] = days[-1] if days else None
+            continue
+        periods = idx.to_period(freq)
+        # 周期最后一个交易日：下一个交易日属于另一周期
+        ends = [d for d, p, nxt in zip(days, periods, periods[1:]) if p != nxt]
+        if following is not None and pd.Timestamp(following).to_period(freq) != periods[-1]:
+            ends.append(days[-1])
+        targets[freq] = ends[-1] if ends else None
+    return targets
+
+
+# ── 模板 ───────────────────────────────────────────────────
+
+def _split(value) -> list[str]:
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value or "").split(",") if v.strip()]
+
+
+def load_templates(conn, ids: list[int] | None = None) -> list[dict]:
+    sql = """
+        SELECT t.id, t.query_name, t.wind_function, t.wind_params, t.data_type,
+               t.target_indicator_id, t.target_asset_id, t.update_frequency,
+               r.last_target_date, r.last_data_date
+        FROM meta.wind_query_templates t
+        LEFT JOIN meta.template_runs r ON r.template_id = t.id
+    """
+    params = None
+    if ids:
+        sql += " WHERE t.id = ANY(%s)"
+        params = (ids,)
+    with conn.cursor() as cur:
+        cur.execute(sql + " ORDER BY t.id", params)
+        cols = [c[0] for c in cur.description]
+        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    templates = []
+    for t in rows:
+        p = t["wind_params"] if isinstance(t["wind_params"], dict) else json.loads(t["wind_params"] or "{}")
+        t["function"] = t["wind_function"].strip().lower()
+        t["codes"] = _split(p.get("codes"))
+        t["fields"] = _split(p.get("fields"))
+        t["options"] = p.get("options") or ""
+        t["begin"] = p.get("beginTime") or p.get("startDate")
+        t["freq"] = parse_frequency(t["update_frequency"])
+        t["route"] = "daily_prices" if (t["data_type"] or "").strip().lower() in ("price", "prices") else "indicator_series"
+        if t["route"] == "daily_prices":
+            # raw.daily_prices 只存不复权价格，复权在读取时按 adj_factor 计算
+            t["options"] = ";".join(o for o in t["options"].split(";") if o and not o.strip().lower().startswith("priceadj"))
+            if "adjfactor" not in (f.lower() for f in t["fields"]):
+                t["fields"].append("adjfactor")
+        if t["function"] not in SERIES_FUNCTIONS | SNAPSHOT_FUNCTIONS:
+            logger.warning(f"模板 {t['id']} {t['query_name']}: 不支持的函数 {t['function']}，跳过")
+            continue
+        if not t["codes"] or (t["function"] != "edb" and not t["fields"]):
+            logger.warning(f"模板 {t['id']} {t['query_name']}: wind_params 缺少 codes/fields，跳过")
+            continue
+        templates.append(t)
+    return templates
+
+
+def due_templates(templates: list[dict], targets: dict[str, date | None],
+                  as_of: date, explicit: bool = False, force: bool = False) -> list[dict]:
+    """给到期模板填上 target（目标日）与 start（拉取起点）。"""
+    due = []
+    for t in templates:
+        target = targets.get(t["freq"]) if t["freq"] else (as_of if explicit else None)
+        if target is None:
+            continue
+        if not force and t["last_target_date"] is not None and t["last_target_date"] >= target:
+            continue
+        if t["function"] in SNAPSHOT_FUNCTIONS:
+            start = target
+        elif t["last_data_date"] is not None and not force:
+            start = t["last_data_date"] + timedelta(days=1)
+        else:
+            start = pd.Timestamp(t["begin"] or DEFAULT_START).date()
+        if start > target:      # 数据已到目标日，只需登记本周期已运行
+            start = None
+        due.append({**t, "target": target, "start": start})
+    return due
+
+
+def coalesce(due: list[dict]) -> list[dict]:
+    """同函数 / 字段 / 选项 / 落库方式 / 区间的模板合并为批次。"""
+    groups: dict[tuple, list[dict]] = {}
+    for t in due:
+        if t["start"] is None:
+            continue
+        key = (t["function"], ",".join(t["fields"]), t["options"], t["route"], t["start"], t["target"])
+        groups.setdefault(key, []).append(t)
+
+    batches = []
+    for (function, fields, options, route, start, target), members in groups.items():
+        codes = list(dict.fromkeys(c for t in members for c in t["codes"]))
+        for i in range(0, len(codes), MAX_CODES_PER_CALL):
+            chunk = codes[i:i + MAX_CODES_PER_CALL]
+            batches.append({
+                "function": function, "fields": fields, "options": options, "route": route,
+                "start": start, "target": target, "codes": chunk,
+                "templates": [t for t in members if set(t["codes"]) & set(chunk)],
+            })
+    return batches
+
+
+# ── Wind 调用 ──────────────────────────────────────────────
+
+def fetch(batch: dict, limiter: RateLimiter) -> list[tuple[str, str, date, object]]:
+    """执行一次 bridge 调用，返回长表 [(code, field, date, value)]。"""
+    params = {"codes": ",".join(batch["codes"]), "options": batch["options"]}
+    if batch["function"] != "edb":
+        params["fields"] = batch["fields"]
+    if batch["function"] in SERIES_FUNCTIONS:
+        params["beginTime"] = batch["start"].strftime("%Y-%m-%d")
+        params["endTime"] = batch["target"].strftime("%Y-%m-%d")
+    elif "tradedate" not in params["options"].lower():     # 快照取目标日的值
+        params["options"] = ";".join(filter(None, [params["options"], f"tradeDate={batch['target']:%Y%m%d}"]))
+    limiter.wait()
+    data = call_wind(batch["function"], params).get("data") or {}
+    return wind_long_rows(batch["function"], data, batch["target"])
+
+
+def wind_long_rows(function: str, data: dict, snapshot_date: date) -> list[tuple[str, str, date, object]]:
+    """
+    wind_data_to_dict 结果 → [(code, field, date, value)]，field 为小写。
+    wsd / edb 的 data 每行是一条时间序列，按 代码 × 字段 顺序排列；
+    wss 的 data 每行是一个字段、每列一个代码。
+    """
+    codes = data.get("codes") or []
+    fields = [f.lower() for f in data.get("fields") or []] or [""]
+    rows = data.get("data") or []
+    out = []
+    if function in SNAPSHOT_FUNCTIONS:
+        for fi, row in enumerate(rows):
+            for ci, value in enumerate(row):
+                if ci < len(codes) and value is not None:
+                    out.append((codes[ci], fields[fi], snapshot_date, value))
+        return out
+
+    times = [pd.Timestamp(t).date() for t in data.get("times") or []]
+    for k, row in enumerate(rows[:len(codes) * len(fields)]):
+        code, field = codes[k // len(fields)], fields[k % len(fields)]
+        for t, value in zip(times, row):
+            if value is not None:
+                out.append((code, field, t, value))
+    return out
+
+
+# ── 落库 ───────────────────────────────────────────────────
+
+def _ensure_asset(conn, code: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO meta.assets (asset_code, asset_class) VALUES (%s, 'stock')"
+            " ON CONFLICT (asset_code) DO UPDATE SET asset_code = EXCLUDED.asset_code"
+            " RETURNING id",
+            (code,),
+        )
+        asset_id = cur.fetchone()[0]
+    conn.commit()
+    return asset_id
+
+
+def _ensure_indicator(conn, code: str, category: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO meta.indicators (indicator_code, category) VALUES (%s, %s)"
+            " ON CONFLICT (indicator_code) DO UPDATE SET indicator_code = EXCLUDED.indicator_code"
+            " RETURNING id",
+            (code, category),
+        )
+        ind_id = cur.fetchone()[0]
+    conn.commit()
+    return ind_id
+
+
+def write_template(conn, t: dict, records: list[tuple]) -> tuple[int, date | None]:
+    """把属于模板 t 的记录写入目标表，返回 (写入行数, 最后数据日期)。"""
+    codes = set(t["codes"])
+    records = [r for r in records if r[0] in codes]
+    if not records:
+        return 0, None
+    last = max(r[2] for r in records)
+
+    if t["route"] == "daily_prices":
+        rows: dict[tuple, dict] = {}
+        asset_ids = {}
+        for code, field, d, value in records:
+            col = WSD_FIELDS.get(field)
+            if col is None:
+                continue
+            if code not in asset_ids:
+                asset_ids[code] = t["target_asset_id"] if t["target_asset_id"] and len(codes) == 1 \
+                    else _ensure_asset(conn, code)
+            rows.setdefault((asset_ids[code], d), {"asset_id": asset_ids[code], "trade_date": d})[col] = value
+        if not rows:
+            return 0, last
+        cols = sorted({c for r in rows.values() for c in r} - {"asset_id", "trade_date"})
+        n = upsert(
+            conn, "raw.daily_prices",
+            [{"asset_id": r["asset_id"], "trade_date": r["trade_date"], **{c: r.get(c) for c in cols}}
+             for r in rows.values()],
+            conflict_cols=["asset_id", "trade_date"], update_cols=cols,
+        )
+        return n, last
+
+    single = len(codes) == 1 and len(t["fields"]) <= 1
+    category = (t["data_type"] or "").strip() or t["function"]
+    ind_ids = {}
+    rows = {}
+    for code, field, d, value in records:
+        key = (code, field)
+        if key not in ind_ids:
+            if single and t["target_indicator_id"]:
+                ind_ids[key] = t["target_indicator_id"]
+            else:
+                ind_code = f"{code}:{field}" if len(t["fields"]) > 1 or t["function"] in SNAPSHOT_FUNCTIONS else code
+                ind_ids[key] = _ensure_indicator(conn, ind_code, category)
+        rows[(ind_ids[key], d)] = {"indicator_id": ind_ids[key], "trade_date": d, "value": value}
+    n = upsert(conn, "raw.indicator_series", list(rows.values()),
+               conflict_cols=["indicator_id", "trade_date"], update_cols=["value"])
+    return n, last
+
+
+def record_run(conn, t: dict, status: str, rows: int = 0, last_data: date | None = None, error: str | None = None):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO meta.template_runs
+                (template_id, last_target_date, last_data_date, rows_written, status, error, last_run_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (template_id) DO UPDATE SET
+                last_target_date = CASE WHEN EXCLUDED.status = 'ok' THEN EXCLUDED.last_target_date
+                                        ELSE meta.template_runs.last_target_date END,
+                last_data_date = GREATEST(meta.template_runs.last_data_date, EXCLUDED.last_data_date),
+                rows_written = EXCLUDED.rows_written,
+                status = EXCLUDED.status,
+                error = EXCLUDED.error,
+                last_run_at = NOW()
+            """,
+            (t["id"], t["target"] if status == "ok" else None, last_data, rows, status, error),
+        )
+    conn.commit()
+
+
+# ── 执行 ───────────────────────────────────────────────────
+
+def _run_batch(batch: dict, limiter: RateLimiter) -> dict[int, tuple]:
+    """一个批次：调用 Wind 并按模板落库，返回 {template_id: (status, rows, last_data, error)}。"""
+    label = f"{batch['function']} {len(batch['codes'])} 个代码 {batch['start']} → {batch['target']}"
+    try:
+        records = fetch(batch, limiter)
+    except Exception as e:
+        logger.error(f"{label} 拉取失败: {e}")
+        return {t["id"]: ("error", 0, None, str(e)) for t in batch["templates"]}
+
+    out = {}
+    conn = get_conn()
+    try:
+        for t in batch["templates"]:
+            try:
+                n, last = write_template(conn, t, records)
+                out[t["id"]] = ("ok", n, last, None)
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"模板 {t['id']} {t['query_name']} 写入失败: {e}")
+                out[t["id"]] = ("error", 0, None, str(e))
+    finally:
+        put_conn(conn)
+    logger.info(f"{label} 完成，{len(records)} 条记录")
+    return out
+
+
+def run_due(due: list[dict], jobs: int = 3, rate: float = 2.0) -> dict[int, str]:
+    """执行到期模板，返回 {template_id: status}。"""
+    batches = coalesce(due)
+    limiter = RateLimiter(rate)
+    results: dict[int, list[tuple]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(_run_batch, b, limiter) for b in batches]
+        for future in as_completed(futures):
+            for tid, res in future.result().items():
+                results.setdefault(tid, []).append(res)
+
+    status = {}
+    conn = get_conn()
+    try:
+        for t in due:
+            parts = results.get(t["id"], [("ok", 0, None, None)])     # start 为空：无需拉取
+            errors = [p[3] for p in parts if p[0] != "ok"]
+            last = max((p[2] for p in parts if p[2] is not None), default=None)
+            rows = sum(p[1] for p in parts)
+            record_run(conn, t, "error" if errors else "ok", rows, last, "; ".join(errors) or None)
+            status[t["id"]] = "error" if errors else "ok"
+            logger.info(f"模板 {t['id']} {t['query_name']}: {status[t['id']]}，写入 {rows} 行")
+    finally:
+        put_conn(conn)
+    return status
+
+
+def plan(ids: list[int] | None = None, force: bool = False, now: datetime | None = None) -> list[dict]:
+    conn = get_conn()
+    try:
+        as_of = resolve_as_of(conn, now)
+        if as_of is None:
+            logger.warning("raw.trading_calendar 为空，请先运行 load_tdays.py")
+            return []
+        templates = load_templates(conn, ids)
+        targets = period_targets(conn, as_of, {t["freq"] for t in templates if t["freq"]})
+    finally:
+        put_conn(conn)
+    return due_templates(templates, targets, as_of, explicit=bool(ids), force=force)
+
+
+def run_once(ids=None, force=False, jobs=3, rate=2.0, dry_run=False) -> dict[int, str]:
+    due = plan(ids, force)
+    print(json.dumps([
+        {"id": t["id"], "name": t["query_name"], "function": t["function"], "freq": t["freq"],
+         "start": str(t["start"]) if t["start"] else None, "target": str(t["target"])}
+        for t in due
+    ], ensure_ascii=False, indent=2))
+    if dry_run or not due:
+        return {}
+    logger.info(f"到期模板 {len(due)} 个，合并为 {len(coalesce(due))} 次 Wind 调用")
+    return run_due(due, jobs, rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按 update_frequency 执行 Wind Query 模板")
+    parser.add_argument("--ids", default="", help="逗号分隔的模板 id（默认全部到期模板）")
+    parser.add_argument("--force", action="store_true", help="忽略到期判断与水位，按模板区间重新拉取")
+    parser.add_argument("--dry-run", action="store_true", help="只打印到期计划")
+    parser.add_argument("--jobs", type=int, default=3, help="并发批次数")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒最多启动的 Wind 调用数（<=0 不限）")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行，每 --interval 秒检查一次")
+    parser.add_argument("--interval", type=int, default=900, help="常驻模式检查间隔（秒）")
+    args = parser.parse_args()
+
+    ids = [int(i) for i in args.ids.split(",") if i.strip()] or None
+    if not args.daemon:
+        status = run_once(ids, args.force, args.jobs, args.rate, args.dry_run)
+        if any(s != "ok" for s in status.values()):
+            sys.exit(1)
+        return
+
+    while True:
+        try:
+            run_once(ids, False, args.jobs, args.rate, args.dry_run)
+        except Exception as e:
+            logger.error(f"调度失败: {e}")
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import backtest  # noqa: E402
+
+
+def _simulate_loop(returns, targets, rebalance, cost_bps):
+    """Day-by-day reference for backtest.simulate."""
+    r = np.nan_to_num(returns, nan=0.0)
+    h = np.zeros(r.shape[1])
+    gross, turnover, holdings = [], [], []
+    for t in range(len(r)):
+        g = float(h @ r[t])
+        drifted = h * (1 + r[t]) / (1 + g)
+        if rebalance[t]:
+            turnover.append(np.abs(targets[t] - drifted).sum())
+            h = targets[t].copy()
+        else:
+            turnover.append(0.0)
+            h = drifted
+        gross.append(g)
+        holdings.append(h)
+    turnover = np.array(turnover)
+    return np.array(gross), np.array(gross) - turnover * cost_bps / 1e4, turnover, np.array(holdings)
+
+
+@pytest.mark.parametrize("long_short", [False, True])
+def test_simulate_matches_the_daily_loop(long_short):
+    rng = np.random.default_rng(3)
+    n_days, n_assets = 60, 8
+    returns = rng.normal(0.0005, 0.02, (n_days, n_assets))
+    returns[rng.random(returns.shape) < 0.05] = np.nan
+    targets = rng.random((n_days, n_assets))
+    targets /= targets.sum(axis=1, keepdims=True)
+    if long_short:
+        targets -= targets[:, ::-1]
+    rebalance = np.zeros(n_days, dtype=bool)
+    rebalance[[3, 10, 11, 30, 52]] = True
+
+    out = backtest.simulate(returns, targets, rebalance, cost_bps=10)
+    gross, net, turnover, holdings = _simulate_loop(returns, targets, rebalance, 10)
+    np.testing.assert_allclose(out["gross"], gross, atol=1e-12)
+    np.testing.assert_allclose(out["net"], net, atol=1e-12)
+    np.testing.assert_allclose(out["turnover"], turnover, atol=1e-12)
+    np.testing.assert_allclose(out["holdings"], holdings, atol=1e-12)
+
+
+def test_simulate_without_rebalance_stays_in_cash():
+    out = backtest.simulate(np.full((5, 2), 0.01), np.full((5, 2), 0.5), np.zeros(5, dtype=bool))
+    assert not out["gross"].any() and not out["holdings"].any()
+
+
+def test_cap_weights_redistributes_the_excess():
+    w = backtest.cap_weights(np.array([[0.7, 0.2, 0.1], [0.9, 0.1, 0.0]]), 0.4)
+    np.testing.assert_allclose(w[0], [0.4, 0.4, 0.2])
+    np.testing.assert_allclose(w[1], [0.4, 0.4, 0.0])     # cannot be fully invested: the rest stays cash
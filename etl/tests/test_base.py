@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from base import _CsvChunkStream  # noqa: E402
+
+
+@pytest.mark.parametrize("size", [-1, 1, 5, 8192])
+def test_csv_chunk_stream_reads_every_byte_once(size):
+    df = pd.DataFrame({"code": [f"{i:06d}.SH" for i in range(50)],
+                       "trade_date": pd.date_range("2024-01-01", periods=50),
+                       "value": [i / 3 if i % 7 else None for i in range(50)]})
+    stream = _CsvChunkStream(df, ["factor_name", "code", "trade_date", "value"], {"factor_name": "f"}, 8)
+    out = []
+    while True:
+        data = stream.read(size)
+        if not data:
+            break
+        assert size < 0 or len(data) <= size
+        out.append(data)
+    expected = df.assign(factor_name="f")[["factor_name", "code", "trade_date", "value"]].to_csv(
+        header=False, index=False, na_rep="\\N", date_format="%Y-%m-%d").encode()
+    assert b"".join(out) == expected
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("pyarrow")
+
+import factor_batch  # noqa: E402
+import factor_cache  # noqa: E402
+import factor_store  # noqa: E402
+from sandbox import write_arrow  # noqa: E402
+
+
+def test_bulk_write_writes_outputs_and_notifies(tmp_path, monkeypatch):
+    path = tmp_path / "mom_20.arrow"
+    write_arrow(pd.DataFrame({
+        "asset_code": ["A", "B"],
+        "trade_date": ["2024-01-02", "2024-01-02"],
+        "value": [1.0, 2.0],
+    }), str(path))
+
+    copied, stored, notified = [], [], []
+    monkeypatch.setattr(factor_batch, "copy_upsert", lambda conn, table, df, columns, **kw: copied.append((table, df)) or len(df))
+    monkeypatch.setattr(factor_store, "bump_versions", lambda conn, names: {n: 7 for n in names})
+    monkeypatch.setattr(factor_store, "write_factor", lambda conn, name, df, version, rng: stored.append((name, version)))
+    monkeypatch.setattr(factor_cache, "notify_factor_changed", lambda conn, names: notified.append(set(names)))
+
+    results = [
+        {"name": "mom_20.py", "ok": True, "outputs": [
+            {"path": str(path), "factor_name": "mom_20", "asset_level": True, "replace_range": None},
+        ]},
+        {"name": "broken.py", "ok": False, "outputs": []},
+    ]
+    written = factor_batch._bulk_write(None, results)
+
+    assert written == {"factors.asset_values": 2}
+    assert copied[0][1]["factor_name"].tolist() == ["mom_20", "mom_20"]
+    assert stored == [("mom_20", 7)]
+    assert notified == [{"mom_20"}]
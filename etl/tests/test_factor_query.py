@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("pyarrow")
+
+import factor_query  # noqa: E402
+import factor_store  # noqa: E402
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    monkeypatch.setattr(factor_store, "FACTOR_STORE_DIR", tmp_path)
+    dates = pd.to_datetime(["2023-12-28", "2023-12-29", "2024-01-02", "2024-01-03"])
+    codes = ["600000.SH", "000001.SZ", "a.SZ", "B.SH"]
+    df = factor_store._normalize(pd.DataFrame(
+        [(c, d, float(i)) for i, (d, c) in enumerate((d, c) for d in dates for c in codes)],
+        columns=["asset_code", "trade_date", "value"],
+    ))
+    factor_store._write_all("f", df, len(df), "2024-01-03", 1)
+    return df.sort_values(["trade_date", "asset_code"], ignore_index=True)
+
+
+def test_read_factor_pages_match_the_full_scan(mirror):
+    pages, after = [], None
+    while True:
+        page = factor_store.read_factor("f", after=after, limit=5)
+        if page.empty:
+            break
+        pages.append(page)
+        last = page.iloc[-1]
+        after = (str(last["trade_date"].date()), last["asset_code"])
+    got = pd.concat(pages, ignore_index=True)
+    assert [len(p) for p in pages] == [5, 5, 5, 1]
+    pd.testing.assert_frame_equal(got[factor_store.COLUMNS], mirror[factor_store.COLUMNS], check_dtype=False)
+
+
+def test_read_factor_page_respects_filters(mirror):
+    page = factor_store.read_factor("f", end="2024-01-02", asset_codes=["B.SH", "a.SZ"],
+                                    after=("2023-12-29", "B.SH"), limit=10)
+    assert list(zip(page["trade_date"].dt.strftime("%Y-%m-%d"), page["asset_code"])) == [
+        ("2023-12-29", "a.SZ"), ("2024-01-02", "B.SH"), ("2024-01-02", "a.SZ"),
+    ]
+
+
+def test_lttb_keeps_the_budget_and_the_extremes():
+    x = np.arange(100, dtype="float64")
+    y = np.sin(x / 7.0)
+    y[40] = 5.0
+    keep = factor_query.lttb(x, y, 10)
+    assert len(keep) == 10 and keep[0] == 0 and keep[-1] == 99
+    assert np.all(np.diff(keep) > 0) and 40 in keep
+    assert factor_query.lttb(x, y, 2).tolist() == [0, 99]
+    assert factor_query.lttb(x, y, 1).tolist() == [0]
+    assert factor_query.lttb(x[:5], y[:5], 10).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_minmax_downsample_keeps_each_bucket_extreme():
+    dates = pd.date_range("2024-01-01", periods=20)
+    df = pd.DataFrame({
+        "asset_code": ["A"] * 20 + ["B"] * 20,
+        "trade_date": list(dates) * 2,
+        "value": list(range(20)) + [0.0] * 9 + [-3.0] + [0.0] * 10,
+    })
+    out = factor_query.downsample(df, 4, "minmax")
+    a, b = out[out["asset_code"] == "A"], out[out["asset_code"] == "B"]
+    assert a["value"].tolist() == [0, 9, 10, 19]
+    assert -3.0 in b["value"].tolist()
+    assert out["trade_date"].is_monotonic_increasing
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from factor_scheduler import FULL, _input_start, topological_order  # noqa: E402
+
+
+def _wm(max_date, version, **extra):
+    return {"max_date": max_date, "version": version, **extra}
+
+
+def test_unchanged_input_is_clean():
+    assert _input_start(_wm("2024-01-31", "10"), _wm("2024-01-31", "10")) is False
+
+
+def test_pure_append_starts_after_the_stored_max_date():
+    stored = _wm("2024-01-31", "10:3", write_version=3)
+    current = _wm("2024-02-02", "12:4", write_version=4)
+    assert _input_start(stored, current, revised="2024-02-01") == "2024-02-01"
+
+
+def test_append_with_revised_history_starts_at_the_revision():
+    stored = _wm("2024-01-31", "10:3", write_version=3)
+    current = _wm("2024-02-02", "12:4", write_version=4)
+    assert _input_start(stored, current, revised="2024-01-15") == "2024-01-15"
+
+
+def test_value_only_rewrite_without_log_is_full():
+    assert _input_start(_wm("2024-01-31", "10:3"), _wm("2024-01-31", "10:4")) is FULL
+
+
+def test_processed_table_updates_force_full():
+    stored = _wm("2024-01-31", "100", rewrites=0)
+    current = _wm("2024-02-01", "110", rewrites=5)
+    assert _input_start(stored, current) is FULL
+    assert _input_start(stored, _wm("2024-02-01", "110", rewrites=0)) == "2024-02-01"
+
+
+def test_new_input_is_full():
+    assert _input_start(None, _wm("2024-01-31", "1")) is FULL
+
+
+def test_topological_order_and_cycle():
+    assert topological_order({"a": set(), "b": {"a"}, "c": {"b"}}) == ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        topological_order({"a": {"b"}, "b": {"a"}})
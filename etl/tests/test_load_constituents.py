@@ -0,0 +1,43 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import load_constituents  # noqa: E402
+
+
+def _changes(rows):
+    return pd.DataFrame(rows, columns=["trade_date", "asset_code", "status"])
+
+
+def test_apply_changes_opens_and_closes_intervals():
+    open_ = {"A": date(2024, 1, 2)}
+    closed = load_constituents.apply_changes(open_, _changes([
+        (date(2024, 2, 1), "B", "in"),
+        (date(2024, 2, 1), "A", "out"),
+        (date(2024, 3, 1), "C", "out"),          # never a member: ignored
+        (date(2024, 3, 4), "A", "in"),
+    ]))
+    assert closed == [("A", date(2024, 1, 2), date(2024, 2, 1))]
+    assert open_ == {"A": date(2024, 3, 4), "B": date(2024, 2, 1)}
+
+
+def test_apply_changes_is_idempotent_on_rerun():
+    changes = _changes([
+        (date(2024, 2, 1), "B", "in"),
+        (date(2024, 2, 1), "B", "in"),           # duplicate record
+        (date(2024, 4, 1), "B", "out"),
+    ])
+    first = {"B": date(2024, 2, 1)}              # already stored from an earlier run
+    assert load_constituents.apply_changes(first, changes) == [("B", date(2024, 2, 1), date(2024, 4, 1))]
+    assert first == {}
+
+
+def test_apply_changes_drops_same_day_in_and_out():
+    open_ = {}
+    assert load_constituents.apply_changes(open_, _changes([
+        (date(2024, 5, 6), "D", "in"), (date(2024, 5, 6), "D", "out"),
+    ])) == []
+    assert open_ == {}
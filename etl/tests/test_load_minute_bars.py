@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import load_minute_bars  # noqa: E402
+
+
+def _one_minute_bars(asset_id, day, seed):
+    times = pd.DatetimeIndex(
+        [pd.Timestamp(f"{day} 09:25")]
+        + list(pd.date_range(f"{day} 09:30", f"{day} 11:29", freq="min"))
+        + list(pd.date_range(f"{day} 13:00", f"{day} 14:59", freq="min"))
+    )
+    rng = np.random.default_rng(seed)
+    close = 10 + rng.normal(0, 0.01, len(times)).cumsum()
+    df = pd.DataFrame({
+        "asset_id": asset_id, "bar_time": times,
+        "open": close - 0.005, "high": close + 0.01, "low": close - 0.01, "close": close,
+        "volume": rng.integers(100, 1000, len(times)).astype(float),
+        "amount": close * 100,
+    })
+    df.loc[5, "high"] = np.nan
+    df.loc[7, "volume"] = np.nan
+    return df
+
+
+def test_resample_bars_aligns_to_sessions():
+    df = pd.concat([_one_minute_bars(2, "2024-03-04", 1), _one_minute_bars(1, "2024-03-04", 2)], ignore_index=True)
+    out = load_minute_bars.resample_bars(df.sample(frac=1, random_state=0), 60)
+
+    assert out["bar_time"].dt.strftime("%H:%M").tolist() == ["09:30", "10:30", "13:00", "14:00"] * 2
+    assert out["asset_id"].tolist() == [1] * 4 + [2] * 4
+
+    src = df.sort_values(["asset_id", "bar_time"])
+    minute = src["bar_time"].dt.hour * 60 + src["bar_time"].dt.minute
+    key = np.select([minute < 630, minute < 720, minute < 840], ["09:30", "10:30", "13:00"], "14:00")
+    ref = src.groupby(["asset_id", key]).agg(
+        open=("open", "first"), high=("high", "max"), low=("low", "min"), close=("close", "last"),
+        volume=("volume", "sum"), amount=("amount", "sum"),
+    ).reset_index(drop=True)
+    cols = ["open", "high", "low", "close", "volume", "amount"]
+    np.testing.assert_allclose(out[cols].to_numpy(), ref[cols].to_numpy())
+
+
+def test_resample_bars_five_minutes_keeps_the_lunch_break():
+    out = load_minute_bars.resample_bars(_one_minute_bars(1, "2024-03-04", 3), 5)
+    times = out["bar_time"].dt.strftime("%H:%M")
+    assert len(out) == 48
+    assert times.iloc[0] == "09:30" and "11:25" in times.tolist() and "13:00" in times.tolist()
+    assert not times.between("11:30", "12:59").any()
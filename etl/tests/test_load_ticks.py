@@ -0,0 +1,74 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import load_ticks  # noqa: E402
+
+
+def test_time_chunks_respects_session_after_and_before():
+    days = [date(2024, 3, 4)]
+    chunks = load_ticks.time_chunks(days, 120, None, now=datetime(2024, 3, 5))
+    assert chunks[0] == (datetime(2024, 3, 4, 9, 15), datetime(2024, 3, 4, 11, 15))
+    assert chunks[-1] == (datetime(2024, 3, 4, 15, 15), datetime(2024, 3, 4, 15, 30))
+
+    after = load_ticks.time_chunks(days, 120, datetime(2024, 3, 4, 12, 0), now=datetime(2024, 3, 5))
+    assert after[0] == (datetime(2024, 3, 4, 12, 0), datetime(2024, 3, 4, 13, 15))
+
+    before = load_ticks.time_chunks(days, 120, None, now=datetime(2024, 3, 5), before=datetime(2024, 3, 4, 10, 0))
+    assert before == [(datetime(2024, 3, 4, 9, 15), datetime(2024, 3, 4, 10, 0))]
+
+
+def test_covering_range_joins_the_stored_range():
+    mark = (datetime(2024, 3, 5, 9, 15), datetime(2024, 3, 6, 15, 30))
+    assert load_ticks.covering_range(date(2024, 3, 1), date(2024, 3, 8), None) == (date(2024, 3, 1), date(2024, 3, 8))
+    # --start after fetched_through: continue from fetched_through
+    assert load_ticks.covering_range(date(2024, 3, 8), date(2024, 3, 9), mark) == (date(2024, 3, 6), date(2024, 3, 9))
+    # --end before fetched_from: backfill up to fetched_from
+    assert load_ticks.covering_range(date(2024, 3, 1), date(2024, 3, 2), mark) == (date(2024, 3, 1), date(2024, 3, 5))
+
+
+class _Limiter:
+    def wait(self):
+        pass
+
+
+def _run(monkeypatch, mark, days):
+    """load_code against an in-memory watermark; returns the fetched chunks and the final mark."""
+    state = {"mark": mark}
+    fetched = []
+
+    def fake_upsert(conn, table, rows, conflict_cols, update_cols):
+        row = rows[0]
+        if state["mark"] is None:
+            state["mark"] = (row["fetched_from"], row["fetched_through"])
+        elif "fetched_from" in update_cols:
+            state["mark"] = (row["fetched_from"], state["mark"][1])
+        else:
+            state["mark"] = (state["mark"][0], row["fetched_through"])
+
+    monkeypatch.setattr(load_ticks, "get_conn", lambda: None)
+    monkeypatch.setattr(load_ticks, "put_conn", lambda conn: None)
+    monkeypatch.setattr(load_ticks, "_ensure_asset", lambda conn, code: 1)
+    monkeypatch.setattr(load_ticks, "_get_watermark", lambda conn, asset_id: state["mark"])
+    monkeypatch.setattr(load_ticks, "upsert", fake_upsert)
+    monkeypatch.setattr(load_ticks, "fetch_chunk",
+                        lambda code, fields, begin, end, options: fetched.append((begin, end)) or pd.DataFrame())
+    load_ticks.load_code("600000.SH", days, "", 120, _Limiter())
+    return fetched, state["mark"]
+
+
+def test_load_code_backfills_and_extends_contiguously(monkeypatch):
+    mark = (datetime(2024, 3, 5, 9, 15), datetime(2024, 3, 5, 15, 30))
+    fetched, final = _run(monkeypatch, mark, [date(2024, 3, 4), date(2024, 3, 5), date(2024, 3, 6)])
+    assert final == (datetime(2024, 3, 4, 9, 15), datetime(2024, 3, 6, 15, 30))
+    assert fetched[0] == (datetime(2024, 3, 4, 15, 15), datetime(2024, 3, 4, 15, 30))    # backfill newest first
+    assert all(b >= mark[1] for b, _ in fetched[4:])
+
+
+def test_load_code_refuses_a_gap(monkeypatch):
+    mark = (datetime(2024, 3, 4, 9, 15), datetime(2024, 3, 4, 15, 30))
+    with pytest.raises(ValueError):
+        _run(monkeypatch, mark, [date(2024, 3, 6)])
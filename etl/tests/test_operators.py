@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import operators as op  # noqa: E402
+
+
+@pytest.fixture
+def panel():
+    rng = np.random.default_rng(7)
+    x = rng.normal(size=(40, 6))
+    x[rng.random(x.shape) < 0.15] = np.nan
+    x[5, :] = np.nan
+    x[:, 2] = np.round(x[:, 2], 0)          # ties
+    return pd.DataFrame(x, index=pd.date_range("2024-01-01", periods=40), columns=list("abcdef"))
+
+
+def test_cross_sectional_ops_match_pandas(panel):
+    pd.testing.assert_frame_equal(op.cs_rank(panel), panel.rank(axis=1, pct=True))
+    z = panel.sub(panel.mean(axis=1), axis=0).div(panel.std(axis=1), axis=0)
+    np.testing.assert_allclose(op.cs_zscore(panel).to_numpy(), z.to_numpy(), atol=1e-12)
+    w = op.winsorize(panel, 0.1, 0.9)
+    assert w.isna().equals(panel.isna())
+    rows = panel.notna().any(axis=1)
+    lo, hi = panel[rows].quantile(0.1, axis=1), panel[rows].quantile(0.9, axis=1)
+    assert (w[rows].min(axis=1) >= lo - 1e-12).all() and (w[rows].max(axis=1) <= hi + 1e-12).all()
+
+
+@pytest.mark.parametrize("window,min_periods", [(5, None), (5, 2), (1, None)])
+def test_time_series_ops_match_pandas(panel, window, min_periods):
+    mp = window if min_periods is None else min_periods
+    roll = panel.rolling(window, min_periods=mp)
+    pd.testing.assert_frame_equal(op.ts_sum(panel, window, min_periods), roll.sum())
+    pd.testing.assert_frame_equal(op.ts_mean(panel, window, min_periods), roll.mean())
+    if window > 1:
+        std = panel.rolling(window, min_periods=max(mp, 2)).std()
+        np.testing.assert_allclose(op.ts_std(panel, window, min_periods).to_numpy(), std.to_numpy(), atol=1e-10)
+    rank = roll.rank(pct=True).where(panel.notna())
+    np.testing.assert_allclose(op.ts_rank(panel, window, min_periods).to_numpy(), rank.to_numpy(), atol=1e-12)
+    pd.testing.assert_frame_equal(op.ts_delay(panel, 2), panel.shift(2))
+    pd.testing.assert_frame_equal(op.ts_delta(panel, 2), panel - panel.shift(2))
+
+
+def test_ts_corr_and_decay_linear(panel):
+    other = panel * 0.5 + np.sin(np.arange(40))[:, None]
+    corr = panel.rolling(8, min_periods=3).corr(other)
+    got = op.ts_corr(panel, other, 8, 3)
+    both = panel.notna() & other.notna()
+    np.testing.assert_allclose(got.where(both).to_numpy(), corr.where(both).to_numpy(), atol=1e-9)
+
+    w = np.arange(1, 5, dtype="float64")
+    ref = panel.rolling(4).apply(lambda v: np.nansum(v * w) / w[~np.isnan(v)].sum(), raw=True)
+    full = panel.notna().rolling(4).sum() == 4
+    np.testing.assert_allclose(op.decay_linear(panel, 4).where(full).to_numpy(), ref.where(full).to_numpy(), atol=1e-12)
+
+
+def test_neutralize_removes_group_means(panel):
+    groups = np.tile(np.array(["x", "x", "y", "y", "y", "z"]), (40, 1))
+    out = op.neutralize(panel, groups=groups)
+    means = out.T.groupby(groups[0]).mean().T
+    np.testing.assert_allclose(means.fillna(0).to_numpy(), 0.0, atol=1e-12)
+    assert out.isna().equals(panel.isna())
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from optimizer import CovEstimate, project_capped_simplex, risk_parity  # noqa: E402
+
+
+def _contributions(w, est):
+    rc = w * est.matvec(w)
+    return rc / rc.sum()
+
+
+def test_risk_parity_with_negative_covariances():
+    cov = np.array([[1.0, 0.2, -0.5], [0.2, 1.0, -0.3], [-0.5, -0.3, 1.0]]) * 1e-4
+    est = CovEstimate(np.array(["a", "b", "c"]), cov, None, None)
+    w, it = risk_parity(est)
+    assert it < 50
+    assert w.sum() == pytest.approx(1.0)
+    np.testing.assert_allclose(_contributions(w, est), 1 / 3, atol=1e-9)
+
+
+def test_risk_parity_random_dense_and_factored():
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=(60, 60))
+    dense = CovEstimate(np.arange(60), a @ a.T / 60 + 0.01 * np.eye(60), None, None)
+    w, _ = risk_parity(dense)
+    assert np.isfinite(w).all() and (w > 0).all()
+    np.testing.assert_allclose(_contributions(w, dense), 1 / 60, rtol=1e-6)
+
+    factored = CovEstimate(np.arange(80), None, rng.normal(size=(80, 4)) * 0.01, rng.uniform(1e-5, 4e-4, 80))
+    budget = np.linspace(1, 2, 80)
+    w, _ = risk_parity(factored, budget)
+    np.testing.assert_allclose(_contributions(w, factored), budget / budget.sum(), rtol=1e-6)
+
+
+def test_project_capped_simplex():
+    w = project_capped_simplex(np.array([0.9, 0.3, -0.2, 0.1]), 0.4)
+    assert w.sum() == pytest.approx(1.0)
+    assert (w >= 0).all() and (w <= 0.4 + 1e-12).all()
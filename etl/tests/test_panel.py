@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from panel import adjust_prices  # noqa: E402
+
+NAN = np.nan
+
+
+def test_adjust_prices_backward_and_forward():
+    prices = np.array([[10.0, 5.0, 100.0], [10.2, 5.1, 101.0], [5.2, 5.2, 102.0], [5.3, NAN, 103.0]])
+    adj = np.array([[NAN, 1.0, NAN], [1.0, NAN, NAN], [2.0, 1.0, NAN], [NAN, 1.5, NAN]])
+
+    back = adjust_prices(prices, adj, "backward")
+    # leading gap takes the first known factor, later gaps the previous one; no factor -> unadjusted
+    np.testing.assert_allclose(back[:, 0], [10.0, 10.2, 10.4, 10.6])
+    np.testing.assert_allclose(back[:, 1], [5.0, 5.1, 5.2, NAN])
+    np.testing.assert_allclose(back[:, 2], prices[:, 2])
+
+    fwd = adjust_prices(prices, adj, "forward")
+    np.testing.assert_allclose(fwd[-1, 0], 5.3)             # last date keeps its traded price
+    np.testing.assert_allclose(fwd[:, 0], [5.0, 5.1, 5.2, 5.3])
+    np.testing.assert_allclose(fwd[:, 1], [5 / 1.5, 5.1 / 1.5, 5.2 / 1.5, NAN])
+    # returns do not depend on the anchoring
+    np.testing.assert_allclose(fwd[1:, 0] / fwd[:-1, 0], back[1:, 0] / back[:-1, 0])
+
+
+def test_adjust_prices_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        adjust_prices(np.ones((2, 2)), np.ones((2, 2)), "both")
@@ -0,0 +1,264 @@
+"""
+内置向量化特征转换：raw → processed.feature_series
+常用 transform_method（daily_return / YoY / MoM / volatility_20d）无需 LLM 生成代码，
+一次读取多个 target 的 raw 数据，按 target_id 分组向量化计算后直接写库。
+只有真正定制化的清洗逻辑才需要走 run_clean_agent.py 的 LLM 流程。
+
+用法：
+  # 多个资产一次计算日收益率与 20 日波动率
+  python transforms.py --type asset --ids 1,2,3 --methods daily_return,volatility_20d
+
+  # 全部宏观指标计算同比/环比，只写入 2024-01-01 之后的结果
+  python transforms.py --type indicator --methods YoY,MoM --start 2024-01-01
+
+Python API：
+  from transforms import run_transforms
+  run_transforms("asset", [1, 2, 3], ["daily_return"])
+"""
+import argparse
+import logging
+import os
+import sys
+import traceback
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from base import copy_upsert, get_conn, put_conn
+from panel import record_feature_write
+
+logger = logging.getLogger(__name__)
+
+
+# ══════════════════════════════════════════════════════════════
+# 1. 批量读取 raw 数据
+# ══════════════════════════════════════════════════════════════
+
+def _fetch_raw_many(conn, target_type: str, target_ids: list[int] | None = None) -> pd.DataFrame:
+    """
+    一条 SQL 读取多个 target 的全量 raw 数据，返回列 obs_date / target_id / value，
+    按 (target_id, obs_date) 排序。资产取后复权 close（close × adj_factor），复权因子缺失的日期
+    与 panel.adjust_prices 一致：沿用前一个因子（开头的缺口取第一个已知因子），完全没有
+    复权因子的资产如指数按不复权；指标取 value。
+    target_ids=None 表示该类型下全部 target。
+    """
+    if target_type == "indicator":
+        sql = (
+            "SELECT trade_date, indicator_id, value FROM raw.indicator_series"
+            " {where} ORDER BY indicator_id, trade_date"
+        )
+        id_col = "indicator_id"
+    elif target_type == "asset":
+        sql = (
+            "SELECT trade_date, asset_id, close, adj_factor FROM raw.daily_prices"
+            " {where} ORDER BY asset_id, trade_date"
+        )
+        id_col = "asset_id"
+    else:
+        raise ValueError(f"target_type 必须是 'indicator' 或 'asset'，收到: {target_type}")
+
+    params: tuple = ()
+    where = ""
+    if target_ids is not None:
+        where = f"WHERE {id_col} = ANY(%s)"
+        params = (list(target_ids),)
+
+    with conn.cursor() as cur:
+        cur.execute(sql.format(where=where), params)
+        rows = cur.fetchall()
+
+    if target_type == "asset":
+        df = pd.DataFrame(rows, columns=["obs_date", "target_id", "value", "adj_factor"])
+        adj = pd.to_numeric(df["adj_factor"], errors="coerce").astype("float64")
+        by_id = adj.groupby(df["target_id"], sort=False)
+        adj = by_id.ffill().fillna(by_id.transform("first")).fillna(1.0)
+        df["value"] = pd.to_numeric(df["value"], errors="coerce").astype("float64") * adj
+        df = df.drop(columns="adj_factor")
+    else:
+        df = pd.DataFrame(rows, columns=["obs_date", "target_id", "value"])
+        df["value"] = pd.to_numeric(df["value"], errors="coerce").astype("float64")
+    df["obs_date"] = pd.to_datetime(df["obs_date"])
+    return df
+
+
+# ══════════════════════════════════════════════════════════════
+# 2. 向量化转换函数
+#    输入：按 (target_id, obs_date) 排序的 DataFrame
+#    输出：与输入同索引的 transformed_value Series
+# ══════════════════════════════════════════════════════════════
+
+def _daily_return(df: pd.DataFrame) -> pd.Series:
+    """相邻观测值的简单收益率。"""
+    prev = df.groupby("target_id", sort=False)["value"].shift(1)
+    return df["value"] / prev - 1.0
+
+
+def _volatility_20d(df: pd.DataFrame) -> pd.Series:
+    """20 个观测的日收益率滚动标准差（未年化），窗口不满时为 NaN。"""
+    ret = _daily_return(df)
+    vol = (
+        ret.groupby(df["target_id"], sort=False)
+        .rolling(20, min_periods=20)
+        .std()
+    )
+    return vol.reset_index(level=0, drop=True).reindex(df.index)
+
+
+def _calendar_change(df: pd.DataFrame, offset: pd.DateOffset, tolerance: pd.Timedelta) -> pd.Series:
+    """
+    按日历偏移取基期值计算增速：value / value(obs_date - offset) - 1。
+    基期值通过 merge_asof 取距离 obs_date - offset 最近的观测（兼容月末日期错位，
+    如 4/30 的环比基期为 3/31），超过 tolerance 则为 NaN，避免拿错期数据当基期。
+    """
+    left = pd.DataFrame({
+        "target_id": df["target_id"].to_numpy(),
+        "lookup":    df["obs_date"] - offset,
+        "row":       np.arange(len(df)),
+    }).sort_values("lookup", kind="stable")
+    right = (
+        df[["target_id", "obs_date", "value"]]
+        .rename(columns={"obs_date": "lookup", "value": "base"})
+        .sort_values("lookup", kind="stable")
+    )
+    merged = pd.merge_asof(
+        left, right, on="lookup", by="target_id",
+        direction="nearest", tolerance=tolerance,
+    )
+    base = np.empty(len(df))
+    base[merged["row"].to_numpy()] = merged["base"].to_numpy(dtype="float64")
+    return pd.Series(df["value"].to_numpy() / base - 1.0, index=df.index)
+
+
+def _yoy(df: pd.DataFrame) -> pd.Series:
+    """同比：与一年前（日历）的值相比。"""
+    return _calendar_change(df, pd.DateOffset(years=1), pd.Timedelta(days=15))
+
+
+def _mom(df: pd.DataFrame) -> pd.Series:
+    """环比：与一个月前（日历）的值相比。"""
+    return _calendar_change(df, pd.DateOffset(months=1), pd.Timedelta(days=10))
+
+
+# transform_method → 计算函数；新增内置转换只需在此注册
+TRANSFORMS: dict[str, Callable[[pd.DataFrame], pd.Series]] = {
+    "daily_return":   _daily_return,
+    "YoY":            _yoy,
+    "MoM":            _mom,
+    "volatility_20d": _volatility_20d,
+}
+
+
+def compute_transform(raw_df: pd.DataFrame, method: str, target_type: str) -> pd.DataFrame:
+    """
+    对 _fetch_raw_many 返回的多 target 数据计算一种转换，
+    返回符合 processed.feature_series 结构的 DataFrame（已剔除 NaN 结果）。
+    """
+    if method not in TRANSFORMS:
+        raise ValueError(f"未知的内置转换: {method}，可选值：{list(TRANSFORMS)}")
+
+    transformed = TRANSFORMS[method](raw_df)
+    out = pd.DataFrame({
+        "obs_date":          raw_df["obs_date"],
+        "target_type":       target_type,
+        "target_id":         raw_df["target_id"],
+        "raw_value":         raw_df["value"],
+        "transformed_value": transformed.replace([np.inf, -np.inf], np.nan),
+        "transform_method":  method,
+    })
+    return out[out["transformed_value"].notna()]
+
+
+# ══════════════════════════════════════════════════════════════
+# 3. 写入 processed.feature_series
+# ══════════════════════════════════════════════════════════════
+
+def _write_features(conn, result_df: pd.DataFrame) -> int:
+    if result_df.empty:
+        return 0
+    n = copy_upsert(
+        conn,
+        table="processed.feature_series",
+        df=result_df,
+        columns=["obs_date", "target_type", "target_id", "raw_value", "transformed_value", "transform_method"],
+        conflict_cols=["obs_date", "target_type", "target_id", "transform_method"],
+        update_cols=["raw_value", "transformed_value"],
+    )
+    record_feature_write(conn, result_df)      # 写入已提交后再登记版本，供面板缓存/血缘判断改写
+    return n
+
+
+# ══════════════════════════════════════════════════════════════
+# 4. 主流程
+# ══════════════════════════════════════════════════════════════
+
+def run_transforms(
+    target_type: str,
+    target_ids: list[int] | None = None,
+    methods: list[str] | None = None,
+    start: str | None = None,
+) -> dict[str, int]:
+    """
+    一次读取全部 target 的 raw 数据，逐个内置转换向量化计算并写库。
+    计算始终使用完整历史（保证滚动窗口/同比基期正确），
+    start 仅限制写入的 obs_date 下界，用于增量刷新。
+    返回 {transform_method: 写入行数} 字典。
+    """
+    methods = methods or list(TRANSFORMS)
+    unknown = [m for m in methods if m not in TRANSFORMS]
+    if unknown:
+        raise ValueError(f"未知的内置转换: {unknown}，可选值：{list(TRANSFORMS)}")
+
+    results: dict[str, int] = {}
+    conn = get_conn()
+    try:
+        raw_df = _fetch_raw_many(conn, target_type, target_ids)
+        if raw_df.empty:
+            logger.warning(f"raw 表中无 target_type={target_type} 的数据")
+            return {m: 0 for m in methods}
+        logger.info(
+            f"读取 raw 数据 {len(raw_df)} 行，"
+            f"{raw_df['target_id'].nunique()} 个 {target_type}"
+        )
+
+        for method in methods:
+            result_df = compute_transform(raw_df, method, target_type)
+            if start:
+                result_df = result_df[result_df["obs_date"] >= pd.Timestamp(start)]
+            n = _write_features(conn, result_df)
+            logger.info(f"{method} 写入 {n} 行到 processed.feature_series")
+            results[method] = n
+    finally:
+        put_conn(conn)
+
+    return results
+
+
+# ══════════════════════════════════════════════════════════════
+# CLI 入口
+# ══════════════════════════════════════════════════════════════
+
+def _parse_args():
+    p = argparse.ArgumentParser(description="内置向量化特征转换：raw → processed.feature_series")
+    p.add_argument("--type", required=True, choices=["asset", "indicator"], dest="target_type",
+                   help="数据类型: asset（行情）或 indicator（宏观指标）")
+    p.add_argument("--ids", default="", dest="target_ids",
+                   help="逗号分隔的 meta 表 ID；留空表示该类型下全部 target")
+    p.add_argument("--methods", default=",".join(TRANSFORMS),
+                   help=f"逗号分隔的 transform_method，可选：{','.join(TRANSFORMS)}")
+    p.add_argument("--start", default=None,
+                   help="只写入该日期（YYYY-MM-DD）及之后的结果")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    ids = [int(x) for x in args.target_ids.split(",") if x.strip()] or None
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    try:
+        results = run_transforms(args.target_type, ids, methods, start=args.start)
+        print(f"\n完成，共写入 {sum(results.values())} 行。")
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
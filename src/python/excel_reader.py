@@ -7,8 +7,16 @@ Expected Excel format:
 
 Header row is auto-detected: if the first row contains known header names
 (code, beginTime, endTime) it is skipped; otherwise all rows are treated as data.
+
+Each row keeps its own time range: codes that share the same
+(beginTime, endTime) are grouped so the bridge can send one Wind request per
+distinct window instead of fetching every code over the widest span. Rows are
+streamed from the sheet, so large universe files are never held in memory as
+a whole.
 """
 
+from datetime import date, datetime
+
 from openpyxl import load_workbook
 
 HEADER_ALIASES = {
@@ -36,64 +44,88 @@ def _normalize_header(val: str) -> str | None:
     return HEADER_ALIASES.get(val.strip().lower().replace(" ", ""))
 
 
+def _cell_text(val) -> str | None:
+    """Cell value as text; Excel date cells become YYYY-MM-DD so equal windows group together."""
+    if val is None:
+        return None
+    if isinstance(val, (datetime, date)):
+        return val.strftime("%Y-%m-%d")
+    return str(val).strip() or None
+
+
 def read_excel(path: str) -> dict:
-    """Return {"codes": "000001.SZ,000002.SZ", "beginTime": ..., "endTime": ...}."""
+    """
+    Return {"codes": "000001.SZ,000002.SZ", "beginTime": ..., "endTime": ...,
+            "groups": [{"codes": ..., "beginTime": ..., "endTime": ...}, ...]}.
+
+    codes / beginTime / endTime describe the whole sheet (all codes, earliest
+    begin, latest end) for functions without a per-code time range. groups
+    holds one entry per distinct (beginTime, endTime) row window in sheet
+    order; a window bound is None when those rows left the cell empty.
+    """
     wb = load_workbook(path, read_only=True, data_only=True)
-    ws = wb.active
-
-    rows = list(ws.iter_rows(values_only=True))
-    wb.close()
-
-    if not rows:
-        raise ValueError(f"Excel file is empty: {path}")
-
-    # Detect header row
-    col_map = {}  # column index -> field name
-    data_start = 0
-
-    first_row = rows[0]
-    for idx, cell in enumerate(first_row):
-        if cell is not None:
-            field = _normalize_header(str(cell))
-            if field:
-                col_map[idx] = field
-
-    if col_map:
-        data_start = 1  # skip header
-    else:
-        # No header detected — assume column order: code, beginTime, endTime
-        col_map = {0: "code"}
-        if len(first_row) > 1:
-            col_map[1] = "beginTime"
-        if len(first_row) > 2:
-            col_map[2] = "endTime"
-
-    codes = []
-    begin_times = []
-    end_times = []
-
-    for row in rows[data_start:]:
-        for idx, field in col_map.items():
-            if idx >= len(row) or row[idx] is None:
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        first_row = next(rows, None)
+        if first_row is None:
+            raise ValueError(f"Excel file is empty: {path}")
+
+        # Detect header row
+        col_map = {}  # field name -> column index
+        for idx, cell in enumerate(first_row):
+            if cell is not None:
+                field = _normalize_header(str(cell))
+                if field and field not in col_map:
+                    col_map[field] = idx
+
+        if col_map:
+            data_rows = rows  # header skipped
+        else:
+            # No header detected — assume column order: code, beginTime, endTime
+            col_map = {"code": 0}
+            if len(first_row) > 1:
+                col_map["beginTime"] = 1
+            if len(first_row) > 2:
+                col_map["endTime"] = 2
+            data_rows = _chain(first_row, rows)
+
+        code_idx = col_map.get("code")
+        begin_idx = col_map.get("beginTime")
+        end_idx = col_map.get("endTime")
+
+        def cell(row, idx):
+            return _cell_text(row[idx]) if idx is not None and idx < len(row) else None
+
+        groups: dict[tuple, dict] = {}  # (begin, end) -> {code: None}, insertion-ordered
+        for row in data_rows:
+            code = cell(row, code_idx)
+            if not code:
                 continue
-            val = str(row[idx]).strip()
-            if not val:
-                continue
-            if field == "code":
-                codes.append(val)
-            elif field == "beginTime":
-                begin_times.append(val)
-            elif field == "endTime":
-                end_times.append(val)
-
-    if not codes:
+            window = (cell(row, begin_idx), cell(row, end_idx))
+            groups.setdefault(window, {})[code] = None
+    finally:
+        wb.close()
+
+    if not groups:
         raise ValueError(f"No codes found in Excel: {path}")
 
-    result = {"codes": ",".join(codes)}
+    all_codes = dict.fromkeys(c for codes in groups.values() for c in codes)
+    result = {"codes": ",".join(all_codes)}
 
+    begin_times = [b for b, _ in groups if b]
+    end_times = [e for _, e in groups if e]
     if begin_times:
         result["beginTime"] = min(begin_times)
     if end_times:
         result["endTime"] = max(end_times)
 
+    result["groups"] = [
+        {"codes": ",".join(codes), "beginTime": begin, "endTime": end}
+        for (begin, end), codes in groups.items()
+    ]
     return result
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from utils import wind_data_to_dict, handle_error, merge_time_windows
+from WindPy import w
+
+# Calendar days per wsi request; Wind rejects or truncates longer minute-bar spans
+WINDOW_DAYS = 30
+
+
+def _parse_time(value: str, end: bool = False) -> datetime:
+    value = value.strip()
+    if len(value) <= 10:  # date only: whole day
+        day = datetime.strptime(value, "%Y-%m-%d")
+        return day.replace(hour=23, minute=59, second=59) if end else day
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+
+def time_windows(begin: datetime, end: datetime, days: int = WINDOW_DAYS) -> list[tuple[datetime, datetime]]:
+    """Split [begin, end] into consecutive windows of at most `days` calendar days."""
+    windows = []
+    start = begin
+    while start <= end:
+        stop = min(start + timedelta(days=days) - timedelta(seconds=1), end)
+        windows.append((start, stop))
+        start = stop + timedelta(seconds=1)
+    return windows
+
+
+def _fetch_code(code: str, fields: str, windows, options: str) -> dict | None:
+    """One code over all windows, concatenated along time."""
+    merged = None
+    for start, stop in windows:
+        data = w.wsi(code, fields, start.strftime("%Y-%m-%d %H:%M:%S"), stop.strftime("%Y-%m-%d %H:%M:%S"), options)
+        if data.ErrorCode == -4:  # no data in this window (holidays, before listing)
+            continue
+        if data.ErrorCode != 0:
+            raise RuntimeError(handle_error(data.ErrorCode))
+        part = wind_data_to_dict(data, with_time=True)
+        if merged is None:
+            merged = part
+        else:
+            merged["times"].extend(part["times"])
+            for row, more in zip(merged["data"], part["data"]):
+                row.extend(more)
+    return merged
+
+
+def handle_wsi(params: dict) -> dict:
+    codes = params["codes"]
+    fields = params["fields"]
+    begin_time = _parse_time(params["beginTime"])
+    end_time = _parse_time(params["endTime"], end=True)
+    options = params.get("options", "")
+
+    code_list = [c.strip() for c in codes.split(",") if c.strip()]
+    windows = time_windows(begin_time, end_time, int(params.get("windowDays") or WINDOW_DAYS))
+
+    # One code per request; codes with different trading minutes are aligned on the union of times
+    results = [r for r in (_fetch_code(code, fields, windows, options) for code in code_list) if r]
+    if not results:
+        raise RuntimeError(handle_error(-4))
+    if len(results) == 1:
+        return results[0]
+    return merge_time_windows(results)
@@ -14,4 +14,4 @@ def handle_wst(params: dict) -> dict:
     if data.ErrorCode != 0:
         raise RuntimeError(handle_error(data.ErrorCode))
 
-    return wind_data_to_dict(data)
+    return wind_data_to_dict(data, with_time=True)
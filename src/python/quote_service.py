@@ -0,0 +1,492 @@
+"""Long-running real-time quote service on top of WindPy wsq subscriptions.
+
+handle_wsq takes one snapshot per bridge process, which means a Wind login
+for every poll. This service logs in once, subscribes with
+w.wsq(codes, fields, func=callback) and keeps the latest `capacity` ticks
+of every code in a preallocated NumPy ring buffer. Each tick is the full
+field vector, forward-filled from the code's previous tick, because Wind
+only pushes the fields that changed. Local clients read it over HTTP
+(QUOTE_SERVICE_HOST / QUOTE_SERVICE_PORT, default 127.0.0.1:3003):
+
+    GET /health
+    GET /subscribe?codes=600000.SH,000001.SZ
+    GET /unsubscribe?codes=600000.SH
+    GET /snapshot[?codes=...]                     latest tick per (subscribed) code
+    GET /ticks?since=<seq>[&codes=...][&limit=N]  ticks newer than seq
+
+Every tick gets a global, increasing sequence number. A client polls
+/ticks with the `seq` of its previous response to receive only the delta;
+`gap: true` means ticks it had not seen were already overwritten in the
+ring.
+
+With --bars, one-minute bars (OHLC from RT_LAST, volume / amount from the
+day-cumulative RT_VOL / RT_AMT) are built in the callback and flushed to
+raw.intraday_bars in batches every --flush-s seconds.
+
+Usage:
+    python src/python/quote_service.py [--codes 600000.SH,...] [--fields rt_last,rt_vol,...]
+                                       [--capacity 2048] [--bars] [--port 3003]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, r"C:\Wind\Wind.NET.Client\WindNET\bin")
+
+from utils import handle_error
+
+logger = logging.getLogger("quote_service")
+
+DEFAULT_FIELDS = "rt_last,rt_vol,rt_amt,rt_bid1,rt_ask1,rt_bsize1,rt_asize1"
+BAR_FIELDS = ("RT_LAST", "RT_VOL", "RT_AMT")
+SESSION_OPEN = "09:30"      # bars starting at or before this minute count volume from zero
+ETL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "etl")
+
+
+class TickRing:
+    """Latest `capacity` ticks per code: values (codes, capacity, fields), times / seqs (codes, capacity)."""
+
+    def __init__(self, fields: list[str], capacity: int = 2048):
+        self.fields = [f.upper() for f in fields]
+        self._field_index = {f: i for i, f in enumerate(self.fields)}
+        self.capacity = capacity
+        self.codes: list[str] = []
+        self._code_index: dict[str, int] = {}
+        self.values = np.full((0, capacity, len(self.fields)), np.nan)
+        self.times = np.zeros((0, capacity), dtype=np.int64)      # epoch ms
+        self.seqs = np.zeros((0, capacity), dtype=np.int64)       # 0 = empty slot
+        self.latest = np.full((0, len(self.fields)), np.nan)
+        self.count = np.zeros(0, dtype=np.int64)                  # ticks ever written per code
+        self.evicted = np.zeros(0, dtype=np.int64)                # seq of the newest overwritten tick per code
+        self.active = np.zeros(0, dtype=bool)                     # currently subscribed
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def add_codes(self, codes: list[str]) -> None:
+        """Make rows for new codes and mark all of them active (a resubscribed code keeps its ticks)."""
+        if not codes:
+            return
+        with self.lock:
+            self.active[self._rows(codes)] = True
+            new = [c for c in dict.fromkeys(codes) if c not in self._code_index]
+            if not new:
+                return
+            k = len(new)
+            self.values = np.concatenate([self.values, np.full((k, self.capacity, len(self.fields)), np.nan)])
+            self.times = np.concatenate([self.times, np.zeros((k, self.capacity), dtype=np.int64)])
+            self.seqs = np.concatenate([self.seqs, np.zeros((k, self.capacity), dtype=np.int64)])
+            self.latest = np.concatenate([self.latest, np.full((k, len(self.fields)), np.nan)])
+            self.count = np.concatenate([self.count, np.zeros(k, dtype=np.int64)])
+            self.evicted = np.concatenate([self.evicted, np.zeros(k, dtype=np.int64)])
+            self.active = np.concatenate([self.active, np.ones(k, dtype=bool)])
+            for c in new:
+                self._code_index[c] = len(self.codes)
+                self.codes.append(c)
+
+    def deactivate(self, codes: list[str]) -> None:
+        """Unsubscribed codes keep their rows and ticks but leave the default snapshot."""
+        if not codes:
+            return
+        with self.lock:
+            self.active[self._rows(codes)] = False
+
+    def push(self, codes: list[str], fields: list[str], data, time_ms: int) -> np.ndarray:
+        """
+        Apply one callback: data[field][code] for the pushed fields only.
+        Returns the row indices of the codes that got a tick.
+        """
+        rows = np.array([self._code_index.get(c, -1) for c in codes])
+        cols = np.array([self._field_index.get(f.upper(), -1) for f in fields])
+        known_rows, known_cols = rows >= 0, cols >= 0
+        if not known_rows.any() or not known_cols.any():
+            return np.empty(0, dtype=np.int64)
+        block = np.array(data, dtype=np.float64)[np.ix_(known_cols, known_rows)].T   # codes x fields
+        rows, cols = rows[known_rows], cols[known_cols]
+        with self.lock:
+            update = self.latest[rows]
+            update[:, cols] = np.where(np.isnan(block), update[:, cols], block)
+            self.latest[rows] = update
+            slots = self.count[rows] % self.capacity
+            seqs = self.seq + 1 + np.arange(len(rows))
+            self.seq += len(rows)
+            self.evicted[rows] = np.maximum(self.evicted[rows], self.seqs[rows, slots])
+            self.values[rows, slots] = update
+            self.times[rows, slots] = time_ms
+            self.seqs[rows, slots] = seqs
+            self.count[rows] += 1
+        return rows
+
+    def _rows(self, codes: list[str] | None) -> np.ndarray:
+        if not codes:
+            return np.arange(len(self.codes))
+        return np.array([self._code_index[c] for c in codes if c in self._code_index], dtype=np.int64)
+
+    def snapshot(self, codes: list[str] | None = None) -> dict:
+        """Latest tick per code: the given codes, or every subscribed one. `active` is false for unsubscribed codes."""
+        with self.lock:
+            rows = self._rows(codes) if codes else np.flatnonzero(self.active)
+            last_slot = (self.count[rows] - 1) % self.capacity
+            values = self.latest[rows].copy()
+            times = self.times[rows, last_slot]
+            seqs = np.where(self.count[rows] > 0, self.seqs[rows, last_slot], 0)
+            active = self.active[rows]
+            seq = self.seq
+        return {
+            "seq": seq,
+            "fields": self.fields,
+            "quotes": {
+                self.codes[r]: {"seq": int(s), "time": _iso(t) if s else None, "active": bool(a),
+                                "values": _floats(v)}
+                for r, v, t, s, a in zip(rows, values, times, seqs, active)
+            },
+        }
+
+    def since(self, seq: int, codes: list[str] | None = None, limit: int | None = None) -> dict:
+        """Ticks with sequence number > seq, oldest first, at most `limit` of them."""
+        with self.lock:
+            rows = self._rows(codes)
+            seqs = self.seqs[rows]
+            r, s = np.nonzero(seqs > seq)
+            order = np.argsort(seqs[r, s], kind="stable")
+            if limit:
+                order = order[:limit]
+            r, s = r[order], s[order]
+            out_seqs = seqs[r, s]
+            values = self.values[rows[r], s]
+            times = self.times[rows[r], s]
+            gap = bool((self.evicted[rows] > seq).any())
+            head = self.seq
+        next_seq = int(out_seqs[-1]) if limit and len(out_seqs) == limit else head
+        return {
+            "seq": next_seq,
+            "gap": gap,
+            "fields": self.fields,
+            "ticks": [
+                {"seq": int(q), "code": self.codes[rows[i]], "time": _iso(t), "values": _floats(v)}
+                for i, q, t, v in zip(r, out_seqs, times, values)
+            ],
+        }
+
+
+class BarBuilder:
+    """One-minute bars per code from the forward-filled ticks; closed bars queue up for flushing."""
+
+    def __init__(self, ring: TickRing):
+        self.ring = ring
+        missing = [f for f in BAR_FIELDS if f not in ring.fields]
+        if missing:
+            raise ValueError(f"--bars needs fields {missing}")
+        self.cols = [ring.fields.index(f) for f in BAR_FIELDS]
+        self.open: dict[str, list] = {}             # code -> [minute_ms, o, h, l, c, cum_vol, cum_amt, vol0, amt0]
+        self.base: dict[str, tuple] = {}            # code -> (date, cum_vol, cum_amt) when its last bar closed
+        self.closed: list[tuple] = []
+        self.lock = threading.Lock()
+
+    def update(self, rows: np.ndarray, time_ms: int) -> None:
+        minute = time_ms - time_ms % 60_000
+        last, vol, amt = (self.ring.latest[rows, c] for c in self.cols)
+        with self.lock:
+            for r, px, v, a in zip(rows, last, vol, amt):
+                if np.isnan(px):
+                    continue
+                code = self.ring.codes[r]
+                bar = self.open.get(code)
+                if bar is not None and bar[0] != minute:
+                    self._close(code)
+                    bar = None
+                if bar is None:
+                    self.open[code] = [minute, px, px, px, px, v, a, *self._baseline(code, minute)]
+                else:
+                    bar[2], bar[3], bar[4], bar[5], bar[6] = max(bar[2], px), min(bar[3], px), px, v, a
+
+    def _baseline(self, code: str, minute: int) -> tuple[float, float]:
+        """
+        Cumulative (vol, amt) before a new bar. RT_VOL / RT_AMT restart at zero
+        every trading day, so the first bar of a day counts from zero. A code
+        first seen mid-session has no known baseline and its first bar gets
+        NaN volume / amount.
+        """
+        t = datetime.fromtimestamp(minute / 1000)
+        prev = self.base.get(code)
+        if prev is not None and prev[0] == t.date():
+            return prev[1], prev[2]
+        if prev is not None or t.strftime("%H:%M") <= SESSION_OPEN:
+            return 0.0, 0.0
+        return np.nan, np.nan
+
+    def _close(self, code: str) -> None:
+        minute, o, h, l, c, cum_v, cum_a, v0, a0 = self.open.pop(code)
+        self.closed.append((code, minute, o, h, l, c, cum_v - v0, cum_a - a0))
+        self.base[code] = (datetime.fromtimestamp(minute / 1000).date(), cum_v, cum_a)
+
+    def drain(self, now_ms: int) -> list[tuple]:
+        """Close bars whose minute has passed (even without a newer tick) and hand back everything closed."""
+        current = now_ms - now_ms % 60_000
+        with self.lock:
+            for code in [c for c, bar in self.open.items() if bar[0] < current]:
+                self._close(code)
+            closed, self.closed = self.closed, []
+        return closed
+
+
+def flush_bars(bars: list[tuple]) -> int:
+    """Upsert closed bars into raw.intraday_bars (freq '1m')."""
+    if ETL_DIR not in sys.path:
+        sys.path.insert(0, ETL_DIR)
+    import pandas as pd
+    from base import copy_upsert, ensure_month_partitions, get_conn, put_conn
+
+    df = pd.DataFrame(bars, columns=["asset_code", "bar_time", "open", "high", "low", "close", "volume", "amount"])
+    # minute_ms comes from the local exchange time of the Wind push (_time_ms); store it as local wall-clock time
+    df["bar_time"] = pd.to_datetime([datetime.fromtimestamp(ms / 1000) for ms in df["bar_time"]])
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT asset_code, id FROM meta.assets WHERE asset_code = ANY(%s)",
+                        (sorted(df["asset_code"].unique().tolist()),))
+            ids = dict(cur.fetchall())
+        unknown = sorted(set(df["asset_code"]) - set(ids))
+        if unknown:
+            logger.warning(f"bars skipped for codes not in meta.assets: {unknown}")
+        df["asset_id"] = df["asset_code"].map(ids)
+        df = df.dropna(subset=["asset_id"])
+        df["asset_id"] = df["asset_id"].astype("int64")
+        ensure_month_partitions(conn, "raw.intraday_bars", df["bar_time"].dt.date.unique())
+        df["bar_time"] = df["bar_time"].dt.strftime("%Y-%m-%d %H:%M:%S")     # keep the time through COPY
+        columns = ["asset_id", "freq", "bar_time", "open", "high", "low", "close", "volume", "amount"]
+        return copy_upsert(
+            conn, "raw.intraday_bars", df, columns,
+            conflict_cols=["asset_id", "freq", "bar_time"], update_cols=columns[3:], constants={"freq": "1m"},
+        )
+    finally:
+        put_conn(conn)
+
+
+def _iso(ms) -> str:
+    return datetime.fromtimestamp(int(ms) / 1000).isoformat(timespec="milliseconds")
+
+
+def _floats(v: np.ndarray) -> list:
+    return [None if np.isnan(x) else float(x) for x in v]
+
+
+def _time_ms(times) -> int:
+    t = times[0] if times else None
+    if isinstance(t, datetime):
+        return int(t.timestamp() * 1000)
+    return int(time.time() * 1000)
+
+
+class QuoteService:
+    def __init__(self, fields: str, capacity: int, bars: bool):
+        self.field_list = [f.strip() for f in fields.split(",") if f.strip()]
+        self.ring = TickRing(self.field_list, capacity)
+        self.bars = BarBuilder(self.ring) if bars else None
+        self.requests: dict[int, list[str]] = {}    # Wind request id -> codes
+        self.callbacks = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def start_wind(self) -> None:
+        from WindPy import w
+        self.w = w
+        result = w.start(waitTime=10)
+        if result.ErrorCode != 0:
+            raise RuntimeError(f"Wind start failed: {result.ErrorCode}")
+
+    def on_quote(self, indata) -> None:
+        """WindPy callback (Wind's thread): keep it to a few array writes."""
+        if indata.ErrorCode != 0:
+            logger.warning(f"wsq push error: {handle_error(indata.ErrorCode)}")
+            return
+        time_ms = _time_ms(indata.Times)
+        rows = self.ring.push(indata.Codes, indata.Fields, indata.Data, time_ms)
+        if self.bars is not None and len(rows):
+            self.bars.update(rows, time_ms)
+        self.callbacks += 1
+
+    def subscribe(self, codes: list[str]) -> list[str]:
+        with self._lock:
+            subscribed = {c for cs in self.requests.values() for c in cs}
+            new = [c for c in dict.fromkeys(codes) if c not in subscribed]
+            if not new:
+                return []
+            self.ring.add_codes(new)
+            data = self.w.wsq(",".join(new), ",".join(self.field_list), func=self.on_quote)
+            if data.ErrorCode != 0:
+                self.ring.deactivate(new)
+                raise RuntimeError(handle_error(data.ErrorCode))
+            self.requests[data.RequestID] = new
+            logger.info(f"subscribed {len(new)} codes (request {data.RequestID})")
+            return new
+
+    def unsubscribe(self, codes: list[str]) -> tuple[list[str], list[str]]:
+        """
+        Wind cancels whole requests: cancel the ones holding these codes and
+        resubscribe the rest. Returns (unsubscribed, lost): lost are codes
+        that shared a cancelled request and could not be resubscribed; they
+        are no longer subscribed either.
+        """
+        drop = set(codes)
+        with self._lock:
+            affected = {rid: cs for rid, cs in self.requests.items() if drop & set(cs)}
+            for rid in affected:
+                self.w.cancelRequest(rid)
+                del self.requests[rid]
+        removed = sorted(drop & {c for cs in affected.values() for c in cs})
+        self.ring.deactivate(removed)
+        keep = [c for cs in affected.values() for c in cs if c not in drop]
+        lost = []
+        if keep:
+            try:
+                self.subscribe(keep)
+            except Exception as e:
+                self.ring.deactivate(keep)
+                lost = keep
+                logger.error(f"resubscribe of {len(keep)} codes after unsubscribe failed: {e}")
+        return removed, lost
+
+    def subscribed(self) -> list[str]:
+        with self._lock:
+            return [c for cs in self.requests.values() for c in cs]
+
+    def flush_loop(self, interval_s: float) -> None:
+        while True:
+            time.sleep(interval_s)
+            bars = self.bars.drain(int(time.time() * 1000))
+            if not bars:
+                continue
+            try:
+                n = flush_bars(bars)
+                logger.info(f"flushed {n} bars")
+            except Exception as e:
+                with self.bars.lock:        # keep them for the next flush
+                    self.bars.closed[:0] = bars
+                logger.error(f"bar flush failed ({len(bars)} kept): {e}")
+
+
+# ── HTTP ───────────────────────────────────────────────────
+
+class BadRequest(ValueError):
+    pass
+
+
+def _codes(query: dict) -> list[str] | None:
+    value = (query.get("codes") or [""])[0]
+    return [c.strip() for c in value.split(",") if c.strip()] or None
+
+
+def _int(query: dict, name: str, default: int | None = None) -> int | None:
+    value = (query.get(name) or [""])[0].strip()
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer") from None
+
+
+def make_handler(service: QuoteService):
+    def health(_q):
+        return {"ok": True, "codes": len(service.subscribed()), "seq": service.ring.seq,
+                "callbacks": service.callbacks, "uptime_s": round(time.time() - service.started, 1)}
+
+    def subscribe(q):
+        codes = _codes(q)
+        if not codes:
+            raise BadRequest("Missing codes")
+        return {"ok": True, "subscribed": service.subscribe(codes), "codes": service.subscribed()}
+
+    def unsubscribe(q):
+        codes = _codes(q)
+        if not codes:
+            raise BadRequest("Missing codes")
+        removed, lost = service.unsubscribe(codes)
+        body = {"ok": not lost, "unsubscribed": removed, "lost": lost, "codes": service.subscribed()}
+        if lost:
+            body["error"] = f"Resubscribe failed, no longer subscribed: {','.join(lost)}"
+        return body
+
+    def snapshot(q):
+        return {"ok": True, **service.ring.snapshot(_codes(q))}
+
+    def ticks(q):
+        return {"ok": True, **service.ring.since(_int(q, "since", 0), _codes(q), _int(q, "limit"))}
+
+    routes = {"/health": health, "/subscribe": subscribe, "/unsubscribe": unsubscribe,
+              "/snapshot": snapshot, "/ticks": ticks}
+
+    class QuoteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            route = routes.get(url.path.rstrip("/") or "/")
+            if route is None:
+                status, body = 404, {"ok": False, "error": f"Unknown path {url.path}"}
+            else:
+                try:
+                    status, body = 200, route(parse_qs(url.query))
+                except BadRequest as e:
+                    status, body = 400, {"ok": False, "error": str(e)}
+                except Exception as e:
+                    logger.exception(f"{url.path} failed")
+                    status, body = 500, {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return QuoteHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wind wsq subscription service")
+    parser.add_argument("--codes", default="", help="codes to subscribe at startup")
+    parser.add_argument("--fields", default=DEFAULT_FIELDS)
+    parser.add_argument("--capacity", type=int, default=2048, help="ticks kept per code")
+    parser.add_argument("--bars", action="store_true", help="build 1-minute bars into raw.intraday_bars")
+    parser.add_argument("--flush-s", type=float, default=60, help="bar flush interval in seconds")
+    parser.add_argument("--host", default=os.getenv("QUOTE_SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("QUOTE_SERVICE_PORT", "3003")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s — %(message)s")
+    service = QuoteService(args.fields, args.capacity, args.bars)
+    service.start_wind()
+    if args.codes:
+        service.subscribe([c.strip() for c in args.codes.split(",") if c.strip()])
+    if service.bars is not None:
+        threading.Thread(target=service.flush_loop, args=(args.flush_s,), daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    logger.info(f"quote_service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for rid in list(service.requests):
+            service.w.cancelRequest(rid)
+
+
+if __name__ == "__main__":
+    main()
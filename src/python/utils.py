@@ -1,16 +1,21 @@
 from datetime import datetime
 
 
-def wind_data_to_dict(data) -> dict:
-    """Convert a WindPy WindData object to a plain serializable dict."""
+def wind_data_to_dict(data, with_time: bool = False) -> dict:
+    """Convert a WindPy WindData object to a plain serializable dict.
+
+    with_time keeps the time of day in `times` (YYYY-MM-DD HH:MM:SS.mmm), for tick / minute data.
+    """
     if data is None:
         return {}
 
+    time_format = "%Y-%m-%d %H:%M:%S.%f" if with_time else "%Y-%m-%d"
+    cut = -3 if with_time else None
     result = {
         "error_code": data.ErrorCode,
         "codes": data.Codes,
         "fields": data.Fields,
-        "times": [t.strftime("%Y-%m-%d") if isinstance(t, datetime) else str(t) for t in (data.Times or [])],
+        "times": [t.strftime(time_format)[:cut] if isinstance(t, datetime) else str(t) for t in (data.Times or [])],
         "data": [],
     }
 
@@ -67,3 +72,26 @@ def merge_wind_results(results: list[dict]) -> dict:
         merged["data"].extend(r["data"])
 
     return merged
+
+
+def merge_time_windows(results: list[dict]) -> dict:
+    """Merge results fetched over different date windows onto the union of their times (None where absent)."""
+    if not results:
+        return {}
+
+    times = sorted({t for r in results for t in r["times"]})
+    merged = {
+        "error_code": 0,
+        "codes": [],
+        "fields": results[0]["fields"],
+        "times": times,
+        "data": [],
+    }
+
+    for r in results:
+        pos = {t: i for i, t in enumerate(r["times"])}
+        idx = [pos.get(t) for t in times]
+        merged["codes"].extend(r["codes"])
+        merged["data"].extend([row[i] if i is not None else None for i in idx] for row in r["data"])
+
+    return merged
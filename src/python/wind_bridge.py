@@ -15,11 +15,13 @@ from handlers.wset import handle_wset
 from handlers.edb import handle_edb
 from handlers.tdays import handle_tdays
 from handlers.wst import handle_wst
+from handlers.wsi import handle_wsi
 from handlers.wses import handle_wses
 from handlers.wsee import handle_wsee
 from handlers.tdaysoffset import handle_tdaysoffset
 from handlers.tdayscount import handle_tdayscount
 from excel_reader import read_excel
+from utils import merge_time_windows
 
 HANDLERS = {
     "wsd": handle_wsd,
@@ -29,12 +31,29 @@ HANDLERS = {
     "edb": handle_edb,
     "tdays": handle_tdays,
     "wst": handle_wst,
+    "wsi": handle_wsi,
     "wses": handle_wses,
     "wsee": handle_wsee,
     "tdaysoffset": handle_tdaysoffset,
     "tdayscount": handle_tdayscount,
 }
 
+# Date-series functions: Excel rows with different windows are fetched one request per window
+WINDOWED_FUNCTIONS = {"wsd", "edb", "wses"}
+
+
+def excel_windows(excel_data: dict, params: dict) -> list[tuple[str, str, str]]:
+    """
+    (codes, beginTime, endTime) per distinct row window. Explicit params
+    override every row; an empty cell falls back to the sheet-wide bound.
+    """
+    windows: dict[tuple, list[str]] = {}
+    for g in excel_data["groups"]:
+        begin = params.get("beginTime") or g["beginTime"] or excel_data.get("beginTime")
+        end = params.get("endTime") or g["endTime"] or excel_data.get("endTime")
+        windows.setdefault((begin, end), []).append(g["codes"])
+    return [(",".join(codes), begin, end) for (begin, end), codes in windows.items()]
+
 
 def handle_ping():
     try:
@@ -60,13 +79,16 @@ def main():
     func = request.get("function")
     params = request.get("params", {})
 
-    # If excelPath is provided, read codes/time range from Excel and merge into params
+    # If excelPath is provided, read codes/time ranges from Excel and merge into params
+    windows = []
     excel_path = params.pop("excelPath", None)
     if excel_path:
         excel_data = read_excel(excel_path)
+        if func in WINDOWED_FUNCTIONS and not params.get("codes"):
+            windows = excel_windows(excel_data, params)
         # Excel values are defaults; explicit params take priority
         for key, val in excel_data.items():
-            if key not in params or not params[key]:
+            if key != "groups" and (key not in params or not params[key]):
                 params[key] = val
 
     if func == "ping":
@@ -84,7 +106,13 @@ def main():
             print(json.dumps({"ok": False, "error": f"Wind start failed: {start_result.ErrorCode}"}))
             sys.exit(1)
 
-        data = HANDLERS[func](params)
+        if len(windows) > 1:
+            data = merge_time_windows([
+                HANDLERS[func]({**params, "codes": codes, "beginTime": begin, "endTime": end})
+                for codes, begin, end in windows
+            ])
+        else:
+            data = HANDLERS[func](params)
         print(json.dumps({"ok": True, "data": data}))
 
     except Exception as e:
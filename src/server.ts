@@ -59,6 +59,90 @@ function saveConfig(cfg: Record<string, ProviderConfig>): void {
   fs.writeFileSync(KEYS_PATH, JSON.stringify(cfg, null, 2), "utf-8");
 }
 
+// ── Persistent Python query service (etl/query_service.py) ──
+// Read endpoints go to one long-lived Python process with a warm DB pool;
+// if it is not reachable they fall back to spawning the script per request.
+// QUERY_SERVICE_URL points at an externally managed service; QUERY_SERVICE=off disables it.
+const QUERY_SERVICE_PORT = Number(process.env.QUERY_SERVICE_PORT ?? 3002);
+const QUERY_SERVICE_URL = process.env.QUERY_SERVICE_URL ?? `http://127.0.0.1:${QUERY_SERVICE_PORT}`;
+let queryService: ChildProcess | null = null;
+
+function startQueryService(): void {
+  if (process.env.QUERY_SERVICE_URL || process.env.QUERY_SERVICE === "off") return;
+  const child = spawn(PYTHON, ["etl/query_service.py", "--port", String(QUERY_SERVICE_PORT)], {
+    stdio: ["ignore", "ignore", "pipe"],
+  });
+  queryService = child;
+  child.stderr!.on("data", (chunk: Buffer) => {
+    for (const line of chunk.toString().split(/\r?\n/).filter(Boolean)) console.log(`[QUERY] ${line}`);
+  });
+  child.on("error", (err) => {
+    console.log(`[QUERY] Failed to start query service: ${err.message}`);
+    queryService = null;
+  });
+  child.on("exit", (code) => {
+    if (queryService !== child) return;
+    queryService = null;
+    console.log(`[QUERY] Query service exited (code ${code}), restarting in 5s`);
+    setTimeout(startQueryService, 5000);
+  });
+}
+
+process.on("exit", () => { queryService?.kill(); });
+
+// ── Real-time quote service (src/python/quote_service.py) ──
+// Needs a logged-in Wind terminal, so it is started by hand; /api/quotes/* proxies to it.
+const QUOTE_SERVICE_URL = process.env.QUOTE_SERVICE_URL ?? `http://127.0.0.1:${process.env.QUOTE_SERVICE_PORT ?? 3003}`;
+const QUOTE_ROUTES = new Set(["health", "snapshot", "ticks", "subscribe", "unsubscribe"]);
+
+function runPythonJson(args: string[]): Promise<unknown> {
+  return new Promise((resolve, reject) => {
+    const child = spawn(PYTHON, args, { stdio: ["ignore", "pipe", "pipe"] });
+    let stdout = "";
+    let stderr = "";
+    child.stdout!.on("data", (chunk: Buffer) => { stdout += chunk.toString(); });
+    child.stderr!.on("data", (chunk: Buffer) => { stderr += chunk.toString(); });
+    child.on("close", (code) => {
+      if (code !== 0) { reject(new Error(stderr || `exit code ${code}`)); return; }
+      try { resolve(JSON.parse(stdout)); } catch { reject(new Error(`Invalid JSON from ${args[0]}`)); }
+    });
+    child.on("error", reject);
+  });
+}
+
+class QueryTimeoutError extends Error {
+  readonly status = 504;
+}
+
+// HTTP status for a failed pythonQuery: 504 when the query service timed out, else 500
+function queryErrorStatus(err: unknown): number {
+  return err instanceof QueryTimeoutError ? err.status : 500;
+}
+
+// Ask the query service; only when it is not running (connection refused) run
+// the script directly and wrap its stdout into the same response shape. A
+// timeout is not retried as a script run: the query may still be executing.
+async function pythonQuery<T extends { ok: boolean }>(
+  servicePath: string,
+  scriptArgs: string[],
+  wrap: (out: unknown) => T,
+): Promise<T> {
+  let resp: Response;
+  try {
+    resp = await fetch(`${QUERY_SERVICE_URL}${servicePath}`, { signal: AbortSignal.timeout(120_000) });
+  } catch (err) {
+    if (err instanceof Error && err.name === "TimeoutError") {
+      throw new QueryTimeoutError(`query service did not answer ${servicePath} within 120s`);
+    }
+    const code = (err as { cause?: { code?: string } }).cause?.code;
+    if (code !== "ECONNREFUSED") throw err;
+    return wrap(await runPythonJson(scriptArgs));
+  }
+  const body = await resp.json() as T & { error?: string };
+  if (!resp.ok || !body.ok) throw new Error(body.error ?? `query service HTTP ${resp.status}`);
+  return body;
+}
+
 const app = express();
 app.use(cors({ origin: "http://localhost:5173" }));
 app.use(express.json());
@@ -73,6 +157,24 @@ app.get("/api/status", async (_req, res) => {
   }
 });
 
+// GET /api/quotes/{snapshot,ticks,subscribe,unsubscribe,health} — live wsq quotes
+// e.g. /api/quotes/ticks?since=1234&codes=600000.SH for the ticks after sequence 1234
+app.get("/api/quotes/:op", async (req, res) => {
+  const op = req.params.op;
+  if (!QUOTE_ROUTES.has(op)) {
+    res.status(404).json({ ok: false, error: `Unknown quotes endpoint ${op}` });
+    return;
+  }
+  const query = new URLSearchParams(req.query as Record<string, string>);
+  try {
+    const resp = await fetch(`${QUOTE_SERVICE_URL}/${op}?${query}`, { signal: AbortSignal.timeout(10_000) });
+    res.status(resp.status).json(await resp.json());
+  } catch (err) {
+    const message = err instanceof Error ? err.message : String(err);
+    res.status(503).json({ ok: false, error: `Quote service unavailable (${message}); start python src/python/quote_service.py` });
+  }
+});
+
 app.post("/api/query", upload.single("excelFile"), async (req, res) => {
   let body: BridgeRequest;
   try {
@@ -115,57 +217,32 @@ app.post("/api/query", upload.single("excelFile"), async (req, res) => {
 // GET /api/factors/list — list all generated factors
 app.get("/api/factors/list", async (_req, res) => {
   console.log("[FACTORS] GET /api/factors/list");
-
-  const child = spawn(PYTHON, ["-c", `
-import sys
-sys.path.insert(0, 'etl')
-from base import get_conn, put_conn
-conn = get_conn()
-try:
-    import json
-    with conn.cursor() as cur:
-        cur.execute("SELECT factor_name, description, source_paper, created_at FROM factors.metadata ORDER BY created_at DESC")
-        rows = cur.fetchall()
-        result = [{"name": r[0], "description": r[1], "source": r[2], "created": str(r[3])} for r in rows]
-    print(json.dumps(result))
-finally:
-    put_conn(conn)
-  `.trim()], { stdio: ["ignore", "pipe", "pipe"] });
-
-  let stdout = "";
-  let stderr = "";
-  child.stdout!.on("data", (chunk: Buffer) => { stdout += chunk.toString(); });
-  child.stderr!.on("data", (chunk: Buffer) => { stderr += chunk.toString(); });
-
-  child.on("close", (code) => {
-    if (code !== 0) {
-      console.log(`[FACTORS] List factors failed: ${stderr || `exit code ${code}`}`);
-      res.status(500).json({ ok: false, error: stderr || `exit code ${code}` });
-      return;
-    }
-    try {
-      const data = JSON.parse(stdout);
-      console.log(`[FACTORS] Found ${data.length} factors`);
-      res.json({ ok: true, factors: data });
-    } catch {
-      console.log("[FACTORS] Error: Invalid JSON from factors list query");
-      res.status(500).json({ ok: false, error: "Invalid JSON" });
-    }
-  });
-
-  child.on("error", (err) => {
-    console.log(`[FACTORS] List factors error: ${err.message}`);
-    res.status(500).json({ ok: false, error: err.message });
-  });
+  try {
+    const body = await pythonQuery("/factors/list", ["etl/factor_query.py", "list"],
+      (out) => ({ ok: true, factors: out as unknown[] }));
+    console.log(`[FACTORS] Found ${body.factors.length} factors`);
+    res.json(body);
+  } catch (err) {
+    const message = err instanceof Error ? err.message : String(err);
+    console.log(`[FACTORS] List factors failed: ${message}`);
+    res.status(queryErrorStatus(err)).json({ ok: false, error: message });
+  }
 });
 
 // GET /api/factors/data — fetch factor values for visualization
+// Optional: maxPoints (+ downsample=lttb|minmax) for charts, or limit (+ cursor) for keyset paging;
+// level=market reads factors.values instead of factors.asset_values
 app.get("/api/factors/data", async (req, res) => {
-  const { factorName, startDate, endDate, assetCodes } = req.query as {
+  const { factorName, startDate, endDate, assetCodes, maxPoints, downsample, limit, cursor, level } = req.query as {
     factorName?: string;
     startDate?: string;
     endDate?: string;
     assetCodes?: string;
+    maxPoints?: string;
+    downsample?: string;
+    limit?: string;
+    cursor?: string;
+    level?: string;
   };
 
   console.log(`[FACTORS] GET /api/factors/data?factorName=${factorName}&startDate=${startDate}&endDate=${endDate}&assetCodes=${assetCodes}`);
@@ -176,73 +253,33 @@ app.get("/api/factors/data", async (req, res) => {
     return;
   }
 
-  let query = "SELECT * FROM factors.asset_values WHERE factor_name = %s";
-  const params: string[] = [factorName];
+  // Served from the Parquet factor store when it is in sync, else Postgres
+  const query = new URLSearchParams({ factor: factorName });
+  const args = ["etl/factor_query.py", "data", "--factor", factorName];
+  if (startDate) { query.set("start", startDate); args.push("--start", startDate); }
+  if (endDate) { query.set("end", endDate); args.push("--end", endDate); }
+  if (assetCodes) { query.set("codes", assetCodes); args.push("--codes", assetCodes); }
+  if (maxPoints) { query.set("max_points", maxPoints); args.push("--max-points", maxPoints); }
+  if (downsample) { query.set("method", downsample); args.push("--downsample", downsample); }
+  if (limit) { query.set("limit", limit); args.push("--limit", limit); }
+  if (cursor) { query.set("after", cursor); args.push("--after", cursor); }
+  if (level) { query.set("level", level); args.push("--level", level); }
 
-  if (startDate) {
-    query += " AND trade_date >= %s";
-    params.push(startDate);
-  }
-  if (endDate) {
-    query += " AND trade_date <= %s";
-    params.push(endDate);
-  }
-  if (assetCodes) {
-    const codes = assetCodes.split(",").map(c => c.trim());
-    query += " AND asset_code = ANY(%s)";
-    params.push(JSON.stringify(codes));
+  try {
+    const body = await pythonQuery(`/factors/data?${query}`, args,
+      (out) => ({ ok: true, ...(out as { data: unknown[]; source: string; next_cursor: string | null }) }));
+    console.log(`[FACTORS] Retrieved ${body.data.length} factor data rows (${body.source})`);
+    res.json({ ok: true, data: body.data, source: body.source, nextCursor: body.next_cursor });
+  } catch (err) {
+    const message = err instanceof Error ? err.message : String(err);
+    console.log(`[FACTORS] Factor data query failed: ${message}`);
+    res.status(queryErrorStatus(err)).json({ ok: false, error: message });
   }
-
-  query += " ORDER BY trade_date, asset_code";
-
-  const script = `
-import sys
-sys.path.insert(0, 'etl')
-from base import get_conn, put_conn
-import json
-conn = get_conn()
-try:
-    with conn.cursor() as cur:
-        cur.execute(${JSON.stringify(query)}, ${JSON.stringify(params)})
-        rows = cur.fetchall()
-        cols = [desc[0] for desc in cur.description]
-        result = [dict(zip(cols, [str(v) if v is not None else None for v in row])) for row in rows]
-    print(json.dumps(result))
-finally:
-    put_conn(conn)
-  `.trim();
-
-  const child = spawn(PYTHON, ["-c", script], { stdio: ["ignore", "pipe", "pipe"] });
-
-  let stdout = "";
-  let stderr = "";
-  child.stdout!.on("data", (chunk: Buffer) => { stdout += chunk.toString(); });
-  child.stderr!.on("data", (chunk: Buffer) => { stderr += chunk.toString(); });
-
-  child.on("close", (code) => {
-    if (code !== 0) {
-      console.log(`[FACTORS] Factor data query failed: ${stderr || `exit code ${code}`}`);
-      res.status(500).json({ ok: false, error: stderr || `exit code ${code}` });
-      return;
-    }
-    try {
-      const data = JSON.parse(stdout);
-      console.log(`[FACTORS] Retrieved ${data.length} factor data rows`);
-      res.json({ ok: true, data });
-    } catch {
-      console.log("[FACTORS] Error: Invalid JSON from factor data query");
-      res.status(500).json({ ok: false, error: "Invalid JSON" });
-    }
-  });
-
-  child.on("error", (err) => {
-    console.log(`[FACTORS] Factor data query error: ${err.message}`);
-    res.status(500).json({ ok: false, error: err.message });
-  });
 });
 
 const PORT = process.env.PORT ?? 3001;
 app.listen(PORT, () => console.log(`Wind API server running on :${PORT}`));
+startQueryService();
 
 
 // ── GET /api/llm/keys — report which providers have server-side keys ──
@@ -430,32 +467,13 @@ app.post("/api/llm/generate", async (req, res) => {
 });
 
 // ── Schema context endpoint ──────────────────────────────
-app.get("/api/clean/schema-context", (_req, res) => {
-  const child = spawn(PYTHON, ["etl/schema_inspector.py"], {
-    stdio: ["ignore", "pipe", "pipe"],
-  });
-
-  let stdout = "";
-  let stderr = "";
-  child.stdout!.on("data", (chunk: Buffer) => { stdout += chunk.toString(); });
-  child.stderr!.on("data", (chunk: Buffer) => { stderr += chunk.toString(); });
-
-  child.on("close", (code) => {
-    if (code !== 0) {
-      res.status(500).json({ ok: false, error: stderr || `exit code ${code}` });
-      return;
-    }
-    try {
-      const data = JSON.parse(stdout);
-      res.json({ ok: true, data });
-    } catch {
-      res.status(500).json({ ok: false, error: "Invalid JSON from schema_inspector" });
-    }
-  });
-
-  child.on("error", (err) => {
-    res.status(500).json({ ok: false, error: err.message });
-  });
+app.get("/api/clean/schema-context", async (_req, res) => {
+  try {
+    res.json(await pythonQuery("/schema-context", ["etl/schema_inspector.py"],
+      (out) => ({ ok: true, data: out })));
+  } catch (err) {
+    res.status(queryErrorStatus(err)).json({ ok: false, error: err instanceof Error ? err.message : String(err) });
+  }
 });
 
 // ── Clean runner SSE endpoint ────────────────────────────
@@ -534,6 +552,8 @@ app.post("/api/clean/run", (req, res) => {
 // ── Factor production endpoints ──────────────────────────
 
 // POST /api/factors/upload-pdf — extract text from PDF
+// Pages are extracted in parallel and cached by content hash; ?stream=1 returns NDJSON,
+// one {"page", "text"} line per page as it is ready, then a final {"ok", "pages", "cached"} line
 app.post("/api/factors/upload-pdf", upload.single("pdf"), async (req, res) => {
   console.log(`[FACTORS] POST /api/factors/upload-pdf - File: ${req.file?.originalname || 'none'}`);
 
@@ -544,20 +564,32 @@ app.post("/api/factors/upload-pdf", upload.single("pdf"), async (req, res) => {
   }
 
   const pdfPath = req.file.path;
-  console.log(`[FACTORS] Extracting PDF: ${pdfPath}`);
+  const stream = req.query.stream === "1" || req.query.stream === "true";
+  console.log(`[FACTORS] Extracting PDF: ${pdfPath}${stream ? " (streaming)" : ""}`);
 
-  const child = spawn(PYTHON, ["etl/pdf_extractor.py", "--pdf", pdfPath], {
+  const child = spawn(PYTHON, ["etl/pdf_extractor.py", "--pdf", pdfPath, ...(stream ? ["--stream"] : [])], {
     stdio: ["ignore", "pipe", "pipe"],
   });
 
   let stdout = "";
   let stderr = "";
-  child.stdout!.on("data", (chunk: Buffer) => { stdout += chunk.toString(); });
+  if (stream) {
+    res.setHeader("Content-Type", "application/x-ndjson; charset=utf-8");
+    child.stdout!.pipe(res, { end: false });
+  } else {
+    child.stdout!.on("data", (chunk: Buffer) => { stdout += chunk.toString(); });
+  }
   child.stderr!.on("data", (chunk: Buffer) => { stderr += chunk.toString(); });
 
   child.on("close", (code) => {
     try { fs.unlinkSync(pdfPath); } catch { /* ignore */ }
 
+    if (stream) {
+      // The script prints its own {"ok": false, ...} line on failure
+      if (code !== 0) console.log(`[FACTORS] PDF extraction failed: ${stderr || `exit code ${code}`}`);
+      res.end();
+      return;
+    }
     if (code !== 0) {
       console.log(`[FACTORS] PDF extraction failed: ${stderr || `exit code ${code}`}`);
       res.status(500).json({ ok: false, error: stderr || `exit code ${code}` });
@@ -565,7 +597,7 @@ app.post("/api/factors/upload-pdf", upload.single("pdf"), async (req, res) => {
     }
     try {
       const data = JSON.parse(stdout);
-      console.log(`[FACTORS] PDF extracted: ${data.text?.length || 0} chars`);
+      console.log(`[FACTORS] PDF extracted: ${data.text?.length || 0} chars, ${data.pages} pages${data.cached ? " (cached)" : ""}`);
       res.json(data);
     } catch {
       console.log("[FACTORS] Error: Invalid JSON from pdf_extractor");
@@ -576,43 +608,28 @@ app.post("/api/factors/upload-pdf", upload.single("pdf"), async (req, res) => {
   child.on("error", (err) => {
     try { fs.unlinkSync(pdfPath); } catch { /* ignore */ }
     console.log(`[FACTORS] PDF extraction error: ${err.message}`);
+    if (res.headersSent) {
+      res.end(JSON.stringify({ ok: false, error: err.message }) + "\n");
+      return;
+    }
     res.status(500).json({ ok: false, error: err.message });
   });
 });
 
 // GET /api/factors/schema-context — return processed.* schema for LLM
-app.get("/api/factors/schema-context", (_req, res) => {
+app.get("/api/factors/schema-context", async (_req, res) => {
   console.log("[FACTORS] GET /api/factors/schema-context");
-
-  const child = spawn(PYTHON, ["etl/schema_inspector.py"], {
-    stdio: ["ignore", "pipe", "pipe"],
-  });
-
-  let stdout = "";
-  let stderr = "";
-  child.stdout!.on("data", (chunk: Buffer) => { stdout += chunk.toString(); });
-  child.stderr!.on("data", (chunk: Buffer) => { stderr += chunk.toString(); });
-
-  child.on("close", (code) => {
-    if (code !== 0) {
-      console.log(`[FACTORS] Schema context failed: ${stderr || `exit code ${code}`}`);
-      res.status(500).json({ ok: false, error: stderr || `exit code ${code}` });
-      return;
-    }
-    try {
-      const data = JSON.parse(stdout);
-      console.log("[FACTORS] Schema context loaded successfully");
-      res.json({ ok: true, data: { processed: data.processed } });
-    } catch {
-      console.log("[FACTORS] Error: Invalid JSON from schema_inspector");
-      res.status(500).json({ ok: false, error: "Invalid JSON from schema_inspector" });
-    }
-  });
-
-  child.on("error", (err) => {
-    console.log(`[FACTORS] Schema context error: ${err.message}`);
-    res.status(500).json({ ok: false, error: err.message });
-  });
+  try {
+    const body = await pythonQuery("/schema-context?schemas=processed",
+      ["etl/schema_inspector.py", "--schemas", "processed"],
+      (out) => ({ ok: true, data: out as Record<string, unknown> }));
+    console.log("[FACTORS] Schema context loaded successfully");
+    res.json({ ok: true, data: { processed: body.data.processed } });
+  } catch (err) {
+    const message = err instanceof Error ? err.message : String(err);
+    console.log(`[FACTORS] Schema context failed: ${message}`);
+    res.status(queryErrorStatus(err)).json({ ok: false, error: message });
+  }
 });
 
 // POST /api/factors/run — execute factor generation script (SSE)
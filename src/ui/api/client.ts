@@ -1,4 +1,4 @@
-export type WindFunction = "wsd" | "wss" | "wsq" | "wset" | "edb" | "tdays" | "wst" | "wses" | "wsee" | "tdaysoffset" | "tdayscount";
+export type WindFunction = "wsd" | "wss" | "wsq" | "wset" | "edb" | "tdays" | "wst" | "wsi" | "wses" | "wsee" | "tdaysoffset" | "tdayscount";
 
 export interface QueryRequest {
   function: WindFunction;
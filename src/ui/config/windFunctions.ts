@@ -94,6 +94,18 @@ export const WIND_FUNCTIONS: WindFunctionConfig[] = [
       { key: "options",   label: "可选参数", type: "text", required: false, placeholder: "", hint: "一般无需额外参数" },
     ],
   },
+  {
+    id: "wsi",
+    label: "WSI — 分钟K线序列",
+    description: "获取证券的分钟级K线（开高低收、成交量、成交额）。长区间自动按 30 天切分请求后拼接，多品种逐个查询后按时间对齐。",
+    fields: [
+      { key: "codes",     label: "证券代码", type: "text", required: true,  placeholder: "600000.SH,000001.SZ", hint: "支持多品种（逐个查询）" },
+      { key: "fields",    label: "指标",     type: "text", required: true,  placeholder: "open,high,low,close,volume,amt", hint: "常用: open/high/low/close/volume/amt/chg/pct_chg/oi(持仓量)" },
+      { key: "beginTime", label: "开始时间", type: "text", required: true,  placeholder: "2025-01-02 09:30:00", hint: "精确到秒，或只填日期" },
+      { key: "endTime",   label: "结束时间", type: "text", required: true,  placeholder: "2025-03-31 15:00:00", hint: "精确到秒，或只填日期（含当天）" },
+      { key: "options",   label: "可选参数", type: "text", required: false, placeholder: "BarSize=1;Fill=Previous", hint: "BarSize: 1/3/5/10/15/30/60 分钟 | PriceAdj: F前复权/B后复权 | Fill: Previous" },
+    ],
+  },
   {
     id: "wses",
     label: "WSES — 板块日序列数据",